@@ -0,0 +1,232 @@
+import asyncio
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from singleflight import SingleFlight
+
+# Parallel lists: phrase text, the sources it came from, times it was seen
+Dataset = Tuple[List[str], List[List[str]], List[int]]
+
+TOKEN_PATTERN = r"\w+(?:'\w+)?"
+
+QUESTION_WORDS = frozenset([
+    'how', 'what', 'why', 'when', 'where', 'who', 'which', 'whose',
+    'can', 'does', 'do', 'is', 'are', 'should', 'will', 'would', 'could',
+])
+
+STOPWORDS = frozenset([
+    'a', 'an', 'the', 'to', 'for', 'of', 'in', 'on', 'at', 'by', 'from', 'with',
+    'and', 'or', 'vs', 'i', 'my', 'me', 'your', 'you', 'it', 'that', 'this', 'is', 'are',
+])
+
+# Lower edges of the phrase length buckets, in characters; the last is open-ended
+CHAR_LENGTH_BINS = [0, 10, 20, 30, 40, 50, 60, 80, 100]
+
+
+def _ranked(frame, column: str, top: int) -> List[dict]:
+    """Per-phrase occurrences of column's values: phrases containing each and their total count"""
+    grouped = frame.drop_duplicates(['row', column]).groupby(column).agg(
+        phrases=('row', 'size'), count=('weight', 'sum'),
+    )
+    grouped = grouped.sort_values(['phrases', 'count'], ascending=False, kind='stable').head(top)
+    return [
+        {column: value, 'phrases': int(phrases), 'count': int(count)}
+        for value, phrases, count in zip(grouped.index, grouped['phrases'], grouped['count'])
+    ]
+
+
+def analyze(texts: List[str], sources: List[List[str]], counts: List[int], seed: str = "", top: int = 50) -> dict:
+    """Modifier and n-gram frequencies, source overlap, question words, lengths and token clusters.
+
+    Repeated phrases (by normalized text) are combined first. Runs in a
+    worker process for large datasets, so it only takes and returns plain
+    Python values.
+    """
+    # Heavy imports, only paid for by analytics runs
+    import numpy as np
+    import pandas as pd
+
+    raw = pd.DataFrame({
+        'text': pd.Series(texts, dtype=object),
+        'sources': pd.Series(sources, dtype=object),
+        'count': pd.Series(counts, dtype=np.int64),
+    })
+    raw['phrase'] = raw['text'].str.normalize('NFKC').str.lower().str.split().str.join(' ')
+    raw = raw[raw['phrase'].str.len() > 0]
+    phrases = raw.groupby('phrase', sort=False).agg(text=('text', 'first'), count=('count', 'sum')).reset_index()
+    weights = phrases['count'].to_numpy()
+    total = len(phrases)
+
+    # Source overlap: phrases in both sources, and that as a share of phrases in either
+    memberships = raw[['phrase', 'sources']].explode('sources').dropna()
+    source_codes, source_names = pd.factorize(memberships['sources'], sort=True)
+    matrix = np.zeros((total, len(source_names)), dtype=np.int64)
+    matrix[pd.Index(phrases['phrase']).get_indexer(memberships['phrase']), source_codes] = 1
+    both = matrix.T @ matrix
+    sizes = np.diag(both)
+    either = sizes[:, None] + sizes[None, :] - both
+    jaccard = np.divide(both, either, out=np.zeros(both.shape), where=either > 0)
+
+    # One row per token occurrence, in phrase order
+    exploded = phrases['phrase'].str.findall(TOKEN_PATTERN).explode().dropna()
+    tokens = pd.DataFrame({'row': exploded.index.to_numpy(dtype=np.int64), 'token': exploded.to_numpy(dtype=object)})
+    tokens['weight'] = weights[tokens['row'].to_numpy()]
+    seed_tokens = set(pd.Series([seed.lower()]).str.findall(TOKEN_PATTERN)[0])
+
+    ngrams = {}
+    for n in (1, 2, 3):
+        grams = tokens['token']
+        same_phrase = pd.Series(True, index=tokens.index)
+        for offset in range(1, n):
+            grams = grams + ' ' + tokens['token'].shift(-offset).fillna('')
+            same_phrase &= tokens['row'].shift(-offset) == tokens['row']
+        frame = pd.DataFrame({'row': tokens['row'], 'ngram': grams, 'weight': tokens['weight']})[same_phrase]
+        ngrams[str(n)] = _ranked(frame, 'ngram', top)
+
+    content = tokens[~tokens['token'].isin(STOPWORDS | seed_tokens)]
+    modifiers = _ranked(content.rename(columns={'token': 'modifier'}), 'modifier', top)
+
+    questions = tokens[tokens['token'].isin(QUESTION_WORDS)].drop_duplicates('row')
+    question_counts = questions['token'].value_counts()
+
+    words = tokens.groupby('row').size().reindex(range(total), fill_value=0)
+    chars = phrases['phrase'].str.len()
+    histogram, _ = np.histogram(chars.clip(upper=CHAR_LENGTH_BINS[-1]), bins=CHAR_LENGTH_BINS + [CHAR_LENGTH_BINS[-1] + 1])
+
+    # Each phrase joins the cluster of its most widespread content token
+    topical = content[~content['token'].isin(QUESTION_WORDS)].drop_duplicates(['row', 'token'])
+    spread = topical.groupby('token')['row'].transform('size')
+    labels = (topical.assign(spread=spread)
+              .sort_values(['row', 'spread'], ascending=[True, False], kind='stable')
+              .drop_duplicates('row').set_index('row')['token'])
+    clustered = phrases.assign(cluster=labels.reindex(range(total)).to_numpy())
+    sizes_by_label = clustered.groupby('cluster').agg(phrases=('phrase', 'size'), count=('count', 'sum'))
+    sizes_by_label = sizes_by_label[sizes_by_label['phrases'] > 1]
+    sizes_by_label = sizes_by_label.sort_values(['phrases', 'count'], ascending=False, kind='stable').head(top)
+    examples = (clustered[clustered['cluster'].isin(sizes_by_label.index)]
+                .sort_values('count', ascending=False, kind='stable')
+                .groupby('cluster')['text'].apply(lambda texts: list(texts[:5])))
+
+    return {
+        'phrases': total,
+        'total_count': int(weights.sum()),
+        'modifiers': modifiers,
+        'ngrams': ngrams,
+        'source_overlap': {
+            'sources': [str(name) for name in source_names],
+            'phrases': both.tolist(),
+            'jaccard': np.round(jaccard, 4).tolist(),
+        },
+        'question_words': {
+            'phrases': len(questions),
+            'share': round(len(questions) / total, 4) if total else 0.0,
+            'counts': {str(word): int(count) for word, count in question_counts.items()},
+        },
+        'lengths': {
+            'words': {
+                'mean': round(float(words.mean()), 2) if total else 0.0,
+                'median': float(words.median()) if total else 0.0,
+                'histogram': {str(length): int(count) for length, count in words.value_counts().sort_index().items()},
+            },
+            'chars': {
+                'mean': round(float(chars.mean()), 2) if total else 0.0,
+                'median': float(chars.median()) if total else 0.0,
+                'p90': float(chars.quantile(0.9)) if total else 0.0,
+                'histogram': [
+                    {'min': low, 'max': high - 1 if high else None, 'phrases': int(count)}
+                    for low, high, count in zip(CHAR_LENGTH_BINS, CHAR_LENGTH_BINS[1:] + [None], histogram)
+                ],
+            },
+        },
+        'clusters': {
+            'clustered': int(sizes_by_label['phrases'].sum()),
+            'unclustered': total - int(clustered['cluster'].isin(sizes_by_label.index).sum()),
+            'top': [
+                {'token': label, 'phrases': int(row['phrases']), 'count': int(row['count']),
+                 'examples': examples[label]}
+                for label, row in sizes_by_label.iterrows()
+            ],
+        },
+    }
+
+
+class AnalyticsRunner:
+    """Runs analyze() off the event loop and caches results per dataset version.
+
+    Datasets of at least pool_threshold rows go to a process pool, since
+    the pandas work holds the GIL; smaller ones run in a thread, which is
+    cheaper than shipping them to another process. A cached result is
+    reused until the caller reports a different version for the dataset,
+    and concurrent requests for the same version share one run.
+    """
+
+    def __init__(self, workers: int = 2, pool_threshold: int = 5000, max_entries: int = 64):
+        self.workers = workers
+        self.pool_threshold = pool_threshold
+        self.max_entries = max_entries
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._runs = SingleFlight()
+        # cache key -> (version, result)
+        self._results: "OrderedDict[str, Tuple[str, dict]]" = OrderedDict()
+        self.counters: Dict[str, int] = {
+            'cache_hits': 0,
+            'thread_runs': 0,
+            'pool_runs': 0,
+        }
+
+    def _executor(self) -> ProcessPoolExecutor:
+        # Started on first use; spawned workers don't inherit the event loop or Mongo client threads
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    async def run(self, key: str, version: str, load: Callable[[], Awaitable[Dataset]],
+                  seed: str = "", top: int = 50) -> Tuple[dict, bool]:
+        """(result, whether it came from the cache) for the dataset named key at version"""
+        cache_key = f"{key}|{top}"
+        cached = self._results.get(cache_key)
+        if cached is not None and cached[0] == version:
+            self.counters['cache_hits'] += 1
+            self._results.move_to_end(cache_key)
+            return cached[1], True
+
+        async def compute() -> dict:
+            texts, sources, counts = await load()
+            if len(texts) >= self.pool_threshold:
+                self.counters['pool_runs'] += 1
+                executor = self._executor()
+                try:
+                    result = await asyncio.get_running_loop().run_in_executor(
+                        executor, analyze, texts, sources, counts, seed, top,
+                    )
+                except BrokenProcessPool:
+                    # A worker died (e.g. killed for memory); start a fresh pool next time
+                    if self._pool is executor:
+                        self._pool = None
+                    executor.shutdown(wait=False)
+                    raise
+            else:
+                self.counters['thread_runs'] += 1
+                result = await asyncio.to_thread(analyze, texts, sources, counts, seed, top)
+            self._results[cache_key] = (version, result)
+            self._results.move_to_end(cache_key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+            return result
+
+        return await self._runs.do(f"{cache_key}|{version}", compute), False
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            'entries': len(self._results),
+            'pool_started': self._pool is not None,
+        }
@@ -0,0 +1,369 @@
+import time
+import uuid
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo import ReplaceOne, UpdateOne
+
+from metrics import MONGO_OPERATION_SECONDS
+from prefix_index import normalize_phrase
+from throttling import UpstreamUnavailable
+
+# (source, query) -> suggestions, raising on failure
+Fetcher = Callable[[str, str], Awaitable[List[str]]]
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+class CrawlJobManager:
+    """Runs breadth-first keyword crawls in the background.
+
+    Each seed is expanded into itself plus seed + separator + character for
+    every alphabet character, fetched from every job source. Suggestions
+    returned for a seed at depth d become seeds at depth d + 1, up to
+    max_depth, skipping anything already visited. Every visited phrase has
+    its own document in the phrases collection, marked done once all its
+    queries succeeded and their results are stored, so unfinished jobs
+    resume on restart from the phrases not yet done (seeds that were in
+    progress are simply fetched again) and the job document itself only
+    holds settings and counters.
+
+    While an upstream is throttled or its circuit is open, fetches wait for
+    it to recover however long that takes; only other errors count towards
+    max_retries. A seed with queries that still failed is queued again at
+    the back of the frontier, for as long as max_queries allows.
+
+    With several worker processes each job is run by one owner, which holds
+    a lease renewed at every checkpoint. Workers adopt active jobs whose
+    lease has lapsed or was released (on shutdown), and an owner stops a
+    job as soon as an update of its counters or lease finds it no longer
+    owns it, e.g. because it was cancelled through another worker.
+    """
+
+    def __init__(self, jobs, results, phrases, fetch: Fetcher, owner: str, checkpoint_interval: float = 5,
+                 lease: float = 60, max_retries: int = 3, retry_delay: float = 2, max_backoff: float = 60):
+        self.jobs = jobs
+        self.results = results
+        self.phrases = phrases
+        self.fetch = fetch
+        self.owner = owner
+        self.checkpoint_interval = checkpoint_interval
+        self.lease = lease
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_backoff = max_backoff
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self._watcher: Optional[asyncio.Task] = None
+
+    async def ensure_indexes(self):
+        try:
+            await self.results.create_index([('job_id', 1), ('depth', 1)])
+            await self.phrases.create_index([('job_id', 1), ('phrase', 1)], unique=True)
+            await self.jobs.create_index('status')
+        except Exception as e:
+            logging.error(f"Could not create crawl job indexes: {str(e)}")
+
+    def start(self):
+        """Adopt unowned jobs in the background, now and every half lease"""
+        if self._watcher is None:
+            self._watcher = asyncio.ensure_future(self._watch())
+
+    async def _watch(self):
+        await self.ensure_indexes()
+        while True:
+            await self.resume_all()
+            await asyncio.sleep(self.lease / 2)
+
+    def _lease_until(self) -> datetime:
+        return datetime.utcnow() + timedelta(seconds=self.lease)
+
+    async def submit(self, seed: str, sources: List[str], alphabet: str, separator: str,
+                     max_depth: int, max_queries: int, concurrency: int) -> dict:
+        now = datetime.utcnow()
+        job = {
+            '_id': str(uuid.uuid4()),
+            'seed': seed,
+            'sources': sources,
+            'alphabet': alphabet,
+            'separator': separator,
+            'max_depth': max_depth,
+            'max_queries': max_queries,
+            'concurrency': concurrency,
+            'status': 'queued',
+            'error': None,
+            'owner': self.owner,
+            'lease_until': self._lease_until(),
+            'created_at': now,
+            'updated_at': now,
+            'queries_done': 0,
+            'queries_failed': 0,
+            'seeds_done': 0,
+            'frontier_size': 1,
+            'visited_count': 1,
+        }
+        await self.jobs.insert_one(job)
+        await self.phrases.insert_one(self._phrase_doc(job['_id'], seed, 0, seq=0))
+        self._start(job)
+        return job
+
+    @staticmethod
+    def _phrase_doc(job_id: str, text: str, depth: int, seq: int, done: bool = False) -> dict:
+        phrase = normalize_phrase(text)
+        return {'_id': f"{job_id}|{phrase}", 'job_id': job_id, 'phrase': phrase, 'seed': text,
+                'depth': depth, 'seq': seq, 'done': done}
+
+    async def resume_all(self):
+        """Start active jobs no worker holds a live lease on"""
+        try:
+            jobs = await self.jobs.find({
+                'status': {'$in': list(ACTIVE_STATUSES)},
+                '$or': [{'lease_until': None}, {'lease_until': {'$lt': datetime.utcnow()}}],
+            }).to_list(None)
+            for job in jobs:
+                if job['_id'] in self.tasks:
+                    continue
+                # Compare-and-set on the lapsed lease, so only one worker adopts each job
+                lease_until = self._lease_until()
+                claimed = await self.jobs.update_one(
+                    {'_id': job['_id'], 'owner': job.get('owner'), 'lease_until': job.get('lease_until')},
+                    {'$set': {'owner': self.owner, 'lease_until': lease_until}},
+                )
+                if claimed.modified_count:
+                    job.update(owner=self.owner, lease_until=lease_until)
+                    logging.info(f"Resuming crawl job {job['_id']}")
+                    self._start(job)
+        except Exception as e:
+            logging.error(f"Could not resume crawl jobs: {str(e)}")
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await self.jobs.find_one({'_id': job_id})
+
+    async def cancel(self, job_id: str) -> Optional[dict]:
+        task = self.tasks.get(job_id)
+        if task is not None:
+            task.cancel()
+            await asyncio.wait([task])
+        # A job running in another worker stops at its next checkpoint
+        await self.jobs.update_one(
+            {'_id': job_id, 'status': {'$in': list(ACTIVE_STATUSES)}},
+            {'$set': {'status': 'cancelled', 'updated_at': datetime.utcnow(), 'owner': None, 'lease_until': None}},
+        )
+        return await self.get(job_id)
+
+    async def shutdown(self):
+        """Stop running jobs after a final checkpoint, releasing them to other workers or the next startup"""
+        if self._watcher is not None:
+            self._watcher.cancel()
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks)
+
+    def _start(self, job: dict):
+        task = asyncio.ensure_future(self._run(job))
+        self.tasks[job['_id']] = task
+        task.add_done_callback(lambda _: self.tasks.pop(job['_id'], None))
+
+    def _expand(self, job: dict, seed: str) -> List[str]:
+        return [seed] + [seed + job['separator'] + char for char in job['alphabet']]
+
+    async def _fetch_with_retries(self, source: str, query: str) -> Optional[List[str]]:
+        errors = 0
+        waits = 0
+        while True:
+            try:
+                return await self.fetch(source, query)
+            except UpstreamUnavailable:
+                # Throttled or circuit open: not the query's fault, so wait for the upstream without a cap
+                delay = min(self.retry_delay * 2 ** waits, self.max_backoff)
+                waits += 1
+            except Exception as e:
+                logging.warning(f"Crawl fetch failed for {source} '{query}': {str(e)}")
+                errors += 1
+                if errors > self.max_retries:
+                    return None
+                delay = self.retry_delay * errors
+            await asyncio.sleep(delay)
+
+    async def _crawl_seed(self, job: dict, seed: str, depth: int,
+                          semaphore: asyncio.Semaphore) -> Tuple[List[dict], int]:
+        async def fetch_one(source: str, query: str):
+            async with semaphore:
+                return source, query, await self._fetch_with_retries(source, query)
+
+        fetched = await asyncio.gather(*(
+            fetch_one(source, query)
+            for query in self._expand(job, seed)
+            for source in job['sources']
+        ))
+        now = datetime.utcnow()
+        results = [
+            {
+                '_id': f"{job['_id']}|{source}|{query}",
+                'job_id': job['_id'],
+                'seed': seed,
+                'query': query,
+                'source': source,
+                'depth': depth,
+                'suggestions': suggestions,
+                'fetched_at': now,
+            }
+            for source, query, suggestions in fetched
+            if suggestions is not None
+        ]
+        return results, len(fetched) - len(results)
+
+    async def _update_owned(self, job: dict, fields: dict, inc: Optional[dict] = None,
+                            release: bool = False, retries: int = 0) -> bool:
+        """Update the job if this worker still owns it; False if it doesn't or the write keeps failing"""
+        fields = {**fields, 'updated_at': datetime.utcnow()}
+        if release:
+            fields.update(owner=None, lease_until=None)
+        update = {'$set': fields}
+        if inc:
+            update['$inc'] = inc
+        for attempt in range(retries + 1):
+            try:
+                with MONGO_OPERATION_SECONDS.time('crawl_checkpoint'):
+                    result = await self.jobs.update_one({'_id': job['_id'], 'owner': self.owner}, update)
+            except Exception as e:
+                logging.error(f"Failed to update crawl job {job['_id']}: {str(e)}")
+                if attempt < retries:
+                    await asyncio.sleep(self.retry_delay * (attempt + 1))
+                continue
+            job.update(fields)
+            for field, amount in (inc or {}).items():
+                job[field] = job.get(field, 0) + amount
+            return result.matched_count > 0
+        return False
+
+    async def _renew_lease(self, job: dict) -> bool:
+        """False once this worker no longer owns the job (cancelled or taken over)"""
+        try:
+            with MONGO_OPERATION_SECONDS.time('crawl_checkpoint'):
+                result = await self.jobs.update_one(
+                    {'_id': job['_id'], 'owner': self.owner},
+                    {'$set': {'lease_until': self._lease_until(), 'updated_at': datetime.utcnow()}},
+                )
+        except Exception as e:
+            # Keep going; if the lease lapses meanwhile, the next owned update notices the takeover
+            logging.error(f"Failed to renew crawl job lease {job['_id']}: {str(e)}")
+            return True
+        return result.matched_count > 0
+
+    async def _load_progress(self, job: dict) -> Tuple[deque, set]:
+        """(frontier, visited) from the phrases collection, frontier in breadth-first order"""
+        visited = set()
+        queued = []
+        async for doc in self.phrases.find({'job_id': job['_id']}, {'phrase': 1, 'seed': 1, 'depth': 1, 'seq': 1,
+                                                                     'done': 1}):
+            visited.add(doc['phrase'])
+            if not doc['done']:
+                queued.append((doc['depth'], doc['seq'], doc['seed']))
+        queued.sort()
+        return deque((seed, depth) for depth, _, seed in queued), visited
+
+    async def _record_seed(self, job: dict, seed: str, results: List[dict], failed: int,
+                           discovered: List[Tuple[str, int]], frontier_size: int) -> bool:
+        """Store a finished seed's results and newly discovered phrases; False if the job is no longer ours.
+
+        A seed with failed queries stays not done, so it is fetched again.
+        """
+        if results:
+            with MONGO_OPERATION_SECONDS.time('crawl_results_store'):
+                await self.results.bulk_write(
+                    [ReplaceOne({'_id': result['_id']}, result, upsert=True) for result in results],
+                    ordered=False,
+                )
+        seq = job.get('visited_count', 0)
+        docs = [self._phrase_doc(job['_id'], text, depth, seq=seq + n) for n, (text, depth) in enumerate(discovered)]
+        # Upserts, so phrases written before a crash and found again don't clash
+        operations = [UpdateOne({'_id': doc['_id']}, {'$setOnInsert': doc}, upsert=True) for doc in docs]
+        if not failed:
+            operations.append(UpdateOne({'_id': f"{job['_id']}|{normalize_phrase(seed)}"}, {'$set': {'done': True}}))
+        if operations:
+            with MONGO_OPERATION_SECONDS.time('crawl_phrases_store'):
+                await self.phrases.bulk_write(operations, ordered=False)
+        return await self._update_owned(
+            job, {'frontier_size': frontier_size},
+            inc={'queries_done': len(results), 'queries_failed': failed, 'seeds_done': 0 if failed else 1,
+                 'visited_count': len(discovered)},
+        )
+
+    async def _run(self, job: dict):
+        in_progress: Dict[asyncio.Task, Tuple[str, int]] = {}
+        semaphore = asyncio.Semaphore(job['concurrency'])
+        cost_per_seed = (1 + len(job['alphabet'])) * len(job['sources'])
+        last_checkpoint = time.monotonic()
+        # Re-fetched seeds don't count twice against the budget
+        queries_planned = job['queries_done'] + job['queries_failed']
+
+        try:
+            frontier, visited = await self._load_progress(job)
+            if not await self._update_owned(job, {'status': 'running', 'lease_until': self._lease_until()}):
+                return
+            while True:
+                # Enough seeds in flight to keep every fetch slot busy
+                while (frontier and len(in_progress) < job['concurrency']
+                       and queries_planned + cost_per_seed <= job['max_queries']):
+                    seed, depth = frontier.popleft()
+                    task = asyncio.ensure_future(self._crawl_seed(job, seed, depth, semaphore))
+                    in_progress[task] = (seed, depth)
+                    queries_planned += cost_per_seed
+                if not in_progress:
+                    break
+
+                done, _ = await asyncio.wait(in_progress, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    seed, depth = in_progress[task]
+                    results, failed = task.result()
+                    discovered = []
+                    if depth < job['max_depth']:
+                        for result in results:
+                            for suggestion in result['suggestions']:
+                                phrase = normalize_phrase(suggestion)
+                                if phrase and phrase not in visited:
+                                    visited.add(phrase)
+                                    discovered.append((suggestion, depth + 1))
+                    frontier.extend(discovered)
+                    if failed:
+                        frontier.append((seed, depth))
+                    # Only forget the seed once its results are stored
+                    del in_progress[task]
+                    owned = await self._record_seed(job, seed, results, failed, discovered,
+                                                    len(frontier) + len(in_progress))
+                    if not owned:
+                        logging.info(f"Crawl job {job['_id']} was cancelled or taken over, stopping")
+                        for pending in in_progress:
+                            pending.cancel()
+                        return
+
+                if time.monotonic() - last_checkpoint >= self.checkpoint_interval:
+                    if not await self._renew_lease(job):
+                        logging.info(f"Crawl job {job['_id']} was cancelled or taken over, stopping")
+                        for pending in in_progress:
+                            pending.cancel()
+                        return
+                    last_checkpoint = time.monotonic()
+        except asyncio.CancelledError:
+            for task in in_progress:
+                task.cancel()
+            await self._update_owned(job, {}, release=True)
+            raise
+        except Exception as e:
+            logging.error(f"Crawl job {job['_id']} failed: {str(e)}")
+            for task in in_progress:
+                task.cancel()
+            await self._update_owned(job, {'status': 'failed', 'error': str(e)}, release=True,
+                                     retries=self.max_retries)
+            return
+
+        # Seeds left in the frontier were cut off by max_queries
+        if not await self._update_owned(job, {'status': 'completed', 'frontier_size': len(frontier)}, release=True,
+                                        retries=self.max_retries):
+            # Not released: once the lease lapses the job is resumed, finds nothing left and completes then
+            logging.error(f"Could not mark crawl job {job['_id']} completed; it will be retried")
@@ -0,0 +1,150 @@
+import io
+import csv
+import json
+import zlib
+import asyncio
+from datetime import datetime
+from typing import AsyncIterator, List
+
+# Rows per CSV/NDJSON chunk and per Parquet row group
+EXPORT_CHUNK_ROWS = 5000
+
+EXPORT_COLUMNS = ['text', 'count', 'sources', 'seeds', 'first_seen', 'last_seen']
+
+EXPORT_MEDIA_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+async def _chunks(documents: AsyncIterator[dict], size: int = EXPORT_CHUNK_ROWS) -> AsyncIterator[List[dict]]:
+    chunk = []
+    async for document in documents:
+        chunk.append(document)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _isoformat(value) -> str:
+    return value.isoformat() if isinstance(value, datetime) else ''
+
+
+async def csv_export(documents: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    """CSV with a header row; list columns are joined with "|" """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    async for chunk in _chunks(documents):
+        for document in chunk:
+            writer.writerow([
+                document.get('text', ''),
+                document.get('count', 0),
+                '|'.join(document.get('sources', ())),
+                '|'.join(document.get('seeds', ())),
+                _isoformat(document.get('first_seen')),
+                _isoformat(document.get('last_seen')),
+            ])
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+async def ndjson_export(documents: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    async for chunk in _chunks(documents):
+        yield ''.join(
+            json.dumps({
+                'text': document.get('text', ''),
+                'count': document.get('count', 0),
+                'sources': document.get('sources', []),
+                'seeds': document.get('seeds', []),
+                'first_seen': _isoformat(document.get('first_seen')),
+                'last_seen': _isoformat(document.get('last_seen')),
+            }) + '\n'
+            for document in chunk
+        ).encode('utf-8')
+
+
+class _ChunkSink:
+    """Write-only file handing written bytes back in pieces.
+
+    The Parquet writer records absolute offsets in the footer, so tell()
+    keeps counting even though taken bytes are no longer held.
+    """
+
+    def __init__(self):
+        self.parts: List[bytes] = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.parts.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+async def parquet_export(documents: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    """Parquet, one row group per chunk, streamed as each group is written"""
+    # Heavy imports, only paid for by Parquet exports
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ('text', pa.string()),
+        ('count', pa.int64()),
+        ('sources', pa.list_(pa.string())),
+        ('seeds', pa.list_(pa.string())),
+        ('first_seen', pa.timestamp('ms')),
+        ('last_seen', pa.timestamp('ms')),
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='snappy')
+
+    def write_group(chunk: List[dict]):
+        frame = pd.DataFrame.from_records(
+            [[document.get(column) for column in EXPORT_COLUMNS] for document in chunk],
+            columns=EXPORT_COLUMNS,
+        )
+        writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+
+    try:
+        async for chunk in _chunks(documents):
+            await asyncio.to_thread(write_group, chunk)
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+EXPORTERS = {
+    'csv': csv_export,
+    'ndjson': ndjson_export,
+    'parquet': parquet_export,
+}
+
+
+async def gzip_stream(chunks: AsyncIterator[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,120 @@
+import time
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+T = TypeVar('T')
+
+
+class Hedger:
+    """Sends a backup request when the first one is slower than usual.
+
+    The hedge delay is the given percentile of recent first-attempt
+    latencies, clamped to [min_delay, max_delay]; until min_samples are
+    known it is max_delay. Whichever attempt succeeds first wins and the
+    other is cancelled. Every call earns budget_ratio of a hedge (up to
+    max_budget saved up), so hedges add at most that fraction of extra
+    requests however slow the upstream gets.
+    """
+
+    def __init__(self, percentile: float = 95, min_delay: float = 0.05, max_delay: float = 2,
+                 budget_ratio: float = 0.1, max_budget: float = 10, window: int = 500, min_samples: int = 20):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.budget_ratio = budget_ratio
+        self.max_budget = max_budget
+        self.min_samples = min_samples
+        self.latencies = deque(maxlen=window)
+        self.budget = 0.0
+        self._delay: Optional[float] = None
+        self.counters: Dict[str, int] = {
+            'calls': 0,
+            'hedged': 0,
+            'hedge_won': 0,
+            'skipped_budget': 0,
+            'skipped_rate': 0,
+        }
+
+    def delay(self) -> float:
+        if self._delay is None:
+            if len(self.latencies) < self.min_samples:
+                self._delay = self.max_delay
+            else:
+                ordered = sorted(self.latencies)
+                index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+                self._delay = max(self.min_delay, min(self.max_delay, ordered[index]))
+        return self._delay
+
+    def record(self, seconds: float):
+        self.latencies.append(seconds)
+        # Recomputed lazily, at most every few samples
+        if len(self.latencies) % 10 == 0:
+            self._delay = None
+
+    async def run(self, primary: Callable[[], Awaitable[T]], backup: Callable[[], Awaitable[T]],
+                  may_send: Callable[[], bool] = lambda: True) -> T:
+        """Result of primary(), or of backup() if started after delay() and it finishes first.
+
+        may_send is asked right before a backup goes out (e.g. for a rate
+        limiter token) and can veto it.
+        """
+        self.counters['calls'] += 1
+        self.budget = min(self.max_budget, self.budget + self.budget_ratio)
+        started = time.perf_counter()
+        first = asyncio.ensure_future(primary())
+        abandoned = False
+        try:
+            done, _ = await asyncio.wait({first}, timeout=self.delay())
+            if done or not self._may_hedge(may_send):
+                return await first
+
+            self.budget -= 1
+            self.counters['hedged'] += 1
+            second = asyncio.ensure_future(backup())
+            pending = {first, second}
+            error = None
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    winner = None
+                    for task in done:
+                        if task.exception() is None:
+                            winner = winner or task
+                        elif error is None or task is first:
+                            error = task.exception()
+                    if winner is not None:
+                        if winner is second:
+                            self.counters['hedge_won'] += 1
+                        return winner.result()
+                raise error
+            finally:
+                for task in pending:
+                    task.cancel()
+        except asyncio.CancelledError:
+            abandoned = True
+            raise
+        finally:
+            if not first.done():
+                first.cancel()
+            # A first attempt cancelled by the backup winning took at least
+            # this long, so the window doesn't drift down to the winners'
+            # latencies; one whose caller gave up says nothing about it
+            if not abandoned:
+                self.record(time.perf_counter() - started)
+
+    def _may_hedge(self, may_send: Callable[[], bool]) -> bool:
+        if self.budget < 1:
+            self.counters['skipped_budget'] += 1
+            return False
+        if not may_send():
+            self.counters['skipped_rate'] += 1
+            return False
+        return True
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            'delay_ms': round(self.delay() * 1000, 1),
+            'budget': round(self.budget, 2),
+        }
@@ -0,0 +1,190 @@
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Seconds; spans cache hits (sub-ms) to upstream timeouts
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names: Sequence[str], values: Labels, *extra: str) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(pair for pair in extra if pair)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Labels, float] = defaultdict(float)
+
+    def inc(self, *labels: str, amount: float = 1):
+        self.values[labels] += amount
+
+    def render(self, constant: str = '') -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self.values.items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels, constant)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is a dict lookup, a bisect and two additions"""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last is +Inf), sum]
+        self.series: Dict[Labels, list] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    @contextmanager
+    def time(self, *labels: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def render(self, constant: str = '') -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, constant, f'le="{bound}"')
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            cumulative += counts[-1]
+            inf = _format_labels(self.labelnames, labels, constant, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{inf} {cumulative}')
+            series = _format_labels(self.labelnames, labels, constant)
+            lines.append(f'{self.name}_sum{series} {_format_value(total)}')
+            lines.append(f'{self.name}_count{series} {cumulative}')
+        return lines
+
+
+class Callback:
+    """Metric read from existing state at scrape time, so it costs nothing on the hot path"""
+
+    def __init__(self, name: str, help: str, kind: str, labelnames: Sequence[str],
+                 collect: Callable[[], Dict[Labels, float]]):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def render(self, constant: str = '') -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for labels, value in sorted(self.collect().items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels, constant)} {_format_value(value)}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        # Added to every series, e.g. which worker process answered the scrape
+        self.constant_labels: Dict[str, str] = {}
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def callback(self, name: str, help: str, kind: str, labelnames: Sequence[str],
+                 collect: Callable[[], Dict[Labels, float]]) -> Callback:
+        metric = Callback(name, help, kind, labelnames, collect)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        constant = ','.join(f'{name}="{_escape(value)}"' for name, value in self.constant_labels.items())
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render(constant))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'http_request_duration_seconds', 'API request latency, including streamed bodies',
+    ['method', 'route', 'status'],
+)
+UPSTREAM_REQUEST_SECONDS = REGISTRY.histogram(
+    'upstream_request_duration_seconds', 'Upstream suggest call latency',
+    ['source', 'outcome'],
+)
+UPSTREAM_EMPTY_RESULTS = REGISTRY.counter(
+    'upstream_empty_results_total', 'Successful upstream calls that returned no suggestions',
+    ['source'],
+)
+SOURCE_RESULTS = REGISTRY.counter(
+    'source_results_total', 'Per-source outcomes of aggregate (all/bulk) lookups',
+    ['source', 'status'],
+)
+MONGO_OPERATION_SECONDS = REGISTRY.histogram(
+    'mongo_operation_duration_seconds', 'MongoDB operation latency',
+    ['operation'],
+)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware timing every HTTP request by route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched route in the scope; use its template
+            # rather than the raw path so label cardinality stays bounded
+            route = scope.get('route')
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                scope['method'],
+                getattr(route, 'path', 'unmatched'),
+                str(status),
+            )
@@ -0,0 +1,88 @@
+import re
+import json
+from typing import List, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional, stdlib json works too
+    orjson = None
+
+Body = Union[str, bytes]
+
+TAG_RE = re.compile(r'<[^>]+>')
+
+JSONP_PREFIX = b'window.google.ac.h('
+XSSI_PREFIX = b")]}'"
+# Charsets whose bytes parse as they are
+UTF8_CHARSETS = {'utf-8', 'utf8', 'ascii', 'us-ascii'}
+
+
+def loads(body):
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(bytes(body) if isinstance(body, memoryview) else body)
+
+def _utf8(body: Body, charset: Optional[str]) -> bytes:
+    """body as UTF-8 bytes; only a body declared in another charset is decoded"""
+    if isinstance(body, str):
+        return body.encode('utf-8')
+    if charset is None or charset.lower() in UTF8_CHARSETS:
+        return body
+    return body.decode(charset).encode('utf-8')
+
+def _strip_tags(text: str) -> str:
+    # Most suggestions carry no markup; skip the regex for those
+    return TAG_RE.sub('', text) if '<' in text else text
+
+def _first_strings(items) -> List[str]:
+    """Suggestion items are either plain strings or lists led by the string"""
+    suggestions = []
+    for item in items:
+        if isinstance(item, str):
+            suggestions.append(_strip_tags(item))
+        elif isinstance(item, list) and item and isinstance(item[0], str):
+            suggestions.append(_strip_tags(item[0]))
+    return suggestions
+
+
+def parse_google_response(body: Body, charset: Optional[str] = None) -> List[str]:
+    """Suggestions from any Google/YouTube suggest format.
+
+    The format is picked from the first byte: the Firefox client's plain
+    array ``["q", ["s1", ...], ...]``, the ``)]}'``-prefixed XSSI array,
+    or JSONP ``window.google.ac.h([[["s1<b>..</b>", 0], ...], ...])``.
+    Raw UTF-8 response bytes are parsed without decoding or copying them
+    first; a body in another charset (Google answers some locales in
+    ISO-8859-1) is decoded from charset. Raises ValueError when the body
+    isn't a suggest response.
+    """
+    try:
+        body = _utf8(body, charset).lstrip()
+        first = body[:1]
+        if first == b'[':
+            data = loads(body)
+            # Firefox client: [query, [suggestions], ...]
+            if len(data) > 1 and isinstance(data[1], list):
+                return _first_strings(data[1])
+            return _first_strings(data)
+        if first == b')' and body.startswith(XSSI_PREFIX):
+            data = loads(memoryview(body)[len(XSSI_PREFIX):])
+            return _first_strings(data[1]) if len(data) > 1 and isinstance(data[1], list) else []
+        if first == b'w' and body.startswith(JSONP_PREFIX):
+            data = loads(memoryview(body)[len(JSONP_PREFIX):body.rindex(b')')])
+            return _first_strings(data[0]) if data and isinstance(data[0], list) else []
+    except (ValueError, TypeError, IndexError, LookupError) as e:
+        raise ValueError(f"Malformed Google response: {str(e)}") from e
+    raise ValueError(f"Unrecognized Google response: {body[:40]!r}")
+
+def parse_amazon_response(body: Body) -> List[str]:
+    """Suggestion values from Amazon's completion JSON, raising ValueError if malformed"""
+    try:
+        data = loads(body)
+        return [
+            value
+            for value in (suggestion.get('value') for suggestion in data.get('suggestions') or ())
+            if value is not None
+        ]
+    except (ValueError, TypeError, AttributeError) as e:
+        raise ValueError(f"Malformed Amazon response: {str(e)}") from e
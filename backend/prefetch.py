@@ -0,0 +1,225 @@
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+from metrics import MONGO_OPERATION_SECONDS
+from suggestion_cache import normalize_query
+
+Pair = Tuple[str, str]
+
+
+class PopularityTracker:
+    """Exponentially decayed request counts per (source, query).
+
+    A request made half_life seconds ago counts half as much as one made
+    now. Rather than decaying every count as time passes, new requests are
+    weighted up by 2 ** (age of the tracker / half_life), which ranks the
+    same way; the weights are rebased before they could overflow. Past
+    max_keys the least popular pairs are dropped.
+    """
+
+    def __init__(self, half_life: float = 3600, max_keys: int = 50000):
+        self.half_life = half_life
+        self.max_keys = max_keys
+        self._origin = time.monotonic()
+        self._scores: Dict[Pair, float] = {}
+
+    def _weight(self, now: float) -> float:
+        exponent = (now - self._origin) / self.half_life
+        if exponent > 512:
+            scale = 2.0 ** -exponent
+            self._scores = {pair: score * scale for pair, score in self._scores.items() if score * scale > 1e-12}
+            self._origin = now
+            exponent = 0.0
+        return 2.0 ** exponent
+
+    def record(self, source: str, q: str, count: float = 1, age: float = 0):
+        """Count count requests for q, made age seconds ago"""
+        query = normalize_query(q)
+        if not query.strip():
+            return
+        now = time.monotonic()
+        pair = (source, query)
+        self._scores[pair] = self._scores.get(pair, 0.0) + count * self._weight(now) * 2.0 ** (-age / self.half_life)
+        if len(self._scores) > self.max_keys:
+            self._prune()
+
+    def _prune(self):
+        keep = sorted(self._scores.items(), key=lambda item: item[1], reverse=True)[:int(self.max_keys * 0.8)]
+        self._scores = dict(keep)
+
+    def score(self, source: str, q: str) -> float:
+        """Decayed request count, in requests as of now"""
+        score = self._scores.get((source, normalize_query(q)), 0.0)
+        return score / self._weight(time.monotonic())
+
+    def top(self, limit: int) -> List[Tuple[Pair, float]]:
+        weight = self._weight(time.monotonic())
+        ranked = sorted(self._scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [(pair, score / weight) for pair, score in ranked]
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+
+class RefreshClaims:
+    """Lets one worker at a time refresh each cache key.
+
+    Every worker prefetches its own popular queries, so without claims a
+    query that is hot everywhere would be refreshed once per worker. A
+    claim is a document per key held for hold seconds, long enough for the
+    claimant's refresh to land and make the entry fresh for everyone else;
+    a claim past its hold (e.g. the refresh failed) can be taken over.
+    """
+
+    def __init__(self, collection, hold: float):
+        self.collection = collection
+        self.hold = hold
+
+    async def ensure_indexes(self):
+        try:
+            # Lapsed claims are only kept until the TTL monitor gets to them
+            await self.collection.create_index('until', expireAfterSeconds=0)
+        except Exception as e:
+            logging.error(f"Could not create refresh claim index: {str(e)}")
+
+    async def claim(self, key: str) -> bool:
+        """True if this worker may refresh key now"""
+        now = datetime.utcnow()
+        try:
+            with MONGO_OPERATION_SECONDS.time('refresh_claim'):
+                # Takes over a lapsed claim or inserts a new one; a live claim fails the insert
+                await self.collection.update_one(
+                    {'_id': key, 'until': {'$lte': now}},
+                    {'$set': {'until': now + timedelta(seconds=self.hold)}},
+                    upsert=True,
+                )
+        except DuplicateKeyError:
+            return False
+        except Exception as e:
+            # Refreshing twice beats not refreshing
+            logging.error(f"Refresh claim failed for {key}: {str(e)}")
+        return True
+
+
+class Prefetcher:
+    """Refreshes the most requested (source, query) pairs before they expire.
+
+    Every interval the top pairs by popularity whose cache entry is
+    missing or within margin seconds of the TTL are refreshed, and so are
+    the expansions (e.g. "q" + "a".."z") of the top expand_top queries.
+    Refreshes run at most concurrency at a time, and once a refresh for a
+    source fails the rest of the round skips that source, so a throttled or
+    failing upstream is left to the user-facing requests. With claim, a
+    pair is only refreshed if claim(source, q) grants it, so workers
+    sharing a cache don't each refresh the same pairs.
+    """
+
+    def __init__(self, tracker: PopularityTracker,
+                 age: Callable[[str, str], Awaitable[Optional[float]]],
+                 refresh: Callable[[str, str], Awaitable[object]],
+                 expand: Callable[[str], Iterable[str]],
+                 ttl: float, interval: float = 60, margin: Optional[float] = None,
+                 top: int = 200, expand_top: int = 10, min_score: float = 2, concurrency: int = 2,
+                 claim: Optional[Callable[[str, str], Awaitable[bool]]] = None):
+        self.tracker = tracker
+        self.age = age
+        self.refresh = refresh
+        self.expand = expand
+        self.ttl = ttl
+        self.interval = interval
+        # Soon enough that the next round would be too late
+        self.margin = 2 * interval if margin is None else margin
+        self.top = top
+        self.expand_top = expand_top
+        self.min_score = min_score
+        self.concurrency = concurrency
+        self.claim = claim
+        self._task: Optional[asyncio.Task] = None
+        self.counters: Dict[str, int] = {
+            'rounds': 0,
+            'checked': 0,
+            'refreshed': 0,
+            'failed': 0,
+            'claimed_elsewhere': 0,
+            'aborted_rounds': 0,
+        }
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._loop())
+
+    async def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                logging.error(f"Prefetch round failed: {str(e)}")
+
+    def candidates(self) -> List[Pair]:
+        """Pairs to keep warm, most popular first, expansions after their query"""
+        pairs: List[Pair] = []
+        seen = set()
+        for rank, ((source, query), score) in enumerate(self.tracker.top(self.top)):
+            if score < self.min_score:
+                break
+            expansions = [query] + (list(self.expand(query)) if rank < self.expand_top else [])
+            for q in expansions:
+                if (source, q) not in seen:
+                    seen.add((source, q))
+                    pairs.append((source, q))
+        return pairs
+
+    async def run_once(self) -> int:
+        """One prefetch round; returns the number of pairs refreshed"""
+        self.counters['rounds'] += 1
+        pairs = iter(self.candidates())
+        refreshed = 0
+        failed_sources = set()
+
+        async def worker():
+            nonlocal refreshed
+            for source, q in pairs:
+                if source in failed_sources:
+                    continue
+                self.counters['checked'] += 1
+                age = await self.age(source, q)
+                if age is not None and age < self.ttl - self.margin:
+                    continue
+                if self.claim is not None and not await self.claim(source, q):
+                    self.counters['claimed_elsewhere'] += 1
+                    continue
+                try:
+                    await self.refresh(source, q)
+                except Exception:
+                    self.counters['failed'] += 1
+                    failed_sources.add(source)
+                    continue
+                refreshed += 1
+                self.counters['refreshed'] += 1
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        if failed_sources:
+            self.counters['aborted_rounds'] += 1
+        return refreshed
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            'tracked': len(self.tracker),
+            'running': self._task is not None and not self._task.done(),
+        }
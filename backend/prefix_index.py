@@ -0,0 +1,156 @@
+import bisect
+import heapq
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from suggestion_cache import normalize_query
+
+# Seeds remembered per phrase; ranking stops growing past this many
+MAX_TRACKED_SEEDS = 50
+
+# Longer prefixes are answered from the sorted phrase list instead of the trie
+MAX_TRIE_DEPTH = 8
+
+
+def normalize_phrase(text: str) -> str:
+    return normalize_query(text).strip()
+
+
+class PhraseStats:
+    __slots__ = ('text', 'count', 'sources', 'seeds')
+
+    def __init__(self, text: str):
+        self.text = text
+        self.count = 0
+        self.sources: Set[str] = set()
+        self.seeds: Set[str] = set()
+
+    @property
+    def score(self) -> float:
+        # Being seen from several sources or seeds counts more than repeats
+        return self.count + 3 * len(self.seeds) + 10 * len(self.sources)
+
+    def to_dict(self) -> dict:
+        return {
+            'text': self.text,
+            'count': self.count,
+            'seeds': len(self.seeds),
+            'sources': sorted(self.sources),
+        }
+
+
+class _Node:
+    __slots__ = ('children', 'top')
+
+    def __init__(self):
+        self.children: Dict[str, '_Node'] = {}
+        # Best phrases under this prefix as (score, phrase), highest first
+        self.top: List[Tuple[float, str]] = []
+
+
+class PrefixIndex:
+    """Prefix index over harvested phrases.
+
+    A character trie covers the first MAX_TRIE_DEPTH characters, each node
+    keeping its top_k phrases, so short (unselective) prefixes are answered
+    by walking at most MAX_TRIE_DEPTH nodes. Longer prefixes match few
+    phrases and are answered by bisecting a sorted phrase list and ranking
+    the matches. Capping the depth keeps the node count small.
+
+    Scores only ever grow, which is what lets the per-node lists be
+    maintained incrementally. Bulk loads should add with promote=False and
+    call rebuild() once.
+    """
+
+    def __init__(self, top_k: int = 20):
+        self.top_k = top_k
+        self.root = _Node()
+        self.phrases: Dict[str, PhraseStats] = {}
+        self.sorted_phrases: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.phrases)
+
+    def add(self, text: str, source: str, seed: str, count: int = 1):
+        self.add_stats(text, [source], [seed], count)
+
+    def add_stats(self, text: str, sources: Iterable[str], seeds: Iterable[str], count: int,
+                  promote: bool = True):
+        phrase = normalize_phrase(text)
+        if not phrase:
+            return
+        stats = self.phrases.get(phrase)
+        if stats is None:
+            stats = self.phrases[phrase] = PhraseStats(text)
+            if promote:
+                bisect.insort(self.sorted_phrases, phrase)
+        stats.count += count
+        stats.sources.update(sources)
+        for seed in seeds:
+            if len(stats.seeds) >= MAX_TRACKED_SEEDS:
+                break
+            stats.seeds.add(normalize_phrase(seed))
+        if promote:
+            self._promote(phrase, stats.score)
+
+    def merge(self, other: 'PrefixIndex'):
+        for stats in other.phrases.values():
+            self.add_stats(stats.text, stats.sources, stats.seeds, stats.count)
+
+    def rebuild(self):
+        """Recompute the sorted list and trie from self.phrases in one pass"""
+        self.sorted_phrases = sorted(self.phrases)
+        self.root = _Node()
+        for phrase in self.sorted_phrases:
+            node = self.root
+            for char in phrase[:MAX_TRIE_DEPTH]:
+                child = node.children.get(char)
+                if child is None:
+                    child = node.children[char] = _Node()
+                node = child
+            node.top.append((self.phrases[phrase].score, phrase))
+        self._fill_top(self.root)
+
+    def _fill_top(self, node: _Node):
+        candidates = node.top
+        for child in node.children.values():
+            self._fill_top(child)
+            candidates = candidates + child.top
+        node.top = heapq.nlargest(self.top_k, candidates, key=lambda item: item[0])
+
+    def _promote(self, phrase: str, score: float):
+        node = self.root
+        self._update_top(node, phrase, score)
+        for char in phrase[:MAX_TRIE_DEPTH]:
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = _Node()
+            node = child
+            self._update_top(node, phrase, score)
+
+    def _update_top(self, node: _Node, phrase: str, score: float):
+        top = node.top
+        for i, (_, existing) in enumerate(top):
+            if existing == phrase:
+                del top[i]
+                break
+        else:
+            if len(top) >= self.top_k and score <= top[-1][0]:
+                return
+        top.append((score, phrase))
+        top.sort(key=lambda item: -item[0])
+        del top[self.top_k:]
+
+    def search(self, prefix: str, limit: int = 10) -> List[PhraseStats]:
+        prefix = normalize_query(prefix)
+        if len(prefix) > MAX_TRIE_DEPTH:
+            start = bisect.bisect_left(self.sorted_phrases, prefix)
+            end = bisect.bisect_left(self.sorted_phrases, prefix + chr(0x10FFFF), start)
+            matches = [self.phrases[phrase] for phrase in self.sorted_phrases[start:end]]
+            return heapq.nlargest(limit, matches, key=lambda stats: stats.score)
+
+        node: Optional[_Node] = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return [self.phrases[phrase] for _, phrase in node.top[:limit]]
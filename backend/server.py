@@ -1,18 +1,44 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Query
+import time
+STARTED_AT = time.perf_counter()  # Import + startup time is checked against STARTUP_BUDGET
+
+from fastapi import FastAPI, APIRouter, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import asyncio
 import logging
-import requests
+import httpx
 import json
 import re
+import string
+import base64
+import socket
+import tempfile
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional, Tuple
 import uuid
-from datetime import datetime
-import urllib.parse
+from datetime import datetime, timedelta
+from suggestion_cache import SuggestionCache, cache_key
+from singleflight import SingleFlight
+from throttling import AdaptiveRateLimiter, CircuitBreaker, CircuitOpen, RateLimited, UpstreamUnavailable
+from shared_state import SharedStateFile
+from hedging import Hedger
+from prefix_index import MAX_TRACKED_SEEDS, PrefixIndex, normalize_phrase
+from crawl_jobs import CrawlJobManager
+from prefetch import PopularityTracker, Prefetcher, RefreshClaims
+from typeahead import TypeaheadSession
+from analytics import AnalyticsRunner
+from parsers import parse_amazon_response, parse_google_response
+from suggestion_merge import SuggestionMerger
+from write_buffer import BufferedWriter
+from exporters import EXPORT_MEDIA_TYPES, EXPORTERS, gzip_stream
+from metrics import (
+    MONGO_OPERATION_SECONDS, REGISTRY, SOURCE_RESULTS, UPSTREAM_EMPTY_RESULTS,
+    UPSTREAM_REQUEST_SECONDS, MetricsMiddleware,
+)
 
 
 ROOT_DIR = Path(__file__).parent
@@ -23,6 +49,222 @@ mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
+# Upstream HTTP client settings
+UPSTREAM_TIMEOUT = float(os.environ.get('UPSTREAM_TIMEOUT', '10'))
+UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', '3'))
+UPSTREAM_MAX_CONNECTIONS = int(os.environ.get('UPSTREAM_MAX_CONNECTIONS', '500'))
+UPSTREAM_MAX_KEEPALIVE = int(os.environ.get('UPSTREAM_MAX_KEEPALIVE', '100'))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.environ.get('UPSTREAM_KEEPALIVE_EXPIRY', '30'))
+
+# Upstream suggest endpoints, overridable to point at local stubs
+GOOGLE_SUGGEST_URL = os.environ.get('GOOGLE_SUGGEST_URL', 'http://suggestqueries.google.com/complete/search')
+YOUTUBE_SUGGEST_URL = os.environ.get('YOUTUBE_SUGGEST_URL', 'http://suggestqueries.google.com/complete/search')
+AMAZON_SUGGEST_URL = os.environ.get('AMAZON_SUGGEST_URL', 'https://completion.amazon.com/api/2017/suggestions')
+
+# Where hedged (backup) requests go: Google's suggest API is also served by
+# www.google.com; Amazon has no second host, so its backup reuses the first
+GOOGLE_HEDGE_URL = os.environ.get('GOOGLE_HEDGE_URL', 'https://www.google.com/complete/search')
+YOUTUBE_HEDGE_URL = os.environ.get('YOUTUBE_HEDGE_URL', 'https://www.google.com/complete/search')
+AMAZON_HEDGE_URL = os.environ.get('AMAZON_HEDGE_URL', AMAZON_SUGGEST_URL)
+
+UPSTREAM_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+# Aggregate (/suggestions/all) deadlines, in seconds
+ALL_SUGGESTIONS_DEADLINE = float(os.environ.get('ALL_SUGGESTIONS_DEADLINE', '5'))
+SOURCE_BUDGETS = {
+    'google': float(os.environ.get('GOOGLE_BUDGET', '3')),
+    'amazon': float(os.environ.get('AMAZON_BUDGET', '4')),
+    'youtube': float(os.environ.get('YOUTUBE_BUDGET', '3')),
+}
+
+# Amazon marketplace queried for suggestions
+AMAZON_MARKETPLACE_ID = 'ATVPDKIKX0DER'
+AMAZON_LOCALE = 'en_US'
+
+# Upstream parameters that change results, part of the cache key
+SOURCE_MARKETS = {
+    'google': '',
+    'amazon': f'{AMAZON_MARKETPLACE_ID}:{AMAZON_LOCALE}',
+    'youtube': '',
+}
+
+def source_setting(source: str, name: str, default: float) -> float:
+    """Per-source setting from e.g. AMAZON_RATE_LIMIT, falling back to RATE_LIMIT, then default"""
+    value = os.environ.get(f'{source.upper()}_{name}', os.environ.get(name))
+    return float(value) if value is not None else default
+
+# Upstream rate limits (requests/second) and circuit breakers, per source
+SOURCES = ['google', 'amazon', 'youtube']
+
+# Several workers (uvicorn server:app --workers N) share the limiter and
+# breaker state through a memory-mapped file, so N workers together stay
+# within one set of upstream limits. An empty SHARED_STATE_PATH keeps the
+# state per process.
+SHARED_STATE_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+SHARED_STATE_PATH = os.environ.get(
+    'SHARED_STATE_PATH', os.path.join(SHARED_STATE_DIR, f"keyword-suggest-{os.environ['DB_NAME']}.state")
+)
+shared_state = (
+    SharedStateFile(SHARED_STATE_PATH, [f'{kind}:{source}' for kind in ('limiter', 'breaker') for source in SOURCES])
+    if SHARED_STATE_PATH and SharedStateFile.supported() else None
+)
+
+def shared_slot(name: str):
+    return shared_state.slot(name) if shared_state is not None else None
+
+# Seconds from import to serving, per worker; kept low by importing heavy
+# packages (pandas, pyarrow) only where used and building indexes in the background
+STARTUP_BUDGET = float(os.environ.get('STARTUP_BUDGET', '2'))
+startup_seconds: Optional[float] = None
+
+# Identifies this worker process as the owner of the crawl jobs it runs, and
+# in the metrics and stats endpoints, which each worker keeps for itself
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+rate_limiters = {
+    source: AdaptiveRateLimiter(
+        rate=source_setting(source, 'RATE_LIMIT', 20),
+        burst=source_setting(source, 'RATE_BURST', 40),
+        min_rate=source_setting(source, 'RATE_MIN', 1),
+        max_rate=source_setting(source, 'RATE_MAX', 50),
+        slow_threshold=source_setting(source, 'SLOW_THRESHOLD', 2),
+        max_wait=source_setting(source, 'RATE_MAX_WAIT', 2),
+        shared=shared_slot(f'limiter:{source}'),
+    )
+    for source in SOURCES
+}
+circuit_breakers = {
+    source: CircuitBreaker(
+        failure_threshold=int(source_setting(source, 'BREAKER_FAILURES', 5)),
+        reset_timeout=source_setting(source, 'BREAKER_RESET', 30),
+        shared=shared_slot(f'breaker:{source}'),
+    )
+    for source in SOURCES
+}
+
+# Hedged upstream requests: a backup goes out once the first attempt is slower
+# than HEDGE_PERCENTILE of recent calls, for at most HEDGE_BUDGET extra
+# requests per call; e.g. GOOGLE_HEDGE=0 turns it off for one source
+hedgers = {
+    source: Hedger(
+        percentile=source_setting(source, 'HEDGE_PERCENTILE', 95),
+        min_delay=source_setting(source, 'HEDGE_MIN_DELAY', 0.05),
+        max_delay=source_setting(source, 'HEDGE_MAX_DELAY', 2),
+        budget_ratio=source_setting(source, 'HEDGE_BUDGET', 0.1),
+    )
+    for source in SOURCES
+    if source_setting(source, 'HEDGE', 0 if source == 'amazon' else 1)
+}
+
+# Suggestion cache
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '10000'))
+CACHE_TTL = float(os.environ.get('CACHE_TTL', '3600'))
+# How long past the TTL an entry is still served while it is refreshed in the background
+CACHE_GRACE = float(os.environ.get('CACHE_GRACE', '600'))
+
+# Popularity-driven prefetching of hot queries before their cache entries expire
+POPULARITY_HALF_LIFE = float(os.environ.get('POPULARITY_HALF_LIFE', '3600'))
+POPULARITY_MAX_KEYS = int(os.environ.get('POPULARITY_MAX_KEYS', '50000'))
+POPULARITY_WINDOW = float(os.environ.get('POPULARITY_WINDOW', str(24 * 3600)))
+PREFETCH = int(os.environ.get('PREFETCH', '1'))
+PREFETCH_INTERVAL = float(os.environ.get('PREFETCH_INTERVAL', '60'))
+PREFETCH_TOP = int(os.environ.get('PREFETCH_TOP', '200'))
+PREFETCH_EXPAND_TOP = int(os.environ.get('PREFETCH_EXPAND_TOP', '10'))
+PREFETCH_ALPHABET = os.environ.get('PREFETCH_ALPHABET', string.ascii_lowercase)
+PREFETCH_MIN_SCORE = float(os.environ.get('PREFETCH_MIN_SCORE', '2'))
+PREFETCH_CONCURRENCY = int(os.environ.get('PREFETCH_CONCURRENCY', '2'))
+
+# Local prefix index over harvested suggestions. Each worker indexes its own
+# harvests as they happen and reloads from MongoDB every
+# LOCAL_INDEX_RELOAD_INTERVAL seconds (0: only at startup) to pick up the
+# other workers' harvests.
+LOCAL_INDEX_TOP_K = int(os.environ.get('LOCAL_INDEX_TOP_K', '20'))
+LOCAL_INDEX_RELOAD_INTERVAL = float(os.environ.get('LOCAL_INDEX_RELOAD_INTERVAL', '600'))
+
+# Bulk alphabet expansion
+DEFAULT_EXPANSION_ALPHABET = string.ascii_lowercase + string.digits
+MAX_EXPANSION_ALPHABET = 64
+BULK_CONCURRENCY = int(os.environ.get('BULK_CONCURRENCY', '8'))
+
+# Aggregate responses list either each source's suggestions (raw) or one
+# deduplicated, ranked list across sources (merged), not both
+SUGGESTION_VIEWS = ('raw', 'merged')
+
+# Batch lookups over many seed queries
+MAX_BATCH_QUERIES = int(os.environ.get('MAX_BATCH_QUERIES', '1000'))
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', '16'))
+
+# Live typeahead over WebSocket
+TYPEAHEAD_DEBOUNCE = float(os.environ.get('TYPEAHEAD_DEBOUNCE', '0.15'))
+MAX_TYPEAHEAD_QUERY = 200
+
+# Background deep-crawl jobs
+MAX_CRAWL_DEPTH = 5
+MAX_CRAWL_QUERIES = int(os.environ.get('MAX_CRAWL_QUERIES', '50000'))
+MAX_CRAWL_CONCURRENCY = int(os.environ.get('MAX_CRAWL_CONCURRENCY', '32'))
+CRAWL_CHECKPOINT_INTERVAL = float(os.environ.get('CRAWL_CHECKPOINT_INTERVAL', '5'))
+CRAWL_LEASE = float(os.environ.get('CRAWL_LEASE', '60'))
+
+# Buffered MongoDB writes (harvested suggestions, query log, status checks)
+WRITE_BATCH_SIZE = int(os.environ.get('WRITE_BATCH_SIZE', '500'))
+WRITE_FLUSH_INTERVAL = float(os.environ.get('WRITE_FLUSH_INTERVAL', '1'))
+WRITE_MAX_PENDING = int(os.environ.get('WRITE_MAX_PENDING', '20000'))
+QUERY_LOG_TTL = int(os.environ.get('QUERY_LOG_TTL', str(30 * 24 * 3600)))
+
+# Suggestion analytics; datasets of at least ANALYTICS_POOL_THRESHOLD rows run in worker processes
+ANALYTICS_WORKERS = int(os.environ.get('ANALYTICS_WORKERS', '2'))
+ANALYTICS_POOL_THRESHOLD = int(os.environ.get('ANALYTICS_POOL_THRESHOLD', '5000'))
+ANALYTICS_CACHE_ENTRIES = int(os.environ.get('ANALYTICS_CACHE_ENTRIES', '64'))
+MAX_ANALYTICS_ROWS = int(os.environ.get('MAX_ANALYTICS_ROWS', '500000'))
+
+# Status check listing page sizes
+DEFAULT_STATUS_PAGE = 100
+MAX_STATUS_PAGE = 1000
+
+# Shared upstream client, opened on startup and closed on shutdown
+http_client: Optional[httpx.AsyncClient] = None
+
+upstream_calls = SingleFlight()
+popularity = PopularityTracker(half_life=POPULARITY_HALF_LIFE, max_keys=POPULARITY_MAX_KEYS)
+# Cache keys with a background refresh under way
+revalidating = set()
+analytics = AnalyticsRunner(workers=ANALYTICS_WORKERS, pool_threshold=ANALYTICS_POOL_THRESHOLD,
+                            max_entries=ANALYTICS_CACHE_ENTRIES)
+typeahead_sessions = set()
+typeahead_counters = {
+    'connections': 0,
+    'prefixes': 0,
+    'debounced': 0,
+    'fetched': 0,
+    'cancelled': 0,
+    'sent': 0,
+    'rejected': 0,
+}
+prefix_index = PrefixIndex(top_k=LOCAL_INDEX_TOP_K)
+prefix_index_loaded = False
+# Harvests made while a load runs, merged into the loaded index before it is swapped in
+harvested_while_loading: Optional[PrefixIndex] = None
+prefix_index_task: Optional[asyncio.Task] = None
+
+# Fire-and-forget work, awaited on shutdown
+background_tasks = set()
+
+def buffered_writer(name: str, collection) -> BufferedWriter:
+    return BufferedWriter(name, collection, max_batch=WRITE_BATCH_SIZE,
+                          flush_interval=WRITE_FLUSH_INTERVAL, max_pending=WRITE_MAX_PENDING)
+
+harvest_writer = buffered_writer('harvest', db.harvested_suggestions)
+harvest_seeds_writer = buffered_writer('harvest_seeds', db.harvest_seeds)
+query_log_writer = buffered_writer('query_log', db.query_log)
+status_writer = buffered_writer('status', db.status_checks)
+cache_writer = buffered_writer('cache', db.suggestion_cache)
+buffered_writers = [harvest_writer, harvest_seeds_writer, query_log_writer, status_writer, cache_writer]
+
+suggestion_cache = SuggestionCache(db.suggestion_cache, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL,
+                                   grace=CACHE_GRACE, writer=cache_writer)
+
 # Create the main app without a prefix
 app = FastAPI()
 
@@ -48,200 +290,1146 @@ class SuggestionResponse(BaseModel):
     source: str
     suggestions: List[str]
 
-# Helper function to clean Google/YouTube suggestions
-def clean_google_response(text: str) -> List[str]:
-    try:
-        # For Google's JSONP format (window.google.ac.h([[...]])
-        if text.startswith('window.google.ac.h('):
-            # Extract the JSON part from the JSONP response
-            json_str = text[text.index('(')+1:text.rindex(')')]
-            data = json.loads(json_str)
-            
-            # Extract suggestions from Google format
-            suggestions = []
-            if isinstance(data, list) and len(data) > 0 and isinstance(data[0], list):
-                for item in data[0]:
-                    if isinstance(item, str):
-                        # First element is the suggestion text
-                        clean_text = re.sub(r'<[^>]+>', '', item)
-                        suggestions.append(clean_text)
-            return suggestions
-        
-        # For the original format
-        elif text.startswith(')]}\''):
-            text = text[4:]
-            data = json.loads(text)
-            
-            suggestions = []
-            if isinstance(data, list) and len(data) > 1:
-                for item in data[1]:
-                    if isinstance(item, list) and len(item) > 0:
-                        suggestions.append(item[0])
-                    elif isinstance(item, str):
-                        suggestions.append(item)
-            return suggestions
-        
-        # Try to parse as regular JSON
-        else:
-            try:
-                data = json.loads(text)
-                suggestions = []
-                
-                # Try to extract suggestions from any list structure
-                if isinstance(data, list):
-                    for item in data:
-                        if isinstance(item, str):
-                            suggestions.append(item)
-                        elif isinstance(item, list) and len(item) > 0:
-                            if isinstance(item[0], str):
-                                suggestions.append(item[0])
-                
-                return suggestions
-            except:
-                # If all else fails, return empty list
-                return []
-    except Exception as e:
-        logging.error(f"Error parsing Google response: {str(e)}")
-        return []
+class LocalSuggestion(BaseModel):
+    text: str
+    count: int
+    seeds: int
+    sources: List[str]
 
-def clean_amazon_response(data: dict) -> List[str]:
-    try:
-        suggestions = []
-        if 'suggestions' in data:
-            for suggestion in data['suggestions']:
-                if 'value' in suggestion:
-                    suggestions.append(suggestion['value'])
-        return suggestions
-    except:
-        return []
+class LocalSuggestionResponse(BaseModel):
+    query: str
+    suggestions: List[LocalSuggestion]
+    indexed: int
+    loading: bool
+
+class CrawlJobCreate(BaseModel):
+    seed: str = Field(..., min_length=1)
+    sources: List[str] = Field(default_factory=lambda: list(SOURCES), min_length=1)
+    alphabet: str = Field(DEFAULT_EXPANSION_ALPHABET, max_length=MAX_EXPANSION_ALPHABET)
+    separator: str = " "
+    max_depth: int = Field(1, ge=0, le=MAX_CRAWL_DEPTH)
+    max_queries: int = Field(2000, ge=1, le=MAX_CRAWL_QUERIES)
+    concurrency: int = Field(8, ge=1, le=MAX_CRAWL_CONCURRENCY)
+
+class CrawlJob(BaseModel):
+    id: str
+    seed: str
+    sources: List[str]
+    alphabet: str
+    separator: str
+    max_depth: int
+    max_queries: int
+    concurrency: int
+    status: str  # "queued", "running", "completed", "failed" or "cancelled"
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    queries_done: int
+    queries_failed: int
+    seeds_done: int
+    frontier_size: int
+    visited_count: int
+
+class CrawlResult(BaseModel):
+    query: str
+    source: str
+    seed: str
+    depth: int
+    suggestions: List[str]
+
+class SourceStatus(BaseModel):
+    source: str
+    status: str  # "ok", "timeout", "unavailable" or "error"
+    elapsed_ms: float
+    error: Optional[str] = None
+
+class MergedSuggestion(BaseModel):
+    text: str
+    sources: List[str]
+    count: int  # Results the phrase appeared in
+
+class AllSuggestionsResponse(BaseModel):
+    query: str
+    results: List[SuggestionResponse]  # Per source; empty in the merged view
+    sources: List[SourceStatus]
+    merged: List[MergedSuggestion] = []  # Deduplicated across sources, best first; merged view only
+
+class BatchSuggestionRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_QUERIES)
+    sources: List[str] = Field(default_factory=lambda: list(SOURCES), min_length=1)
+    stream: bool = False  # NDJSON, one line per query/source as it finishes
+    merge: bool = False  # When streaming, only send phrases not already sent
+    no_cache: bool = False
+    view: str = "raw"  # raw or merged; streaming in the merged view implies merge
+
+class BatchSuggestionResponse(BaseModel):
+    results: List[AllSuggestionsResponse]  # One per distinct query, in request order
+    merged: List[MergedSuggestion]  # Across every query and source; merged view only
+    total: int
+    ok: int
+    failed: int
+    elapsed_ms: float
 
 # Add your routes to the router instead of directly to app
 @api_router.get("/")
 async def root():
     return {"message": "Keyword Suggestion API"}
 
+async def fetch_google_suggestions(q: str, url: str = GOOGLE_SUGGEST_URL) -> List[str]:
+    # This endpoint returns a simple JSON array: [query, [suggestions]]. It answers
+    # in the locale's charset unless asked for UTF-8 (ie/oe), so honour the header too
+    response = await http_client.get(
+        url,
+        params={'client': 'firefox', 'ie': 'utf-8', 'oe': 'utf-8', 'q': q},
+    )
+    response.raise_for_status()
+    return parse_google_response(response.content, response.charset_encoding)
+
+async def fetch_amazon_suggestions(q: str, url: str = AMAZON_SUGGEST_URL) -> List[str]:
+    response = await http_client.get(
+        url,
+        params={'mid': AMAZON_MARKETPLACE_ID, 'lop': AMAZON_LOCALE, 'alias': 'aps', 'prefix': q},
+    )
+    response.raise_for_status()
+    return parse_amazon_response(response.content)
+
+async def fetch_youtube_suggestions(q: str, url: str = YOUTUBE_SUGGEST_URL) -> List[str]:
+    # Same format as Google, restricted to the YouTube dataset
+    response = await http_client.get(
+        url,
+        params={'client': 'firefox', 'ds': 'yt', 'ie': 'utf-8', 'oe': 'utf-8', 'q': q},
+    )
+    response.raise_for_status()
+    return parse_google_response(response.content, response.charset_encoding)
+
+SOURCE_FETCHERS = {
+    'google': fetch_google_suggestions,
+    'amazon': fetch_amazon_suggestions,
+    'youtube': fetch_youtube_suggestions,
+}
+
+HEDGE_URLS = {
+    'google': GOOGLE_HEDGE_URL,
+    'amazon': AMAZON_HEDGE_URL,
+    'youtube': YOUTUBE_HEDGE_URL,
+}
+
+def run_in_background(coro):
+    task = asyncio.ensure_future(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+def harvest(source: str, q: str, suggestions: List[str]):
+    """Add freshly fetched suggestions to the prefix index and queue them for storage.
+
+    Every (seed, phrase) pair gets its own harvest_seeds document, which the
+    seed filters read; the phrase document only keeps its first
+    MAX_TRACKED_SEEDS seeds, for ranking in the prefix index.
+    """
+    for text in suggestions:
+        prefix_index.add(text, source, q)
+        if harvested_while_loading is not None:
+            harvested_while_loading.add(text, source, q)
+    now = datetime.utcnow()
+    seed = normalize_phrase(q)
+    phrases = {}
+    for text in suggestions:
+        # The first spelling wins, as in the prefix index and the merger
+        phrases.setdefault(normalize_phrase(text), text)
+    phrases.pop("", None)
+    for phrase, text in phrases.items():
+        harvest_writer.upsert(phrase, {
+            '$setOnInsert': {'text': text, 'first_seen': now, 'seeds': [seed]},
+            '$set': {'last_seen': now},
+            '$inc': {'count': 1},
+            '$addToSet': {'sources': source},
+        })
+        # Seeds stop being added once MAX_TRACKED_SEEDS are stored (give or take one flush's worth)
+        harvest_writer.update(phrase, {'$addToSet': {'seeds': seed}},
+                              condition={f'seeds.{MAX_TRACKED_SEEDS - 1}': {'$exists': False}})
+        harvest_seeds_writer.upsert(f"{seed}|{phrase}", {'$setOnInsert': {'seed': seed, 'phrase': phrase}})
+
+def log_query(source: str, q: str, outcome: str, crawl: bool = False):
+    """Queue a query-log event and count q towards popularity unless it came from a crawl.
+    
+    outcome is "cache", "revalidate" (served within the grace window),
+    "upstream", "stale" or "error".
+    """
+    event = {'query': q, 'source': source, 'outcome': outcome, 'at': datetime.utcnow()}
+    if crawl:
+        event['crawl'] = True
+    else:
+        popularity.record(source, q)
+    query_log_writer.insert(event)
+
+async def fetch_for_crawl(source: str, q: str) -> List[str]:
+    # Crawls are the bulk producers of writes; hold them back rather than drop harvests
+    await harvest_writer.wait_for_space()
+    return await get_suggestions(source, q, crawl=True)
+
+crawl_jobs = CrawlJobManager(
+    db.crawl_jobs, db.crawl_results, db.crawl_phrases, fetch_for_crawl, owner=WORKER_ID,
+    checkpoint_interval=CRAWL_CHECKPOINT_INTERVAL, lease=CRAWL_LEASE,
+)
+
+CRAWL_JOB_SUMMARY = {
+    '_id': 0,
+    'id': '$_id',
+    **{field: 1 for field in CrawlJob.model_fields if field != 'id'},
+}
+
+async def get_crawl_job_summary(job_id: str) -> CrawlJob:
+    jobs = await db.crawl_jobs.aggregate([
+        {'$match': {'_id': job_id}},
+        {'$project': CRAWL_JOB_SUMMARY},
+    ]).to_list(1)
+    if not jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return CrawlJob(**jobs[0])
+
+async def load_prefix_index():
+    """Build the prefix index from everything harvested so far, by every worker"""
+    global prefix_index, prefix_index_loaded, harvested_while_loading
+    started = time.perf_counter()
+    loaded = PrefixIndex(top_k=LOCAL_INDEX_TOP_K)
+    harvested_while_loading = PrefixIndex(top_k=LOCAL_INDEX_TOP_K)
+    projection = {'text': 1, 'count': 1, 'sources': 1, 'seeds': {'$slice': MAX_TRACKED_SEEDS}}
+    try:
+        async for doc in db.harvested_suggestions.find({}, projection, batch_size=5000):
+            loaded.add_stats(doc['text'], doc.get('sources', []), doc.get('seeds', []), doc.get('count', 0),
+                             promote=False)
+        # Nothing else touches the new index, so the trie can be built off the event loop
+        await asyncio.to_thread(loaded.rebuild)
+    except Exception as e:
+        logging.error(f"Failed to load prefix index: {str(e)}")
+        if prefix_index_loaded:
+            # Keep serving the last complete index
+            harvested_while_loading = None
+            return
+    # Keep whatever was harvested while loading (a harvest the scan also saw counts twice
+    # until the next reload), then swap the index in
+    loaded.merge(harvested_while_loading)
+    harvested_while_loading = None
+    prefix_index = loaded
+    prefix_index_loaded = True
+    logger.info(f"Prefix index loaded {len(prefix_index)} phrases in {time.perf_counter() - started:.1f}s")
+
+async def maintain_prefix_index():
+    """Load the prefix index, then reload it every LOCAL_INDEX_RELOAD_INTERVAL seconds"""
+    await load_prefix_index()
+    while LOCAL_INDEX_RELOAD_INTERVAL > 0:
+        await asyncio.sleep(LOCAL_INDEX_RELOAD_INTERVAL)
+        await load_prefix_index()
+
+async def call_upstream(source: str, q: str) -> List[str]:
+    """Call the source through its circuit breaker and rate limiter, hedging if enabled"""
+    breaker = circuit_breakers[source]
+    limiter = rate_limiters[source]
+    hedger = hedgers.get(source)
+    fetch = SOURCE_FETCHERS[source]
+    # Fail fast while open, but only claim the half-open trial once a token is in hand:
+    # waiting for it, or giving up, must not hold the trial
+    breaker.precheck()
+    await limiter.acquire()
+    try:
+        trial = breaker.check()
+    except CircuitOpen:
+        limiter.release()
+        raise
+    
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        if hedger is None:
+            suggestions = await fetch(q)
+        else:
+            # The backup only goes out if a token is free right away
+            suggestions = await hedger.run(
+                lambda: fetch(q), lambda: fetch(q, HEDGE_URLS[source]), limiter.try_acquire,
+            )
+        outcome = "ok"
+    except asyncio.CancelledError:
+        # Nobody wants the answer any more; not the upstream's fault
+        outcome = "cancelled"
+        if trial:
+            breaker.release_trial()
+        raise
+    except httpx.TimeoutException:
+        outcome = "timeout"
+        limiter.on_slow()
+        breaker.record_failure()
+        raise
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 429:
+            outcome = "throttled"
+            limiter.on_throttled()
+        breaker.record_failure()
+        raise
+    except Exception:
+        breaker.record_failure()
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        UPSTREAM_REQUEST_SECONDS.observe(elapsed, source, outcome)
+    limiter.on_success(elapsed)
+    breaker.record_success()
+    if not suggestions:
+        UPSTREAM_EMPTY_RESULTS.inc(source)
+    return suggestions
+
+async def refresh_suggestions(source: str, q: str, abandonable: bool = False) -> List[str]:
+    """Fetch q from the upstream source and store the result in the cache.
+    
+    With abandonable, the upstream call is cancelled if every caller
+    waiting on it is, rather than finishing to fill the cache.
+    """
+    key = cache_key(source, q, SOURCE_MARKETS[source])
+
+    async def fetch_and_store():
+        suggestions = await call_upstream(source, q)
+        await suggestion_cache.set(key, source, q, suggestions)
+        harvest(source, q, suggestions)
+        return suggestions
+
+    # Concurrent misses for the same key share one upstream call
+    return await upstream_calls.do(key, fetch_and_store, cancel_abandoned=abandonable)
+
+def revalidate(source: str, q: str, key: str):
+    """Refresh an entry served from the grace window, once, behind the response"""
+    if key in revalidating:
+        return
+    revalidating.add(key)
+
+    async def run():
+        try:
+            await refresh_suggestions(source, q)
+        except UpstreamUnavailable:
+            # Served stale again next time, until the grace window runs out
+            pass
+        except Exception as e:
+            logging.error(f"Background refresh failed for {source} {q!r}: {str(e)}")
+        finally:
+            revalidating.discard(key)
+
+    run_in_background(run())
+
+async def get_suggestions(
+    source: str, q: str, bypass_cache: bool = False, crawl: bool = False, abandonable: bool = False
+) -> List[str]:
+    """Suggestions for q from the cache, falling back to the upstream source"""
+    key = cache_key(source, q, SOURCE_MARKETS[source])
+    if not bypass_cache:
+        hit = await suggestion_cache.get(key)
+        if hit is not None:
+            if hit.stale:
+                revalidate(source, q, key)
+            log_query(source, q, "revalidate" if hit.stale else "cache", crawl)
+            return hit.suggestions
+    
+    try:
+        suggestions = await refresh_suggestions(source, q, abandonable)
+    except UpstreamUnavailable:
+        suggestions = await suggestion_cache.get_stale(key)
+        if suggestions is None:
+            log_query(source, q, "error", crawl)
+            raise
+        log_query(source, q, "stale", crawl)
+        return suggestions
+    except Exception:
+        log_query(source, q, "error", crawl)
+        raise
+    log_query(source, q, "upstream", crawl)
+    return suggestions
+
+async def cache_age(source: str, q: str) -> Optional[float]:
+    return await suggestion_cache.age(cache_key(source, q, SOURCE_MARKETS[source]))
+
+async def prefetch_suggestions(source: str, q: str) -> List[str]:
+    # Prefetches only spend spare capacity, leaving the bucket to user requests
+    limiter = rate_limiters[source]
+    if limiter.available() < limiter.burst / 2:
+        raise RateLimited(f"no spare {source} capacity for prefetching")
+    return await refresh_suggestions(source, q)
+
+# Every worker prefetches; a claim per key keeps them from refreshing the same entries
+refresh_claims = RefreshClaims(db.refresh_claims, hold=PREFETCH_INTERVAL)
+
+async def claim_prefetch(source: str, q: str) -> bool:
+    return await refresh_claims.claim(cache_key(source, q, SOURCE_MARKETS[source]))
+
+prefetcher = Prefetcher(
+    popularity, cache_age, prefetch_suggestions,
+    expand=lambda q: [q + suffix for suffix in PREFETCH_ALPHABET],
+    ttl=CACHE_TTL, interval=PREFETCH_INTERVAL, top=PREFETCH_TOP, expand_top=PREFETCH_EXPAND_TOP,
+    min_score=PREFETCH_MIN_SCORE, concurrency=PREFETCH_CONCURRENCY, claim=claim_prefetch,
+)
+
+async def load_popularity():
+    """Seed the popularity tracker from the query log, so a restart doesn't forget what's hot"""
+    now = datetime.utcnow()
+    since = now - timedelta(seconds=POPULARITY_WINDOW)
+    pipeline = [
+        {'$match': {'at': {'$gte': since}, 'crawl': {'$ne': True}}},
+        {'$group': {'_id': {'source': '$source', 'query': '$query'}, 'count': {'$sum': 1}, 'last': {'$max': '$at'}}},
+        {'$sort': {'count': -1}},
+        {'$limit': POPULARITY_MAX_KEYS},
+    ]
+    try:
+        async for doc in db.query_log.aggregate(pipeline):
+            # Counted as if every request came at the latest one
+            age = (now - doc['last']).total_seconds()
+            popularity.record(doc['_id']['source'], doc['_id']['query'], doc['count'], age=age)
+    except Exception as e:
+        logging.error(f"Failed to load query popularity: {str(e)}")
+    logger.info(f"Popularity tracker loaded {len(popularity)} queries")
+
 @api_router.get("/suggestions/google", response_model=SuggestionResponse)
-async def get_google_suggestions(q: str = Query(..., description="Search query")):
+async def get_google_suggestions(
+    q: str = Query(..., description="Search query"),
+    no_cache: bool = Query(False, description="Bypass the suggestion cache"),
+):
     try:
-        encoded_query = urllib.parse.quote(q)
-        url = f"http://suggestqueries.google.com/complete/search?client=firefox&q={encoded_query}"
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        response = requests.get(url, headers=headers, timeout=10)
-        
-        # This endpoint returns a simple JSON array: [query, [suggestions]]
-        data = response.json()
-        suggestions = data[1] if len(data) > 1 and isinstance(data[1], list) else []
+        suggestions = await get_suggestions("google", q, bypass_cache=no_cache)
         
         return SuggestionResponse(
             query=q,
             source="google",
             suggestions=suggestions[:10]  # Limit to 10 suggestions
         )
+    except UpstreamUnavailable as e:
+        raise HTTPException(status_code=503, detail=f"Google suggestions unavailable: {str(e)}")
     except Exception as e:
         logging.error(f"Google API error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch Google suggestions")
 
 @api_router.get("/suggestions/amazon", response_model=SuggestionResponse)
-async def get_amazon_suggestions(q: str = Query(..., description="Search query")):
+async def get_amazon_suggestions(
+    q: str = Query(..., description="Search query"),
+    no_cache: bool = Query(False, description="Bypass the suggestion cache"),
+):
     try:
-        encoded_query = urllib.parse.quote(q)
-        url = f"https://completion.amazon.com/api/2017/suggestions?mid=ATVPDKIKX0DER&lop=en_US&alias=aps&prefix={encoded_query}"
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        response = requests.get(url, headers=headers, timeout=10)
-        data = response.json()
-        suggestions = clean_amazon_response(data)
+        suggestions = await get_suggestions("amazon", q, bypass_cache=no_cache)
         
         return SuggestionResponse(
             query=q,
             source="amazon",
             suggestions=suggestions[:10]  # Limit to 10 suggestions
         )
+    except UpstreamUnavailable as e:
+        raise HTTPException(status_code=503, detail=f"Amazon suggestions unavailable: {str(e)}")
     except Exception as e:
         logging.error(f"Amazon API error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch Amazon suggestions")
 
 @api_router.get("/suggestions/youtube", response_model=SuggestionResponse)
-async def get_youtube_suggestions(q: str = Query(..., description="Search query")):
+async def get_youtube_suggestions(
+    q: str = Query(..., description="Search query"),
+    no_cache: bool = Query(False, description="Bypass the suggestion cache"),
+):
     try:
-        encoded_query = urllib.parse.quote(q)
-        url = f"http://suggestqueries.google.com/complete/search?client=firefox&ds=yt&q={encoded_query}"
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        response = requests.get(url, headers=headers, timeout=10)
-        
-        # This endpoint returns a simple JSON array: [query, [suggestions]]
-        data = response.json()
-        suggestions = data[1] if len(data) > 1 and isinstance(data[1], list) else []
+        suggestions = await get_suggestions("youtube", q, bypass_cache=no_cache)
         
         return SuggestionResponse(
             query=q,
             source="youtube",
             suggestions=suggestions[:10]  # Limit to 10 suggestions
         )
+    except UpstreamUnavailable as e:
+        raise HTTPException(status_code=503, detail=f"YouTube suggestions unavailable: {str(e)}")
     except Exception as e:
         logging.error(f"YouTube API error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch YouTube suggestions")
 
-@api_router.get("/suggestions/all", response_model=List[SuggestionResponse])
-async def get_all_suggestions(q: str = Query(..., description="Search query")):
-    """Get suggestions from all sources"""
-    results = []
+@api_router.get("/suggestions/local", response_model=LocalSuggestionResponse)
+async def get_local_suggestions(
+    q: str = Query(..., description="Prefix to complete"),
+    limit: int = Query(10, ge=1, le=LOCAL_INDEX_TOP_K),
+):
+    """Complete a prefix from harvested suggestions, without calling any upstream"""
+    return LocalSuggestionResponse(
+        query=q,
+        suggestions=[LocalSuggestion(**stats.to_dict()) for stats in prefix_index.search(q, limit)],
+        indexed=len(prefix_index),
+        loading=not prefix_index_loaded,
+    )
+
+async def fetch_with_budget(
+    source: str, q: str, budget: float, bypass_cache: bool = False, abandonable: bool = False
+) -> Tuple[SourceStatus, Optional[SuggestionResponse]]:
+    """Fetch one source within its time budget, never raising"""
+    started = time.perf_counter()
+    result = None
+    error = None
+    try:
+        suggestions = await asyncio.wait_for(
+            get_suggestions(source, q, bypass_cache, abandonable=abandonable), timeout=budget,
+        )
+        result = SuggestionResponse(query=q, source=source, suggestions=suggestions[:10])
+        status = "ok"
+    except asyncio.TimeoutError:
+        status = "timeout"
+    except UpstreamUnavailable as e:
+        status = "unavailable"
+        error = str(e)
+    except Exception as e:
+        logging.error(f"{source} API error: {str(e)}")
+        status = "error"
+        error = str(e) or e.__class__.__name__
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    SOURCE_RESULTS.inc(source, status)
+    return SourceStatus(source=source, status=status, elapsed_ms=elapsed_ms, error=error), result
+
+def merge_results(results: List[SuggestionResponse]) -> List[MergedSuggestion]:
+    merger = SuggestionMerger()
+    for result in results:
+        merger.add(result.source, result.suggestions)
+    return [MergedSuggestion(**phrase) for phrase in merger.ranked()]
+
+@api_router.get("/suggestions/all", response_model=AllSuggestionsResponse)
+async def get_all_suggestions(
+    q: str = Query(..., description="Search query"),
+    deadline: Optional[float] = Query(None, gt=0, description="Overall deadline in seconds"),
+    no_cache: bool = Query(False, description="Bypass the suggestion cache"),
+    view: str = Query("raw", description="raw: each source's suggestions; merged: one ranked list across sources"),
+):
+    """Get suggestions from all sources concurrently"""
+    if view not in SUGGESTION_VIEWS:
+        raise HTTPException(status_code=400, detail=f"Unknown view: {view}")
+    # All sources start together, so capping each budget at the overall
+    # deadline bounds the whole request by it
+    deadline = min(deadline or ALL_SUGGESTIONS_DEADLINE, ALL_SUGGESTIONS_DEADLINE)
+    outcomes = await asyncio.gather(*(
+        fetch_with_budget(source, q, min(SOURCE_BUDGETS[source], deadline), no_cache)
+        for source in SOURCE_FETCHERS
+    ))
+    
+    results = [result for _, result in outcomes if result is not None]
+    merged = view == 'merged'
+    return AllSuggestionsResponse(
+        query=q,
+        results=[] if merged else results,
+        sources=[status for status, _ in outcomes],
+        merged=merge_results(results) if merged else [],
+    )
+
+async def fetch_many(
+    queries: List[str], sources: List[str], concurrency: int, bypass_cache: bool = False
+) -> AsyncIterator[dict]:
+    """Fetch every query from every source, at most concurrency at a time, yielding results as they finish"""
+    semaphore = asyncio.Semaphore(concurrency)
     
-    # Get Google suggestions
+    async def run(source: str, query: str):
+        async with semaphore:
+            status, result = await fetch_with_budget(source, query, SOURCE_BUDGETS[source], bypass_cache)
+            return query, status, result
+    
+    tasks = [
+        asyncio.ensure_future(run(source, query))
+        for query in queries
+        for source in sources
+    ]
     try:
-        google_result = await get_google_suggestions(q)
-        results.append(google_result)
-    except:
-        pass
+        for next_done in asyncio.as_completed(tasks):
+            query, status, result = await next_done
+            yield {
+                "query": query,
+                "source": status.source,
+                "suggestions": result.suggestions if result else [],
+                "status": status.status,
+                "elapsed_ms": status.elapsed_ms,
+                "error": status.error,
+            }
+    finally:
+        # The client may disconnect mid-stream; don't leave fetches running
+        for task in tasks:
+            task.cancel()
+
+def expand_query(
+    q: str, sources: List[str], alphabet: str, bypass_cache: bool = False
+) -> AsyncIterator[dict]:
+    """Fetch q + each alphabet character from every source, yielding results as they finish"""
+    return fetch_many([q + suffix for suffix in alphabet], sources, BULK_CONCURRENCY, bypass_cache)
+
+async def ndjson_lines(lines: AsyncIterator[dict], merge: bool = False) -> AsyncIterator[str]:
+    """Result lines as NDJSON, followed by a {"done": true, ...} summary line.
+    
+    With merge, each line only carries phrases not sent on an earlier line,
+    and the summary adds the ranked, deduplicated "merged" list.
+    """
+    started = time.perf_counter()
+    merger = SuggestionMerger() if merge else None
+    ok = failed = 0
+    async for line in lines:
+        if line["status"] == "ok":
+            ok += 1
+        else:
+            failed += 1
+        if merger is not None:
+            line["suggestions"] = merger.add(line["source"], line["suggestions"])
+        yield json.dumps(line) + "\n"
+    summary = {
+        "done": True,
+        "total": ok + failed,
+        "ok": ok,
+        "failed": failed,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+    if merger is not None:
+        summary["merged"] = merger.ranked()
+    yield json.dumps(summary) + "\n"
+
+@api_router.get("/suggestions/bulk")
+async def get_bulk_suggestions(
+    q: str = Query(..., description="Seed query"),
+    source: str = Query("google", description="Source name, or 'all'"),
+    alphabet: str = Query(DEFAULT_EXPANSION_ALPHABET, min_length=1, max_length=MAX_EXPANSION_ALPHABET,
+                          description="Characters appended to the seed, one sub-query each"),
+    merge: bool = Query(False, description="Only stream new phrases; add a ranked merged list to the summary"),
+    no_cache: bool = Query(False, description="Bypass the suggestion cache"),
+):
+    """Stream alphabet-expanded suggestions as NDJSON, one line per sub-query"""
+    if source == "all":
+        sources = list(SOURCE_FETCHERS)
+    elif source in SOURCE_FETCHERS:
+        sources = [source]
+    else:
+        raise HTTPException(status_code=400, detail=f"Unknown source: {source}")
+    # Drop repeated characters while keeping their order
+    alphabet = "".join(dict.fromkeys(alphabet))
+    
+    return StreamingResponse(ndjson_lines(expand_query(q, sources, alphabet, no_cache), merge),
+                             media_type="application/x-ndjson")
+
+def typeahead_sources(value) -> List[str]:
+    """Sources from a comma-separated string or a list, "all" meaning every source"""
+    names = value.split(",") if isinstance(value, str) else value
+    if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+        raise ValueError("sources must be a list of source names")
+    names = [name.strip() for name in names if name.strip()]
+    if "all" in names:
+        return list(SOURCE_FETCHERS)
+    unknown = [name for name in names if name not in SOURCE_FETCHERS]
+    if unknown:
+        raise ValueError(f"Unknown sources: {', '.join(unknown)}")
+    return list(dict.fromkeys(names))
+
+async def typeahead_fetch(source: str, q: str) -> dict:
+    # Prefixes typed past cancel their upstream calls unless another request shares them
+    status, result = await fetch_with_budget(source, q, SOURCE_BUDGETS[source], abandonable=True)
+    return {
+        "source": source,
+        "suggestions": result.suggestions if result else [],
+        "status": status.status,
+        "elapsed_ms": status.elapsed_ms,
+        "error": status.error,
+    }
+
+@api_router.websocket("/suggestions/typeahead")
+async def typeahead_socket(websocket: WebSocket, sources: str = "google"):
+    """Live suggestions as the client types.
     
-    # Get Amazon suggestions
+    The client sends {"q": "...", "sources": [...], "id": ...} whenever the
+    prefix changes (sources and id are optional; sources defaults to the
+    ?sources= given on connect). After TYPEAHEAD_DEBOUNCE seconds without
+    a newer prefix the server fetches it and sends one message per source:
+    {"id", "q", "source", "suggestions", "status", "elapsed_ms", "error"},
+    plus "merged" when several sources are asked. A newer prefix cancels
+    the older one's fetches, so stale results are never sent.
+    """
+    await websocket.accept()
     try:
-        amazon_result = await get_amazon_suggestions(q)
-        results.append(amazon_result)
-    except:
-        pass
+        default_sources = typeahead_sources(sources)
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
     
-    # Get YouTube suggestions
+    session = TypeaheadSession(websocket.send_json, typeahead_fetch, TYPEAHEAD_DEBOUNCE, typeahead_counters)
+    typeahead_counters['connections'] += 1
+    typeahead_sessions.add(session)
     try:
-        youtube_result = await get_youtube_suggestions(q)
-        results.append(youtube_result)
-    except:
+        while True:
+            text = await websocket.receive_text()
+            message = None
+            try:
+                message = json.loads(text)
+                if not isinstance(message, dict) or not isinstance(message.get("q"), str):
+                    raise ValueError('expected {"q": "..."}')
+                if len(message["q"]) > MAX_TYPEAHEAD_QUERY:
+                    raise ValueError(f"q is longer than {MAX_TYPEAHEAD_QUERY} characters")
+                message_sources = (typeahead_sources(message["sources"]) if "sources" in message
+                                   else default_sources)
+            except ValueError as e:
+                typeahead_counters['rejected'] += 1
+                error = 'expected {"q": "..."}' if isinstance(e, json.JSONDecodeError) else str(e)
+                await websocket.send_json({"id": message.get("id") if isinstance(message, dict) else None,
+                                           "error": error})
+                continue
+            session.update(message["q"], message_sources, message.get("id"))
+    except WebSocketDisconnect:
         pass
+    finally:
+        typeahead_sessions.discard(session)
+        await session.close()
+
+@api_router.post("/suggestions/batch", response_model=BatchSuggestionResponse)
+async def get_batch_suggestions(input: BatchSuggestionRequest):
+    """Suggestions for many queries from many sources in one request.
+    
+    Queries run with bounded concurrency through the same cache, rate
+    limiters and per-source budgets as the single-source endpoints. With
+    stream=true the response is NDJSON in the same format as /suggestions/bulk.
+    """
+    unknown = [source for source in input.sources if source not in SOURCE_FETCHERS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown sources: {', '.join(unknown)}")
+    if input.view not in SUGGESTION_VIEWS:
+        raise HTTPException(status_code=400, detail=f"Unknown view: {input.view}")
+    merged = input.view == 'merged'
+    # Blank and repeated queries would only cost upstream calls
+    queries = list(dict.fromkeys(query.strip() for query in input.queries if query.strip()))
+    if not queries:
+        raise HTTPException(status_code=400, detail="No non-empty queries")
+    sources = list(dict.fromkeys(input.sources))
+    lines = fetch_many(queries, sources, BATCH_CONCURRENCY, input.no_cache)
+    
+    if input.stream:
+        return StreamingResponse(ndjson_lines(lines, input.merge or merged), media_type="application/x-ndjson")
+    
+    started = time.perf_counter()
+    grouped = {query: AllSuggestionsResponse(query=query, results=[], sources=[]) for query in queries}
+    ok = failed = 0
+    async for line in lines:
+        group = grouped[line["query"]]
+        group.sources.append(SourceStatus(
+            source=line["source"], status=line["status"],
+            elapsed_ms=line["elapsed_ms"], error=line["error"],
+        ))
+        if line["status"] == "ok":
+            ok += 1
+            group.results.append(SuggestionResponse(
+                query=line["query"], source=line["source"], suggestions=line["suggestions"],
+            ))
+        else:
+            failed += 1
+    # Completion order varies; report sources in request order
+    merger = SuggestionMerger()
+    for group in grouped.values():
+        group.results.sort(key=lambda result: sources.index(result.source))
+        group.sources.sort(key=lambda status: sources.index(status.source))
+        if merged:
+            group.merged = merge_results(group.results)
+            for result in group.results:
+                merger.add(result.source, result.suggestions)
+            group.results = []
+    
+    return BatchSuggestionResponse(
+        results=list(grouped.values()),
+        merged=merger.ranked(),
+        total=ok + failed,
+        ok=ok,
+        failed=failed,
+        elapsed_ms=round((time.perf_counter() - started) * 1000, 1),
+    )
+
+@api_router.post("/jobs", response_model=CrawlJob)
+async def create_crawl_job(input: CrawlJobCreate):
+    """Start a breadth-first crawl that expands every returned suggestion as a new seed"""
+    unknown = [source for source in input.sources if source not in SOURCE_FETCHERS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown sources: {', '.join(unknown)}")
+    sources = list(dict.fromkeys(input.sources))
+    alphabet = "".join(dict.fromkeys(input.alphabet))
+    # Seeds are fetched whole, so a smaller budget would complete without fetching anything
+    seed_cost = (1 + len(alphabet)) * len(sources)
+    if input.max_queries < seed_cost:
+        raise HTTPException(
+            status_code=400,
+            detail=f"max_queries must be at least {seed_cost}, the queries needed to expand one seed",
+        )
+    job = await crawl_jobs.submit(
+        seed=input.seed,
+        sources=sources,
+        alphabet=alphabet,
+        separator=input.separator,
+        max_depth=input.max_depth,
+        max_queries=input.max_queries,
+        concurrency=input.concurrency,
+    )
+    return await get_crawl_job_summary(job['_id'])
+
+@api_router.get("/jobs", response_model=List[CrawlJob])
+async def list_crawl_jobs(limit: int = Query(50, ge=1, le=500)):
+    jobs = await db.crawl_jobs.aggregate([
+        {'$sort': {'created_at': -1}},
+        {'$limit': limit},
+        {'$project': CRAWL_JOB_SUMMARY},
+    ]).to_list(limit)
+    return [CrawlJob(**job) for job in jobs]
+
+@api_router.get("/jobs/{job_id}", response_model=CrawlJob)
+async def get_crawl_job(job_id: str):
+    return await get_crawl_job_summary(job_id)
+
+@api_router.get("/jobs/{job_id}/results", response_model=List[CrawlResult])
+async def get_crawl_job_results(
+    job_id: str,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    results = await db.crawl_results.find(
+        {'job_id': job_id},
+        {'_id': 0, 'query': 1, 'source': 1, 'seed': 1, 'depth': 1, 'suggestions': 1},
+    ).sort([('depth', 1)]).skip(skip).limit(limit).to_list(limit)
+    return [CrawlResult(**result) for result in results]
+
+@api_router.post("/jobs/{job_id}/cancel", response_model=CrawlJob)
+async def cancel_crawl_job(job_id: str):
+    await crawl_jobs.cancel(job_id)
+    return await get_crawl_job_summary(job_id)
+
+@api_router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus text exposition of request, upstream, cache and Mongo metrics"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@api_router.get("/cache/stats")
+async def get_cache_stats():
+    return {**suggestion_cache.stats(), 'worker': WORKER_ID}
+
+@api_router.get("/upstreams/stats")
+async def get_upstream_stats():
+    return {
+        source: {
+            'rate_limiter': rate_limiters[source].stats(),
+            'circuit_breaker': circuit_breakers[source].stats(),
+            'hedging': hedgers[source].stats() if source in hedgers else None,
+        }
+        for source in SOURCES
+    }
+
+@api_router.get("/prefetch/stats")
+async def get_prefetch_stats(top: int = Query(10, ge=0, le=1000, description="Most popular queries to list")):
+    return {
+        **prefetcher.stats(),
+        'worker': WORKER_ID,
+        'revalidating': len(revalidating),
+        'top': [
+            {'source': source, 'query': query, 'score': round(score, 2)}
+            for (source, query), score in popularity.top(top)
+        ],
+    }
+
+@api_router.get("/typeahead/stats")
+async def get_typeahead_stats():
+    return {**typeahead_counters, 'open': len(typeahead_sessions), 'debounce': TYPEAHEAD_DEBOUNCE,
+            'worker': WORKER_ID}
+
+@api_router.get("/singleflight/stats")
+async def get_singleflight_stats():
+    return {**upstream_calls.stats(), 'worker': WORKER_ID}
+
+def seed_pipeline(seed: str, expansions: bool) -> List[dict]:
+    """Aggregation over harvest_seeds yielding the harvested documents of phrases found for seed.
+
+    With expansions, phrases found for queries extending seed count too.
+    """
+    phrase = normalize_phrase(seed)
+    if expansions:
+        # Anchored, so the seed index still serves it; a phrase found for several expansions is one row
+        stages = [{'$match': {'seed': {'$regex': f"^{re.escape(phrase)}"}}}, {'$group': {'_id': '$phrase'}}]
+    else:
+        stages = [{'$match': {'seed': phrase}}, {'$project': {'_id': '$phrase'}}]
+    return stages + [
+        {'$lookup': {'from': db.harvested_suggestions.name, 'localField': '_id', 'foreignField': '_id',
+                     'as': 'phrase'}},
+        {'$unwind': '$phrase'},
+        {'$replaceRoot': {'newRoot': '$phrase'}},
+    ]
+
+async def seed_dataset_summary(pipeline: List[dict]) -> Tuple[str, int]:
+    """(version, rows) of the phrases pipeline yields, before MAX_ANALYTICS_ROWS is applied"""
+    summary = await db.harvest_seeds.aggregate(pipeline + [
+        {'$group': {'_id': None, 'phrases': {'$sum': 1}, 'count': {'$sum': '$count'},
+                    'last_seen': {'$max': '$last_seen'}}},
+    ], allowDiskUse=True).to_list(1)
+    if not summary:
+        return "empty", 0
+    last_seen = summary[0]['last_seen']
+    version = f"{summary[0]['phrases']}:{summary[0]['count']}:{last_seen.isoformat() if last_seen else ''}"
+    return version, summary[0]['phrases']
+
+async def job_dataset_summary(job: dict) -> Tuple[str, int]:
+    """(version, rows) of a crawl's suggestions, before MAX_ANALYTICS_ROWS is applied"""
+    summary = await db.crawl_results.aggregate([
+        {'$match': {'job_id': job['_id']}},
+        {'$group': {'_id': None, 'results': {'$sum': 1},
+                    'suggestions': {'$sum': {'$size': {'$ifNull': ['$suggestions', []]}}}}},
+    ]).to_list(1)
+    results, suggestions = (summary[0]['results'], summary[0]['suggestions']) if summary else (0, 0)
+    return f"{job['status']}:{results}", suggestions
+
+async def load_seed_dataset(pipeline: List[dict]):
+    texts, sources, counts = [], [], []
+    projection = {'_id': 0, 'text': 1, 'sources': 1, 'count': 1}
+    stages = pipeline + [{'$limit': MAX_ANALYTICS_ROWS}, {'$project': projection}]
+    async for doc in db.harvest_seeds.aggregate(stages, allowDiskUse=True, batchSize=5000):
+        texts.append(doc.get('text', ''))
+        sources.append(doc.get('sources', []))
+        counts.append(doc.get('count', 0))
+    return texts, sources, counts
+
+async def load_job_dataset(job_id: str):
+    """Every suggestion a crawl returned, one row per (result, suggestion)"""
+    texts, sources, counts = [], [], []
+    projection = {'_id': 0, 'source': 1, 'suggestions': 1}
+    async for doc in db.crawl_results.find({'job_id': job_id}, projection, batch_size=1000):
+        for text in doc.get('suggestions', [])[:MAX_ANALYTICS_ROWS - len(texts)]:
+            texts.append(text)
+            sources.append([doc['source']])
+            counts.append(1)
+        if len(texts) >= MAX_ANALYTICS_ROWS:
+            break
+    return texts, sources, counts
+
+@api_router.get("/analytics/suggestions")
+async def get_suggestion_analytics(
+    seed: Optional[str] = Query(None, min_length=1, description="Analyze phrases harvested for this seed"),
+    job_id: Optional[str] = Query(None, description="Analyze the suggestions returned by this crawl job"),
+    expansions: bool = Query(True, description="With seed, include queries extending it (bulk expansions)"),
+    top: int = Query(50, ge=1, le=500, description="Entries per ranked list"),
+):
+    """Modifier/n-gram frequencies, source overlap, question words, lengths and token clusters.
+    
+    Results are cached until the underlying data changes, so repeated
+    requests for an unchanged seed or finished job are served from memory.
+    Only the first MAX_ANALYTICS_ROWS rows are analyzed; dataset.truncated
+    says when there were more.
+    """
+    if (seed is None) == (job_id is None):
+        raise HTTPException(status_code=400, detail="Pass exactly one of seed or job_id")
+    started = time.perf_counter()
+    if seed is not None:
+        pipeline = seed_pipeline(seed, expansions)
+        key = f"seed|{'prefix' if expansions else 'exact'}|{normalize_phrase(seed)}"
+        version, rows = await seed_dataset_summary(pipeline)
+        load = lambda: load_seed_dataset(pipeline)
+        dataset_seed = seed
+    else:
+        job = await crawl_jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        key = f"job|{job_id}"
+        version, rows = await job_dataset_summary(job)
+        load = lambda: load_job_dataset(job_id)
+        dataset_seed = job['seed']
+    
+    try:
+        result, cached = await analytics.run(key, version, load, seed=dataset_seed, top=top)
+    except Exception as e:
+        logging.error(f"Analytics failed for {key}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to compute analytics")
+    return {
+        'dataset': {
+            'seed': seed,
+            'job_id': job_id,
+            'version': version,
+            'rows': min(rows, MAX_ANALYTICS_ROWS),
+            'truncated': rows > MAX_ANALYTICS_ROWS,
+        },
+        'cached': cached,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+        **result,
+    }
+
+@api_router.get("/analytics/stats")
+async def get_analytics_stats():
+    return {**analytics.stats(), 'worker': WORKER_ID}
+
+@api_router.get("/export/suggestions")
+async def export_suggestions(
+    format: str = Query("csv", description="csv, ndjson or parquet"),
+    seed: Optional[str] = Query(None, description="Only phrases harvested for this seed"),
+    source: Optional[str] = Query(None, description="Only phrases seen from this source"),
+    since: Optional[datetime] = Query(None, description="Last seen at or after"),
+    until: Optional[datetime] = Query(None, description="Last seen before"),
+    gzip: bool = Query(False, description="Gzip the CSV or NDJSON body"),
+):
+    """Stream harvested suggestions as a file download.
+    
+    Documents are read from a cursor and written out chunk by chunk, so
+    memory use doesn't depend on the size of the export.
+    """
+    if format not in EXPORTERS:
+        raise HTTPException(status_code=400, detail=f"Unknown format: {format}")
+    if source is not None and source not in SOURCE_FETCHERS:
+        raise HTTPException(status_code=400, detail=f"Unknown source: {source}")
+    query = {}
+    if source is not None:
+        query['sources'] = source
+    if since is not None or until is not None:
+        query['last_seen'] = {}
+        if since is not None:
+            query['last_seen']['$gte'] = since
+        if until is not None:
+            query['last_seen']['$lt'] = until
     
-    return results
+    if seed is not None:
+        documents = db.harvest_seeds.aggregate(
+            seed_pipeline(seed, expansions=False) + [{'$match': query}, {'$project': {'_id': 0}}], batchSize=5000,
+        )
+    else:
+        documents = db.harvested_suggestions.find(query, {'_id': 0}, batch_size=5000)
+    body = EXPORTERS[format](documents)
+    filename = f"suggestions.{format}"
+    media_type = EXPORT_MEDIA_TYPES[format]
+    # Parquet is already compressed internally
+    if gzip and format != "parquet":
+        body = gzip_stream(body)
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
+@api_router.get("/writes/stats")
+async def get_write_stats():
+    return {writer.name: writer.stats() for writer in buffered_writers}
 
 @api_router.post("/status", response_model=StatusCheck)
 async def create_status_check(input: StatusCheckCreate):
     status_dict = input.dict()
     status_obj = StatusCheck(**status_dict)
-    _ = await db.status_checks.insert_one(status_obj.dict())
+    # Written with the next batch; it shows up in listings within WRITE_FLUSH_INTERVAL
+    if not status_writer.insert(status_obj.dict()):
+        raise HTTPException(status_code=503, detail="Too many pending writes, retry later")
     return status_obj
 
+# Newest first; ids break ties between checks with the same timestamp
+STATUS_SORT = [('timestamp', -1), ('id', -1)]
+STATUS_PROJECTION = {'_id': 0, 'id': 1, 'client_name': 1, 'timestamp': 1}
+
+def encode_status_cursor(status_check: dict) -> str:
+    position = f"{status_check['timestamp'].isoformat()}|{status_check['id']}"
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+def status_page_filter(cursor: Optional[str]) -> dict:
+    """Keyset filter for checks strictly after the cursor in STATUS_SORT order"""
+    if not cursor:
+        return {}
+    try:
+        timestamp, status_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|', 1)
+        timestamp = datetime.fromisoformat(timestamp)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {'$or': [
+        {'timestamp': {'$lt': timestamp}},
+        {'timestamp': timestamp, 'id': {'$lt': status_id}},
+    ]}
+
+def status_json(status_check: dict) -> str:
+    return json.dumps({**status_check, 'timestamp': status_check['timestamp'].isoformat()})
+
 @api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
-    return [StatusCheck(**status_check) for status_check in status_checks]
+async def get_status_checks(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_STATUS_PAGE,
+                                 description=f"Page size, default {DEFAULT_STATUS_PAGE}"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+    stream: bool = Query(False, description="Stream as NDJSON; without a limit, everything after the cursor"),
+):
+    """Status checks, newest first, one page at a time.
+    
+    The next page starts after the cursor returned in the X-Next-Cursor
+    header, which is absent on the last page. Pages are read through the
+    (timestamp, id) index, so their cost doesn't grow with the collection.
+    """
+    if limit is None and not stream:
+        limit = DEFAULT_STATUS_PAGE
+    status_checks = db.status_checks.find(
+        status_page_filter(cursor), STATUS_PROJECTION, sort=STATUS_SORT,
+        limit=limit or 0, batch_size=limit or MAX_STATUS_PAGE,
+    )
+    
+    if stream:
+        async def lines():
+            async for status_check in status_checks:
+                yield status_json(status_check) + "\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+    
+    with MONGO_OPERATION_SECONDS.time('status_list'):
+        page = await status_checks.to_list(limit)
+    # Stored documents already have the model's shape; skip per-row validation
+    headers = {'X-Next-Cursor': encode_status_cursor(page[-1])} if len(page) == limit else {}
+    return Response(
+        "[" + ",".join(status_json(status_check) for status_check in page) + "]",
+        media_type="application/json",
+        headers=headers,
+    )
+
+# Each worker keeps its own registry and a scrape reaches whichever worker
+# accepts it, so every series carries a worker label; sum without(worker)
+# to aggregate across workers
+REGISTRY.constant_labels['worker'] = WORKER_ID
+
+# Component state exported at scrape time
+REGISTRY.callback('suggestion_cache_events_total', 'Suggestion cache events', 'counter', ['event'],
+                  lambda: {(event,): value for event, value in suggestion_cache.counters.items()})
+REGISTRY.callback('suggestion_cache_entries', 'Entries in the in-process suggestion cache', 'gauge', [],
+                  lambda: {(): suggestion_cache.stats()['entries']})
+REGISTRY.callback('upstream_singleflight_total', 'Upstream fetches started, coalesced and abandoned', 'counter', ['kind'],
+                  lambda: {(kind,): value for kind, value in upstream_calls.counters.items()})
+REGISTRY.callback('upstream_rate_limit', 'Current per-source rate limit in requests/second', 'gauge', ['source'],
+                  lambda: {(source,): limiter.stats()['rate'] for source, limiter in rate_limiters.items()})
+REGISTRY.callback('upstream_rate_limiter_events_total', 'Rate limiter events', 'counter', ['source', 'event'],
+                  lambda: {(source, event): value
+                           for source, limiter in rate_limiters.items()
+                           for event, value in limiter.counters.items()})
+REGISTRY.callback('upstream_circuit_open', '1 while the circuit breaker is open or half-open', 'gauge', ['source'],
+                  lambda: {(source,): float(breaker.stats()['state'] != 'closed')
+                           for source, breaker in circuit_breakers.items()})
+REGISTRY.callback('upstream_hedges_total', 'Hedged upstream calls by outcome', 'counter', ['source', 'event'],
+                  lambda: {(source, event): value
+                           for source, hedger in hedgers.items()
+                           for event, value in hedger.counters.items()})
+REGISTRY.callback('upstream_hedge_delay_seconds', 'Current hedge delay', 'gauge', ['source'],
+                  lambda: {(source,): hedger.delay() for source, hedger in hedgers.items()})
+REGISTRY.callback('prefix_index_phrases', 'Phrases in the local prefix index', 'gauge', [],
+                  lambda: {(): len(prefix_index)})
+REGISTRY.callback('buffered_writes_pending', 'Writes queued or in flight per writer', 'gauge', ['writer'],
+                  lambda: {(writer.name,): writer.pending for writer in buffered_writers})
+REGISTRY.callback('buffered_writes_total', 'Buffered writer events', 'counter', ['writer', 'event'],
+                  lambda: {(writer.name, event): value
+                           for writer in buffered_writers
+                           for event, value in writer.counters.items()})
+REGISTRY.callback('process_startup_seconds', 'Seconds from import to serving for this worker', 'gauge', [],
+                  lambda: {(): startup_seconds} if startup_seconds is not None else {})
+REGISTRY.callback('prefetch_total', 'Prefetcher events', 'counter', ['event'],
+                  lambda: {(event,): value for event, value in prefetcher.counters.items()})
+REGISTRY.callback('popularity_tracked_queries', 'Queries tracked for popularity', 'gauge', [],
+                  lambda: {(): len(popularity)})
+REGISTRY.callback('typeahead_total', 'Typeahead WebSocket events', 'counter', ['event'],
+                  lambda: {(event,): value for event, value in typeahead_counters.items()})
+REGISTRY.callback('typeahead_sessions', 'Open typeahead WebSocket connections', 'gauge', [],
+                  lambda: {(): len(typeahead_sessions)})
+REGISTRY.callback('analytics_total', 'Suggestion analytics runs and cache hits', 'counter', ['event'],
+                  lambda: {(event,): value for event, value in analytics.counters.items()})
+REGISTRY.callback('crawl_jobs_running', 'Crawl jobs running in this process', 'gauge', [],
+                  lambda: {(): len(crawl_jobs.tasks)})
 
 # Include the router in the main app
 app.include_router(api_router)
 
+app.add_middleware(MetricsMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Configure logging
@@ -250,7 +1438,84 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
+# httpx logs every upstream request at INFO
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+async def ensure_indexes():
+    """Create indexes; idempotent, so every worker runs it, off the startup path"""
+    await suggestion_cache.ensure_indexes()
+    await refresh_claims.ensure_indexes()
+    try:
+        await db.status_checks.create_index(STATUS_SORT)
+    except Exception as e:
+        logging.error(f"Could not create status check index: {str(e)}")
+    # Seed and export filters; phrases are looked up by _id everywhere else
+    try:
+        await db.harvested_suggestions.create_index('last_seen')
+        await db.harvest_seeds.create_index([('seed', 1), ('phrase', 1)])
+    except Exception as e:
+        logging.error(f"Could not create harvested suggestion indexes: {str(e)}")
+    try:
+        await db.query_log.create_index('at', expireAfterSeconds=QUERY_LOG_TTL)
+    except Exception as e:
+        logging.error(f"Could not create query log index: {str(e)}")
+
+@app.on_event("startup")
+async def startup_http_client():
+    global http_client
+    http_client = httpx.AsyncClient(
+        headers=UPSTREAM_HEADERS,
+        timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+            keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+@app.on_event("startup")
+async def startup_indexes():
+    run_in_background(ensure_indexes())
+
+@app.on_event("startup")
+async def startup_buffered_writers():
+    for writer in buffered_writers:
+        writer.start()
+
+@app.on_event("startup")
+async def startup_prefix_index():
+    global prefix_index_task
+    # Serve from the partial index while the rest loads
+    prefix_index_task = asyncio.ensure_future(maintain_prefix_index())
+
+@app.on_event("startup")
+async def startup_crawl_jobs():
+    crawl_jobs.start()
+
+@app.on_event("startup")
+async def startup_prefetch():
+    run_in_background(load_popularity())
+    if PREFETCH:
+        prefetcher.start()
+
+@app.on_event("startup")
+async def startup_complete():
+    global startup_seconds
+    startup_seconds = time.perf_counter() - STARTED_AT
+    log = logging.warning if startup_seconds > STARTUP_BUDGET else logging.info
+    log(f"Worker {WORKER_ID} ready in {startup_seconds * 1000:.0f} ms (budget {STARTUP_BUDGET * 1000:.0f} ms)")
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    await crawl_jobs.shutdown()
+    await prefetcher.shutdown()
+    if prefix_index_task is not None:
+        prefix_index_task.cancel()
+    analytics.shutdown()
+    if background_tasks:
+        await asyncio.wait(background_tasks, timeout=5)
+    # Anything still queued is written before the connection goes away
+    await asyncio.gather(*(writer.close() for writer in buffered_writers))
+    client.close()
+    if http_client is not None:
+        await http_client.aclose()
\ No newline at end of file
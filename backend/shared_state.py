@@ -0,0 +1,78 @@
+import os
+import mmap
+import struct
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Sequence
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - no record locks on Windows, state stays per process
+    fcntl = None
+
+# Each slot is a "written" flag followed by its float fields
+FIELDS_PER_SLOT = 8
+SLOT = struct.Struct(f'{FIELDS_PER_SLOT + 1}d')
+
+
+class SlotRecord:
+    def __init__(self, values: Optional[List[float]]):
+        # None until some process first stores the slot
+        self.values = values
+
+
+class SharedSlot:
+    def __init__(self, state: 'SharedStateFile', offset: int):
+        self.state = state
+        self.offset = offset
+
+    @contextmanager
+    def locked(self) -> Iterator[SlotRecord]:
+        """Exclusive access to the slot across processes; record.values is written back on exit.
+
+        The lock is a POSIX record lock, which is per process, so callers
+        must not await while holding it.
+        """
+        fd = self.state.fd
+        fcntl.lockf(fd, fcntl.LOCK_EX, SLOT.size, self.offset)
+        try:
+            written, *values = SLOT.unpack_from(self.state.map, self.offset)
+            record = SlotRecord(values if written else None)
+            try:
+                yield record
+            finally:
+                if record.values is not None:
+                    padding = [0.0] * (FIELDS_PER_SLOT - len(record.values))
+                    SLOT.pack_into(self.state.map, self.offset, 1.0, *record.values, *padding)
+        finally:
+            fcntl.lockf(fd, fcntl.LOCK_UN, SLOT.size, self.offset)
+
+
+class SharedStateFile:
+    """Named slots of up to eight floats in a memory-mapped file.
+
+    Every worker process on the host opening the same path sees the same
+    slots, so state kept there (e.g. token buckets) is shared between
+    uvicorn workers rather than multiplied by their number. The file is
+    reset if its layout doesn't match the names given.
+    """
+
+    def __init__(self, path: str, names: Sequence[str]):
+        self.path = path
+        self.names = list(names)
+        size = SLOT.size * len(self.names)
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.lockf(self.fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self.fd).st_size != size:
+                os.ftruncate(self.fd, 0)
+                os.ftruncate(self.fd, size)
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN)
+        self.map = mmap.mmap(self.fd, size)
+
+    @staticmethod
+    def supported() -> bool:
+        return fcntl is not None
+
+    def slot(self, name: str) -> SharedSlot:
+        return SharedSlot(self, SLOT.size * self.names.index(name))
@@ -0,0 +1,68 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, TypeVar
+
+T = TypeVar('T')
+
+
+class _Call:
+    __slots__ = ('future', 'waiters', 'cancel_abandoned')
+
+    def __init__(self, future: asyncio.Future, cancel_abandoned: bool):
+        self.future = future
+        self.waiters = 0
+        self.cancel_abandoned = cancel_abandoned
+
+
+class SingleFlight:
+    """Share one in-flight call between concurrent callers asking for the same key.
+
+    Every caller gets the shared call's result or exception. The call is
+    shielded, so a caller timing out or disconnecting doesn't cancel it for
+    the others. If every caller passed cancel_abandoned, the call is
+    cancelled once the last of them is, since nobody wants the result.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self.counters: Dict[str, int] = {
+            'calls': 0,
+            'coalesced': 0,
+            'abandoned': 0,
+        }
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]], cancel_abandoned: bool = False) -> T:
+        call = self._calls.get(key)
+        if call is not None:
+            self.counters['coalesced'] += 1
+            # One caller that needs the result keeps the call going
+            call.cancel_abandoned = call.cancel_abandoned and cancel_abandoned
+        else:
+            self.counters['calls'] += 1
+            call = _Call(asyncio.ensure_future(fn()), cancel_abandoned)
+            self._calls[key] = call
+            call.future.add_done_callback(lambda done: self._forget(key, done))
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.future)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and call.cancel_abandoned and not call.future.done():
+                self.counters['abandoned'] += 1
+                call.future.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _forget(self, key: str, future: asyncio.Future):
+        call = self._calls.get(key)
+        if call is not None and call.future is future:
+            del self._calls[key]
+        # Mark the error as retrieved in case every caller has gone away
+        if not future.cancelled():
+            future.exception()
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            'in_flight': len(self._calls),
+        }
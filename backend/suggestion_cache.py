@@ -0,0 +1,209 @@
+import time
+import logging
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from pymongo.errors import OperationFailure
+
+from metrics import MONGO_OPERATION_SECONDS
+
+INDEX_OPTIONS_CONFLICT = 85
+
+
+def normalize_query(q: str) -> str:
+    """Normalize a query for cache lookups.
+
+    Case, Unicode form and runs of whitespace don't change what the
+    upstreams suggest, but a trailing space does ("python " asks for the
+    next word), so it is kept.
+    """
+    text = unicodedata.normalize('NFKC', q).lower()
+    normalized = " ".join(text.split())
+    if text[-1:].isspace() and normalized:
+        normalized += " "
+    return normalized
+
+def cache_key(source: str, q: str, market: str = "") -> str:
+    return f"{source}|{market}|{normalize_query(q)}"
+
+
+class CacheHit(NamedTuple):
+    suggestions: List[str]
+    # Past the TTL but within the grace window; serve it, then refresh it
+    stale: bool
+
+
+class SuggestionCache:
+    """In-process LRU with TTL in front of a MongoDB collection with a TTL index.
+
+    Both tiers share one TTL: an entry promoted from MongoDB keeps its
+    original age, so it expires locally when it would have in MongoDB.
+    For grace seconds past the TTL an entry is still returned by get(),
+    flagged stale, so callers can answer at once and refresh it behind
+    the response; MongoDB only drops documents after ttl + grace.
+
+    With a writer (a BufferedWriter on the same collection), set() queues
+    the MongoDB write instead of waiting for it, so other workers see an
+    entry up to one flush later.
+    """
+
+    def __init__(self, collection, max_entries: int = 10000, ttl: float = 3600, grace: float = 0,
+                 writer=None):
+        self.collection = collection
+        self.writer = writer
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.grace = grace
+        # key -> (stored_at monotonic seconds, suggestions)
+        self._entries: "OrderedDict[str, Tuple[float, List[str]]]" = OrderedDict()
+        self.counters: Dict[str, int] = {
+            'hits': 0,
+            'misses': 0,
+            'mongo_hits': 0,
+            'mongo_misses': 0,
+            'mongo_errors': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'stale_hits': 0,
+            'grace_hits': 0,
+            'sets': 0,
+        }
+
+    async def ensure_indexes(self):
+        expire_after = int(self.ttl + self.grace)
+        try:
+            await self.collection.create_index('created_at', expireAfterSeconds=expire_after)
+        except OperationFailure as e:
+            if e.code != INDEX_OPTIONS_CONFLICT:
+                logging.error(f"Could not create suggestion cache index: {str(e)}")
+                return
+            # The TTL or grace setting changed since the index was built
+            try:
+                await self.collection.database.command(
+                    'collMod', self.collection.name,
+                    index={'keyPattern': {'created_at': 1}, 'expireAfterSeconds': expire_after},
+                )
+            except Exception as e:
+                logging.error(f"Could not update suggestion cache index: {str(e)}")
+        except Exception as e:
+            logging.error(f"Could not create suggestion cache index: {str(e)}")
+
+    def get_local(self, key: str, allow_stale: bool = False) -> Optional[List[str]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, suggestions = entry
+        # Expired entries stay until evicted so they can be served stale
+        if time.monotonic() - stored_at > self.ttl and not allow_stale:
+            self.counters['expirations'] += 1
+            return None
+        self._entries.move_to_end(key)
+        return suggestions
+
+    def _local_hit(self, key: str) -> Optional[CacheHit]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, suggestions = entry
+        age = time.monotonic() - stored_at
+        if age > self.ttl + self.grace:
+            self.counters['expirations'] += 1
+            return None
+        self._entries.move_to_end(key)
+        return CacheHit(suggestions, age > self.ttl)
+
+    def set_local(self, key: str, suggestions: List[str], stored_at: Optional[float] = None):
+        self._entries[key] = (time.monotonic() if stored_at is None else stored_at, suggestions)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.counters['evictions'] += 1
+
+    async def get(self, key: str) -> Optional[CacheHit]:
+        local = self._local_hit(key)
+        if local is not None and not local.stale:
+            self.counters['hits'] += 1
+            return local
+        self.counters['misses'] += 1
+
+        # A stale local copy may have been refreshed in MongoDB by another worker
+        try:
+            with MONGO_OPERATION_SECONDS.time('cache_find'):
+                doc = await self.collection.find_one({'_id': key}, {'suggestions': 1, 'created_at': 1})
+        except Exception as e:
+            self.counters['mongo_errors'] += 1
+            logging.error(f"Suggestion cache read failed: {str(e)}")
+            doc = None
+        # The TTL monitor only sweeps once a minute, so check the age here too
+        age = (datetime.utcnow() - doc['created_at']).total_seconds() if doc else None
+        if age is None or age > self.ttl + self.grace:
+            self.counters['mongo_misses'] += 1
+            hit = local
+        else:
+            self.counters['mongo_hits'] += 1
+            self.set_local(key, doc['suggestions'], stored_at=time.monotonic() - age)
+            hit = CacheHit(doc['suggestions'], age > self.ttl)
+        if hit is not None and hit.stale:
+            self.counters['grace_hits'] += 1
+        return hit
+
+    async def age(self, key: str) -> Optional[float]:
+        """Seconds since key was last stored by any worker, or None if it isn't; not counted as a lookup"""
+        try:
+            with MONGO_OPERATION_SECONDS.time('cache_find'):
+                doc = await self.collection.find_one({'_id': key}, {'created_at': 1})
+        except Exception as e:
+            self.counters['mongo_errors'] += 1
+            logging.error(f"Suggestion cache read failed: {str(e)}")
+            entry = self._entries.get(key)
+            return time.monotonic() - entry[0] if entry else None
+        return (datetime.utcnow() - doc['created_at']).total_seconds() if doc else None
+
+    async def get_stale(self, key: str) -> Optional[List[str]]:
+        """Any stored entry for key regardless of age, for when the upstream can't be asked"""
+        suggestions = self.get_local(key, allow_stale=True)
+        if suggestions is not None:
+            self.counters['stale_hits'] += 1
+            return suggestions
+        try:
+            with MONGO_OPERATION_SECONDS.time('cache_find'):
+                doc = await self.collection.find_one({'_id': key}, {'suggestions': 1})
+        except Exception as e:
+            self.counters['mongo_errors'] += 1
+            logging.error(f"Suggestion cache read failed: {str(e)}")
+            return None
+        if doc is None:
+            return None
+        self.counters['stale_hits'] += 1
+        return doc['suggestions']
+
+    async def set(self, key: str, source: str, query: str, suggestions: List[str]):
+        self.counters['sets'] += 1
+        self.set_local(key, suggestions)
+        doc = {
+            'source': source,
+            'query': query,
+            'suggestions': suggestions,
+            'created_at': datetime.utcnow(),
+        }
+        if self.writer is not None:
+            # Dropped when the writer is full; this worker still has it locally
+            self.writer.upsert(key, {'$set': doc})
+            return
+        try:
+            with MONGO_OPERATION_SECONDS.time('cache_store'):
+                await self.collection.replace_one({'_id': key}, doc, upsert=True)
+        except Exception as e:
+            self.counters['mongo_errors'] += 1
+            logging.error(f"Suggestion cache write failed: {str(e)}")
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'grace': self.grace,
+        }
@@ -0,0 +1,59 @@
+from typing import Dict, Iterable, List, Optional
+
+from prefix_index import normalize_phrase
+
+
+class MergedPhrase:
+    __slots__ = ('text', 'sources', 'count', 'order')
+
+    def __init__(self, text: str, order: int):
+        self.text = text
+        self.sources: Dict[str, None] = {}  # Insertion-ordered set
+        self.count = 0
+        self.order = order
+
+    def to_dict(self) -> dict:
+        return {'text': self.text, 'sources': list(self.sources), 'count': self.count}
+
+
+class SuggestionMerger:
+    """Merges suggestions from many (query, source) results into one ranked list.
+
+    Phrases are keyed by their normalized form (Unicode, case, whitespace),
+    so "Python  Tutorial" from Google and "python tutorial" from YouTube are
+    one phrase seen from two sources. The first spelling seen is the one
+    shown. Ranking is by number of sources, then number of results the
+    phrase appeared in, then first appearance.
+    """
+
+    def __init__(self):
+        self.phrases: Dict[str, MergedPhrase] = {}
+
+    def add(self, source: str, suggestions: Iterable[str]) -> List[str]:
+        """Record one result, returning the phrases not seen before"""
+        new = []
+        seen_here = set()
+        for suggestion in suggestions:
+            key = normalize_phrase(suggestion)
+            if not key or key in seen_here:
+                continue
+            seen_here.add(key)
+            phrase = self.phrases.get(key)
+            if phrase is None:
+                phrase = self.phrases[key] = MergedPhrase(suggestion.strip(), len(self.phrases))
+                new.append(phrase.text)
+            phrase.sources[source] = None
+            phrase.count += 1
+        return new
+
+    def ranked(self, limit: Optional[int] = None) -> List[dict]:
+        phrases = sorted(
+            self.phrases.values(),
+            key=lambda phrase: (-len(phrase.sources), -phrase.count, phrase.order),
+        )
+        if limit is not None:
+            phrases = phrases[:limit]
+        return [phrase.to_dict() for phrase in phrases]
+
+    def __len__(self) -> int:
+        return len(self.phrases)
@@ -0,0 +1,293 @@
+import abc
+import math
+import time
+import asyncio
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from shared_state import SharedSlot
+
+
+class UpstreamUnavailable(Exception):
+    """The upstream is not being called right now"""
+
+class RateLimited(UpstreamUnavailable):
+    pass
+
+class CircuitOpen(UpstreamUnavailable):
+    pass
+
+
+class SharedState(abc.ABC):
+    """Base for objects keeping their state in a SharedSlot, when given one.
+
+    Every method touching state runs inside _synced(), which loads the slot
+    into the object under the slot's lock and stores it back afterwards.
+    The slot also holds the settings the state was built under, and state
+    stored under other settings (e.g. before a restart with new limits) is
+    ignored and overwritten. Without a slot the state is simply per process.
+    """
+    shared: Optional[SharedSlot] = None
+
+    @abc.abstractmethod
+    def _shared_config(self) -> List[float]:
+        """Settings the shared state is only valid for"""
+
+    @abc.abstractmethod
+    def _shared_values(self) -> List[float]:
+        pass
+
+    @abc.abstractmethod
+    def _load_shared(self, values: List[float]):
+        pass
+
+    @contextmanager
+    def _synced(self):
+        if self.shared is None:
+            yield
+            return
+        config = [float(value) for value in self._shared_config()]
+        with self.shared.locked() as record:
+            if record.values is not None and record.values[:len(config)] == config:
+                self._load_shared(record.values[len(config):])
+            try:
+                yield
+            finally:
+                record.values = config + self._shared_values()
+
+    def _reload(self):
+        """Pick up changes made by other processes"""
+        with self._synced():
+            pass
+
+
+class AdaptiveRateLimiter(SharedState):
+    """Token bucket whose rate backs off on 429s and slow responses.
+
+    The rate is halved on a 429, cut by 10% on a slow response or timeout
+    and raised by a fixed step on every fast success (AIMD), between
+    min_rate and max_rate. Callers wait for a token up to max_wait seconds, after which
+    RateLimited is raised instead of queueing further.
+    """
+
+    def __init__(self, rate: float, burst: float, min_rate: float, max_rate: float,
+                 slow_threshold: float, max_wait: float, increase_step: float = 0.5,
+                 shared: Optional[SharedSlot] = None):
+        self.initial_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.slow_threshold = slow_threshold
+        self.max_wait = max_wait
+        self.increase_step = increase_step
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.shared = shared
+        self.counters: Dict[str, int] = {
+            'throttled': 0,
+            'slow': 0,
+            'rejected': 0,
+        }
+
+    def _shared_config(self) -> List[float]:
+        return [self.initial_rate, self.burst, self.min_rate, self.max_rate]
+
+    def _shared_values(self) -> List[float]:
+        return [self.tokens, self.updated_at, self.rate]
+
+    def _load_shared(self, values: List[float]):
+        self.tokens, self.updated_at, self.rate = values[:3]
+
+    def _refill(self):
+        now = time.monotonic()
+        # max() guards against a bucket last touched before a reboot
+        self.tokens = min(self.burst, self.tokens + max(0.0, now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        with self._synced():
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            wait = (1 - self.tokens) / self.rate
+            if wait > self.max_wait:
+                self.counters['rejected'] += 1
+                raise RateLimited(f"rate limit reached ({self.rate:.1f}/s)")
+            # Take the token now (going negative) so later callers queue behind us
+            self.tokens -= 1
+        try:
+            await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            # Given up before it was used, e.g. a superseded typeahead prefix
+            self.release()
+            raise
+
+    def release(self):
+        """Give back a token that was acquired but not used"""
+        with self._synced():
+            self._refill()
+            self.tokens = min(self.burst, self.tokens + 1)
+
+    def try_acquire(self) -> bool:
+        """Take a token only if one is free right now, never waiting"""
+        with self._synced():
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def available(self) -> float:
+        """Tokens free right now, without taking any"""
+        with self._synced():
+            self._refill()
+            return self.tokens
+
+    def on_success(self, elapsed: float):
+        if elapsed > self.slow_threshold:
+            self.on_slow()
+            return
+        with self._synced():
+            self._set_rate(self.rate + self.increase_step)
+
+    def on_slow(self):
+        """A response took longer than slow_threshold, or never came"""
+        with self._synced():
+            self.counters['slow'] += 1
+            self._set_rate(self.rate * 0.9)
+
+    def on_throttled(self):
+        with self._synced():
+            self.counters['throttled'] += 1
+            self._set_rate(self.rate * 0.5)
+            # Drop the saved-up burst too, or it keeps hammering the upstream
+            self.tokens = min(self.tokens, 1)
+
+    def _set_rate(self, rate: float):
+        self._refill()
+        self.rate = max(self.min_rate, min(self.max_rate, rate))
+
+    def stats(self) -> dict:
+        with self._synced():
+            self._refill()
+        return {
+            **self.counters,
+            'rate': round(self.rate, 2),
+            'tokens': round(self.tokens, 2),
+        }
+
+
+BREAKER_STATES = ('closed', 'open', 'half_open')
+
+
+class CircuitBreaker(SharedState):
+    """Fails fast after consecutive upstream failures.
+
+    After failure_threshold failures in a row the circuit opens for
+    reset_timeout seconds. It then lets a single trial call through
+    (half-open): success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, shared: Optional[SharedSlot] = None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_started_at: Optional[float] = None
+        self.shared = shared
+        self.counters: Dict[str, int] = {
+            'opened': 0,
+            'rejected': 0,
+        }
+
+    def _shared_config(self) -> List[float]:
+        return [self.failure_threshold, self.reset_timeout]
+
+    def _shared_values(self) -> List[float]:
+        trial_started_at = math.nan if self.trial_started_at is None else self.trial_started_at
+        return [BREAKER_STATES.index(self.state), self.failures, self.opened_at, trial_started_at]
+
+    def _load_shared(self, values: List[float]):
+        state, failures, self.opened_at, trial_started_at = values[:4]
+        self.state = BREAKER_STATES[int(state)]
+        self.failures = int(failures)
+        self.trial_started_at = None if math.isnan(trial_started_at) else trial_started_at
+
+    def allow(self) -> bool:
+        with self._synced():
+            return self._allow()
+
+    def _allow(self) -> bool:
+        if self.state == 'closed':
+            return True
+        now = time.monotonic()
+        if self._rejecting(now):
+            self.counters['rejected'] += 1
+            return False
+        # Open past reset_timeout, or a trial that never reported back: this call is the trial
+        self.state = 'half_open'
+        self.trial_started_at = now
+        return True
+
+    def _rejecting(self, now: float) -> bool:
+        """Whether a call must be turned away, without changing state"""
+        if self.state == 'open':
+            return self._within_timeout(now, self.opened_at)
+        if self.state == 'half_open':
+            return self.trial_started_at is not None and self._within_timeout(now, self.trial_started_at)
+        return False
+
+    def _within_timeout(self, now: float, since: float) -> bool:
+        # A time ahead of now was stored before a reboot reset the monotonic clock; treat it as expired
+        return 0.0 <= now - since < self.reset_timeout
+
+    def precheck(self):
+        """Raise CircuitOpen if check() would, without claiming the half-open trial.
+
+        Cheap enough to run before waiting for a rate limit token, so calls
+        fail fast while the circuit is open.
+        """
+        with self._synced():
+            if self._rejecting(time.monotonic()):
+                self.counters['rejected'] += 1
+                raise CircuitOpen("circuit open after repeated upstream failures")
+
+    def check(self) -> bool:
+        """Raise CircuitOpen unless a call may go out; True if it is the half-open trial"""
+        with self._synced():
+            if not self._allow():
+                raise CircuitOpen("circuit open after repeated upstream failures")
+            return self.state == 'half_open'
+
+    def release_trial(self):
+        """Let another caller make the half-open trial, when the call holding it never went out"""
+        with self._synced():
+            if self.state == 'half_open':
+                self.trial_started_at = None
+
+    def record_success(self):
+        with self._synced():
+            self.state = 'closed'
+            self.failures = 0
+            self.trial_started_at = None
+
+    def record_failure(self):
+        with self._synced():
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.counters['opened'] += 1
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self.trial_started_at = None
+
+    def stats(self) -> dict:
+        self._reload()
+        return {
+            **self.counters,
+            'state': self.state,
+            'failures': self.failures,
+        }
@@ -0,0 +1,77 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from suggestion_merge import SuggestionMerger
+
+
+class TypeaheadSession:
+    """Live suggestions for one client typing a query.
+
+    Each update() replaces the previous prefix: its pending debounce or
+    in-flight fetches are cancelled, so only a prefix the client pauses on
+    for debounce seconds is fetched, and only results for the latest
+    prefix are sent. Results are sent per source as they arrive; with more
+    than one source each message also carries the merged ranking so far.
+    """
+
+    def __init__(self, send: Callable[[dict], Awaitable[None]],
+                 fetch: Callable[[str, str], Awaitable[dict]],
+                 debounce: float = 0.15, counters: Optional[Dict[str, int]] = None):
+        self.send = send
+        self.fetch = fetch
+        self.debounce = debounce
+        self.counters = counters if counters is not None else {}
+        self._task: Optional[asyncio.Task] = None
+        # Whether the current task is past its debounce
+        self._fetching = False
+
+    def _count(self, event: str):
+        self.counters[event] = self.counters.get(event, 0) + 1
+
+    def update(self, q: str, sources: List[str], request_id=None):
+        self._count('prefixes')
+        self._supersede()
+        if q.strip() and sources:
+            self._fetching = False
+            self._task = asyncio.ensure_future(self._run(q, sources, request_id))
+
+    def _supersede(self):
+        task, self._task = self._task, None
+        if task is None:
+            return
+        if not task.done():
+            self._count('cancelled' if self._fetching else 'debounced')
+            task.cancel()
+        elif not task.cancelled():
+            # e.g. a send to a client that has gone away; the socket's
+            # receive loop deals with that
+            task.exception()
+
+    async def _run(self, q: str, sources: List[str], request_id):
+        await asyncio.sleep(self.debounce)
+        self._fetching = True
+
+        merger = SuggestionMerger() if len(sources) > 1 else None
+        tasks = [asyncio.ensure_future(self.fetch(source, q)) for source in sources]
+        self._count('fetched')
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                line = await next_done
+                message = {'id': request_id, 'q': q, **line}
+                if merger is not None:
+                    merger.add(line['source'], line['suggestions'])
+                    message['merged'] = merger.ranked()
+                await self.send(message)
+                self._count('sent')
+        finally:
+            # Typed past: the upstream calls may be dropped too
+            for task in tasks:
+                task.cancel()
+
+    async def close(self):
+        task = self._task
+        self._supersede()
+        if task is not None:
+            await asyncio.wait({task})
+            if not task.cancelled():
+                task.exception()
@@ -0,0 +1,200 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import InsertOne, UpdateOne
+
+from metrics import MONGO_OPERATION_SECONDS
+
+
+def merge_updates(first: dict, second: dict) -> dict:
+    """Combine two update documents into one with the effect of applying both.
+
+    Handles the operators the buffered writers use: $inc adds up, $set keeps
+    the later value, $setOnInsert the earlier one, $addToSet unions,
+    $max/$min keep the larger/smaller value.
+    """
+    merged = {operator: dict(fields) for operator, fields in first.items()}
+    for operator, fields in second.items():
+        target = merged.setdefault(operator, {})
+        for field, value in fields.items():
+            if field not in target:
+                target[field] = value
+            elif operator == '$inc':
+                target[field] += value
+            elif operator == '$set':
+                target[field] = value
+            elif operator == '$setOnInsert':
+                pass
+            elif operator == '$addToSet':
+                values = _each(target[field])
+                values.extend(item for item in _each(value) if item not in values)
+                target[field] = {'$each': values}
+            elif operator == '$max':
+                target[field] = max(target[field], value)
+            elif operator == '$min':
+                target[field] = min(target[field], value)
+            else:
+                raise ValueError(f"Can't merge {operator} updates")
+    return merged
+
+def _each(value) -> list:
+    if isinstance(value, dict) and '$each' in value:
+        return list(value['$each'])
+    return [value]
+
+
+class BufferedWriter:
+    """Queues writes to one collection and flushes them as unordered bulk writes.
+
+    A flush runs once max_batch writes are pending or flush_interval seconds
+    after the last one, whichever comes first. Upserts to the same _id that
+    are still pending are merged into one, so hot documents cost one write
+    per flush however often they change, and a batch never holds two
+    upserts racing on one _id.
+
+    upsert(), update() and insert() never wait: callers on the request path
+    get False when max_pending writes are already queued or in flight and
+    the write is dropped. Bulk producers should await wait_for_space()
+    first instead.
+    """
+
+    def __init__(self, name: str, collection, max_batch: int = 500, flush_interval: float = 1,
+                 max_pending: int = 20000):
+        self.name = name
+        self.collection = collection
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._upserts: Dict[object, dict] = {}
+        # (_id, repr of the condition) -> (condition, update)
+        self._updates: Dict[Tuple[object, str], Tuple[dict, dict]] = {}
+        self._inserts: List[dict] = []
+        self._in_flight = 0
+        self._batch_ready = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.counters: Dict[str, int] = {
+            'queued': 0,
+            'merged': 0,
+            'dropped': 0,
+            'written': 0,
+            'failed': 0,
+            'flushes': 0,
+        }
+
+    @property
+    def pending(self) -> int:
+        return self._queued_count() + self._in_flight
+
+    def _queued_count(self) -> int:
+        return len(self._upserts) + len(self._updates) + len(self._inserts)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    def upsert(self, _id, update: dict) -> bool:
+        """Queue an upsert of document _id, merged with any pending one"""
+        pending = self._upserts.get(_id)
+        if pending is not None:
+            self._upserts[_id] = merge_updates(pending, update)
+            self.counters['merged'] += 1
+            return True
+        if not self._has_room():
+            return False
+        self._upserts[_id] = update
+        self._queued()
+        return True
+
+    def update(self, _id, update: dict, condition: dict) -> bool:
+        """Queue an update of document _id that only applies while it matches condition; never inserts.
+
+        Pending updates with the same _id and condition are merged. Within a
+        flush it may run before the batch's upsert of _id, so it should only
+        add to what the upsert sets on insert.
+        """
+        key = (_id, repr(condition))
+        pending = self._updates.get(key)
+        if pending is not None:
+            self._updates[key] = (condition, merge_updates(pending[1], update))
+            self.counters['merged'] += 1
+            return True
+        if not self._has_room():
+            return False
+        self._updates[key] = (condition, update)
+        self._queued()
+        return True
+
+    def insert(self, document: dict) -> bool:
+        if not self._has_room():
+            return False
+        self._inserts.append(document)
+        self._queued()
+        return True
+
+    async def wait_for_space(self):
+        while self.pending >= self.max_pending and not self._closing:
+            self._space.clear()
+            await self._space.wait()
+
+    async def close(self):
+        """Flush everything queued and stop"""
+        self._closing = True
+        self._batch_ready.set()
+        self._space.set()
+        if self._task is not None:
+            await self._task
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            'pending': self.pending,
+            'max_pending': self.max_pending,
+        }
+
+    def _has_room(self) -> bool:
+        if self._closing or self.pending >= self.max_pending:
+            self.counters['dropped'] += 1
+            return False
+        return True
+
+    def _queued(self):
+        self.counters['queued'] += 1
+        if self._queued_count() >= self.max_batch:
+            self._batch_ready.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            await self._flush()
+            if self._closing and not self._queued_count():
+                return
+
+    async def _flush(self):
+        operations = [UpdateOne({'_id': _id}, update, upsert=True) for _id, update in self._upserts.items()]
+        operations.extend(UpdateOne({'_id': _id, **condition}, update)
+                          for (_id, _), (condition, update) in self._updates.items())
+        operations.extend(InsertOne(document) for document in self._inserts)
+        self._upserts = {}
+        self._updates = {}
+        self._inserts = []
+        self._in_flight = len(operations)
+        for start in range(0, len(operations), self.max_batch):
+            batch = operations[start:start + self.max_batch]
+            try:
+                with MONGO_OPERATION_SECONDS.time(f'{self.name}_flush'):
+                    await self.collection.bulk_write(batch, ordered=False)
+                self.counters['written'] += len(batch)
+            except Exception as e:
+                self.counters['failed'] += len(batch)
+                logging.error(f"Failed to write {len(batch)} buffered {self.name} writes: {str(e)}")
+            self.counters['flushes'] += 1
+            self._in_flight -= len(batch)
+            self._space.set()
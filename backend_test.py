@@ -79,15 +79,24 @@ def test_endpoint(endpoint: str, query: str, expected_source: str) -> Tuple[bool
         
         # Check response structure for 'all' endpoint
         else:
-            if not isinstance(data, list):
-                return False, f"Error: Expected list response for 'all' endpoint, got {type(data)}"
+            if not isinstance(data, dict):
+                return False, f"Error: Expected dictionary response for 'all' endpoint, got {type(data)}"
+            
+            for field in ['query', 'results', 'sources', 'merged']:
+                if field not in data:
+                    return False, f"Error: Missing required field '{field}' in 'all' response"
+            
+            # Merged phrases are deduplicated case-insensitively across sources
+            merged_texts = [" ".join(item['text'].lower().split()) for item in data['merged']]
+            if len(merged_texts) != len(set(merged_texts)):
+                return False, "Error: Duplicate phrases in 'all' merged list"
             
-            if len(data) == 0:
-                return False, "Error: Empty response from 'all' endpoint"
+            if len(data['results']) == 0:
+                return False, f"Error: No results from 'all' endpoint, source status: {data['sources']}"
             
             # Check each source in the response
             sources_found = []
-            for item in data:
+            for item in data['results']:
                 if not isinstance(item, dict):
                     return False, f"Error: Expected dictionary items in 'all' response, got {type(item)}"
                 
@@ -114,6 +123,8 @@ def test_endpoint(endpoint: str, query: str, expected_source: str) -> Tuple[bool
             
             if missing_sources:
                 print(f"Warning: Missing responses from sources: {missing_sources}")
+                for status in data['sources']:
+                    print(f"  {status['source']}: {status['status']} in {status['elapsed_ms']}ms")
             
             print(f"Success: Received responses from sources: {sources_found}")
             return True, f"Successfully tested 'all' endpoint with query '{query}'"
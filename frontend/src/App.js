@@ -1,9 +1,10 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import "./App.css";
 import axios from "axios";
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
+const TYPEAHEAD_URL = `${BACKEND_URL.replace(/^http/, "ws")}/api/suggestions/typeahead`;
 
 const KeywordSuggestionApp = () => {
   const [query, setQuery] = useState("");
@@ -14,13 +15,10 @@ const KeywordSuggestionApp = () => {
   const [searchHistory, setSearchHistory] = useState([]);
   const [bulkSearchMode, setBulkSearchMode] = useState(false);
   const [bulkProgress, setBulkProgress] = useState({ current: 0, total: 0 });
-  const [bulkStatus, setBulkStatus] = useState({ 
-    currentBatch: 0, 
-    totalBatches: 0, 
-    retryAttempts: 0,
-    successCount: 0,
-    failedCount: 0 
-  });
+  const [bulkStatus, setBulkStatus] = useState({ successCount: 0, failedCount: 0 });
+  const [liveMode, setLiveMode] = useState(false);
+  const typeaheadSocket = useRef(null);
+  const latestQuery = useRef("");
 
   // Load saved keywords and search history from localStorage on component mount
   useEffect(() => {
@@ -45,6 +43,59 @@ const KeywordSuggestionApp = () => {
     localStorage.setItem("searchHistory", JSON.stringify(searchHistory));
   }, [searchHistory]);
 
+  // Live typeahead: one socket per source selection; the server debounces
+  // and only answers for the latest prefix sent
+  useEffect(() => {
+    if (!liveMode) return;
+    
+    const socket = new WebSocket(`${TYPEAHEAD_URL}?sources=${selectedSource}`);
+    socket.onopen = () => {
+      if (latestQuery.current.trim()) {
+        socket.send(JSON.stringify({ q: latestQuery.current }));
+      }
+    };
+    socket.onmessage = (event) => {
+      const message = JSON.parse(event.data);
+      if (message.error) {
+        console.error("Typeahead error:", message.error);
+        return;
+      }
+      // A reply that crossed a newer keystroke in flight
+      if (message.q !== latestQuery.current) return;
+      if (message.merged) {
+        setSuggestions(message.merged.map(phrase => ({
+          text: phrase.text,
+          source: phrase.sources[0],
+          sources: phrase.sources
+        })));
+      } else {
+        setSuggestions(message.suggestions);
+      }
+    };
+    socket.onerror = (error) => console.error("Typeahead connection error:", error);
+    typeaheadSocket.current = socket;
+    
+    return () => {
+      typeaheadSocket.current = null;
+      socket.close();
+    };
+  }, [liveMode, selectedSource]);
+
+  useEffect(() => {
+    latestQuery.current = query;
+    if (!liveMode) return;
+    
+    setBulkSearchMode(false);
+    if (!query.trim()) {
+      setSuggestions([]);
+    }
+    const socket = typeaheadSocket.current;
+    if (socket && socket.readyState === WebSocket.OPEN) {
+      // Blank prefixes are sent too, so the server drops the previous one
+      socket.send(JSON.stringify({ q: query }));
+    }
+  }, [query, liveMode]);
+
   const fetchSuggestions = async () => {
     if (!query.trim()) return;
     
@@ -84,126 +135,84 @@ const KeywordSuggestionApp = () => {
     setBulkSearchMode(true);
     setSuggestions([]);
     
-    // Generate all variations: a-z and 0-9
-    const suffixes = [];
+    // The backend expands the seed with a-z and 0-9 and streams one NDJSON line per sub-query
+    const sourceCount = selectedSource === "all" ? 3 : 1;
+    const total = 36 * sourceCount;
     
-    // Add a-z
-    for (let i = 97; i <= 122; i++) {
-      suffixes.push(String.fromCharCode(i));
-    }
-    
-    // Add 0-9
-    for (let i = 0; i <= 9; i++) {
-      suffixes.push(i.toString());
-    }
+    setBulkProgress({ current: 0, total });
+    setBulkStatus({ successCount: 0, failedCount: 0 });
     
-    // Define batchSize before using it
-    const batchSize = 3; // Reduced batch size to be more respectful to APIs
+    // With merge=true the backend dedupes across lines: each line only carries
+    // phrases not sent before, and the summary line has the ranked merged list
+    let received = [];
+    let merged = null;
+    const originalQueries = new Map();
     
-    setBulkProgress({ current: 0, total: suffixes.length });
-    setBulkStatus({ 
-      currentBatch: 0, 
-      totalBatches: Math.ceil(suffixes.length / batchSize), 
-      retryAttempts: 0,
-      successCount: 0,
-      failedCount: 0 
-    });
-    
-    const allSuggestions = [];
-    const requestDelay = 1000; // 1 second delay between batches
-    const retryDelay = 2000; // 2 seconds delay between retries
-    const maxRetries = 3;
-    
-    // Helper function to make a single request with retry logic
-    const makeRequestWithRetry = async (suffix, retryCount = 0) => {
-      try {
-        const searchQuery = query + suffix;
-        const response = await axios.get(`${API}/suggestions/${selectedSource}`, {
-          params: { q: searchQuery },
-          timeout: 10000 // 10 second timeout
+    const handleLine = (line) => {
+      const result = JSON.parse(line);
+      if (result.done) {
+        merged = result.merged;
+        return;
+      }
+      
+      if (result.status === "ok") {
+        setBulkStatus(prev => ({ ...prev, successCount: prev.successCount + 1 }));
+        result.suggestions.forEach(suggestion => {
+          originalQueries.set(suggestion, result.query);
+          received.push({
+            text: suggestion,
+            source: result.source,
+            originalQuery: result.query
+          });
         });
-        
-        return {
-          query: searchQuery,
-          suggestions: response.data.suggestions || [],
-          source: selectedSource,
-          success: true
-        };
-      } catch (error) {
-        console.warn(`Attempt ${retryCount + 1} failed for ${query}${suffix}:`, error.message);
-        
-        // Update retry status
-        setBulkStatus(prev => ({ ...prev, retryAttempts: prev.retryAttempts + 1 }));
-        
-        if (retryCount < maxRetries) {
-          // Wait before retry
-          await new Promise(resolve => setTimeout(resolve, retryDelay));
-          return makeRequestWithRetry(suffix, retryCount + 1);
-        } else {
-          console.error(`All ${maxRetries + 1} attempts failed for ${query}${suffix}`);
-          return { 
-            query: query + suffix, 
-            suggestions: [], 
-            source: selectedSource, 
-            success: false,
-            error: error.message 
-          };
-        }
+      } else {
+        setBulkStatus(prev => ({ ...prev, failedCount: prev.failedCount + 1 }));
       }
+      
+      setBulkProgress(prev => ({ ...prev, current: prev.current + 1 }));
     };
     
     try {
-      let processedCount = 0;
+      const params = new URLSearchParams({ q: query, source: selectedSource, merge: "true" });
+      const response = await fetch(`${API}/suggestions/bulk?${params}`);
+      if (!response.ok) {
+        throw new Error(`Bulk request failed with status ${response.status}`);
+      }
       
-      for (let i = 0; i < suffixes.length; i += batchSize) {
-        const batch = suffixes.slice(i, i + batchSize);
-        const currentBatchNum = Math.floor(i/batchSize) + 1;
-        
-        setBulkStatus(prev => ({ ...prev, currentBatch: currentBatchNum }));
-        
-        console.log(`Processing batch ${currentBatchNum}/${Math.ceil(suffixes.length/batchSize)}: ${batch.join(', ')}`);
-        
-        // Create batch of requests with retry logic
-        const batchPromises = batch.map(suffix => makeRequestWithRetry(suffix));
-        
-        // Wait for batch to complete
-        const batchResults = await Promise.all(batchPromises);
-        
-        // Process results and add suggestions
-        batchResults.forEach(result => {
-          processedCount++;
-          
-          if (result.success) {
-            setBulkStatus(prev => ({ ...prev, successCount: prev.successCount + 1 }));
-            result.suggestions.forEach(suggestion => {
-              // Avoid duplicates
-              if (!allSuggestions.find(s => s.text === suggestion && s.source === result.source)) {
-                allSuggestions.push({
-                  text: suggestion,
-                  source: result.source,
-                  originalQuery: result.query
-                });
-              }
-            });
-          } else {
-            setBulkStatus(prev => ({ ...prev, failedCount: prev.failedCount + 1 }));
-          }
-          
-          // Update progress
-          setBulkProgress({ current: processedCount, total: suffixes.length });
-        });
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffered = "";
+      
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
         
-        // Update suggestions incrementally for better UX
-        setSuggestions([...allSuggestions]);
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split("\n");
+        buffered = lines.pop();
+        lines.filter(line => line.trim()).forEach(handleLine);
         
-        // Add delay between batches (except for the last batch)
-        if (i + batchSize < suffixes.length) {
-          console.log(`Waiting ${requestDelay}ms before next batch...`);
-          await new Promise(resolve => setTimeout(resolve, requestDelay));
+        // Append only what arrived in this chunk
+        if (received.length > 0) {
+          const chunk = received;
+          received = [];
+          setSuggestions(prev => prev.concat(chunk));
         }
       }
+      if (buffered.trim()) {
+        handleLine(buffered);
+      }
       
-      console.log(`Bulk search completed! Found ${allSuggestions.length} unique suggestions from ${processedCount} requests.`);
+      if (merged) {
+        // Replace the arrival-order list with the ranked one
+        setSuggestions(merged.map(phrase => ({
+          text: phrase.text,
+          source: phrase.sources[0],
+          sources: phrase.sources,
+          originalQuery: originalQueries.get(phrase.text)
+        })));
+        console.log(`Bulk search completed! Found ${merged.length} unique suggestions.`);
+      }
       
       // Add to search history
       const newHistoryItem = {
@@ -223,13 +232,7 @@ const KeywordSuggestionApp = () => {
       setLoading(false);
       setBulkSearchMode(false);
       setBulkProgress({ current: 0, total: 0 });
-      setBulkStatus({ 
-        currentBatch: 0, 
-        totalBatches: 0, 
-        retryAttempts: 0,
-        successCount: 0,
-        failedCount: 0 
-      });
+      setBulkStatus({ successCount: 0, failedCount: 0 });
     }
   };
 
@@ -239,21 +242,15 @@ const KeywordSuggestionApp = () => {
     setLoading(true);
     try {
       const response = await axios.get(`${API}/suggestions/all`, {
-        params: { q: query }
+        params: { q: query, view: "merged" }
       });
       
-      // Combine all suggestions from different sources
-      const allSuggestions = [];
-      response.data.forEach(sourceData => {
-        sourceData.suggestions.forEach(suggestion => {
-          allSuggestions.push({
-            text: suggestion,
-            source: sourceData.source
-          });
-        });
-      });
-      
-      setSuggestions(allSuggestions);
+      // Already deduplicated across sources and ranked by the backend
+      setSuggestions(response.data.merged.map(phrase => ({
+        text: phrase.text,
+        source: phrase.sources[0],
+        sources: phrase.sources
+      })));
       
       // Add to search history
       const newHistoryItem = {
@@ -292,14 +289,16 @@ const KeywordSuggestionApp = () => {
 
   const saveAllSuggestions = () => {
     const newKeywords = [];
+    const seen = new Set(savedKeywords.map(k => `${k.source}|${k.text}`));
     
     suggestions.forEach(suggestion => {
       const text = typeof suggestion === "string" ? suggestion : suggestion.text;
       const source = typeof suggestion === "string" ? selectedSource : suggestion.source;
       
-      // Check if not already saved
-      const exists = savedKeywords.find(k => k.text === text && k.source === source);
-      if (!exists && !newKeywords.find(k => k.text === text && k.source === source)) {
+      // Skip anything already saved or already queued
+      const key = `${source}|${text}`;
+      if (!seen.has(key)) {
+        seen.add(key);
         newKeywords.push({
           id: Date.now() + Math.random() + newKeywords.length,
           text: text,
@@ -403,6 +402,15 @@ const KeywordSuggestionApp = () => {
                   {getSourceIcon(source)} {source.charAt(0).toUpperCase() + source.slice(1)}
                 </button>
               ))}
+              <label className="flex items-center ml-auto text-sm text-gray-700" title="Suggestions update as you type">
+                <input
+                  type="checkbox"
+                  checked={liveMode}
+                  onChange={(e) => setLiveMode(e.target.checked)}
+                  className="mr-2"
+                />
+                ⚡ Live
+              </label>
             </div>
 
             {/* Search Input */}
@@ -424,7 +432,7 @@ const KeywordSuggestionApp = () => {
               </button>
               <button
                 onClick={fetchBulkSuggestions}
-                disabled={loading || !query.trim() || selectedSource === "all"}
+                disabled={loading || !query.trim()}
                 className="px-6 py-3 bg-purple-600 text-white rounded-lg hover:bg-purple-700 disabled:opacity-50 disabled:cursor-not-allowed transition-colors"
                 title="Search with a-z and 0-9 variations"
               >
@@ -437,7 +445,6 @@ const KeywordSuggestionApp = () => {
               <div className="mt-4 p-4 bg-purple-50 rounded-lg">
                 <div className="flex items-center justify-between mb-2">
                   <span className="text-sm text-purple-700">
-                    Batch {bulkStatus.currentBatch}/{bulkStatus.totalBatches} • 
                     Progress: {bulkProgress.current}/{bulkProgress.total}
                   </span>
                   <span className="text-sm text-purple-600">
@@ -453,10 +460,9 @@ const KeywordSuggestionApp = () => {
                 <div className="flex justify-between text-xs text-purple-600">
                   <span>✅ Success: {bulkStatus.successCount}</span>
                   <span>❌ Failed: {bulkStatus.failedCount}</span>
-                  <span>🔄 Retries: {bulkStatus.retryAttempts}</span>
                 </div>
                 <div className="text-xs text-purple-500 mt-1 text-center">
-                  Searching with 1s delay between batches • Up to 3 retry attempts per request
+                  Results stream in as each variation finishes
                 </div>
               </div>
             )}
@@ -496,6 +502,7 @@ const KeywordSuggestionApp = () => {
                   const text = typeof suggestion === "string" ? suggestion : suggestion.text;
                   const source = typeof suggestion === "string" ? selectedSource : suggestion.source;
                   const originalQuery = typeof suggestion === "object" ? suggestion.originalQuery : undefined;
+                  const sources = (typeof suggestion === "object" && suggestion.sources) || [source];
                   
                   return (
                     <div
@@ -503,9 +510,11 @@ const KeywordSuggestionApp = () => {
                       className="flex items-center justify-between p-3 bg-gray-50 rounded-lg hover:bg-gray-100 transition-colors"
                     >
                       <div className="flex items-center space-x-3 flex-1">
-                        <span className={`px-2 py-1 text-xs rounded-full ${getSourceColor(source)}`}>
-                          {getSourceIcon(source)} {source}
-                        </span>
+                        {sources.map(name => (
+                          <span key={name} className={`px-2 py-1 text-xs rounded-full ${getSourceColor(name)}`}>
+                            {getSourceIcon(name)} {name}
+                          </span>
+                        ))}
                         <div className="flex-1">
                           <span className="text-gray-800">{text}</span>
                           {originalQuery && (
@@ -554,6 +563,13 @@ const KeywordSuggestionApp = () => {
                 >
                   Export
                 </button>
+                <a
+                  href={`${API}/export/suggestions?format=csv&gzip=true`}
+                  title="Everything the backend has harvested, streamed as gzipped CSV"
+                  className="inline-block px-3 py-2 bg-indigo-500 text-white text-sm rounded hover:bg-indigo-600 transition-colors"
+                >
+                  Export Harvested
+                </a>
                 <button
                   onClick={clearAllSaved}
                   disabled={savedKeywords.length === 0}
@@ -0,0 +1,208 @@
+"""Offline load test: the backend against local stub upstreams.
+
+Starts loadtest.stubs and `uvicorn server:app` (with the upstream URLs
+pointed at the stubs), drives a weighted mix of single-source, /all and
+bulk traffic over Zipf-distributed seeds, and reports throughput and
+p50/p95/p99 latency per endpoint. Run from the repository root:
+
+    python -m loadtest.run --duration 30 --concurrency 64 \\
+        --mix single=60,all=30,bulk=10 --amazon latency=lognormal:120:0.8,errors=0.02
+
+Backend settings can be overridden with --env, e.g. --env RATE_LIMIT=500
+to keep the per-source rate limiters out of the measurement. The backend
+still needs the MongoDB from backend/.env (or MONGO_URL).
+Pass --backend-url to load an already running backend instead; it must
+have been started with the stub URLs from loadtest.stubs.stub_urls().
+"""
+import os
+import sys
+import time
+import json
+import random
+import asyncio
+import argparse
+import subprocess
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import httpx
+
+from loadtest.stubs import UPSTREAMS, add_profile_arguments, stub_urls
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+BACKEND_DIR = ROOT_DIR / 'backend'
+
+SEED_WORDS = (
+    "python", "camping", "coffee", "yoga", "laptop", "guitar", "garden", "bitcoin", "running",
+    "vegan", "travel", "photo", "chess", "drone", "baking", "fitness", "router", "anime",
+)
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(','):
+        name, weight = part.split('=')
+        if name not in ('single', 'all', 'bulk'):
+            raise ValueError(f"Unknown traffic type: {name}")
+        mix[name] = float(weight)
+    return mix
+
+def make_seeds(count: int) -> List[str]:
+    rng = random.Random(0)
+    seeds = list(SEED_WORDS)
+    while len(seeds) < count:
+        seeds.append(f"{rng.choice(SEED_WORDS)} {rng.choice(SEED_WORDS)}")
+    return seeds[:count]
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def start_process(args: List[str], env: Dict[str, str], cwd: Path) -> subprocess.Popen:
+    return subprocess.Popen(args, cwd=cwd, env={**os.environ, **env})
+
+async def wait_ready(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+async def drive(backend_url: str, duration: float, concurrency: int, mix: Dict[str, float],
+                seeds: List[str], zipf: float, no_cache: bool) -> Tuple[Dict[str, List[float]], Dict[str, int], float]:
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    kinds = list(mix)
+    kind_weights = [mix[kind] for kind in kinds]
+    seed_weights = [1 / (rank + 1) ** zipf for rank in range(len(seeds))]
+    sources = list(UPSTREAMS)
+    extra = {'no_cache': 'true'} if no_cache else {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=backend_url, limits=limits, timeout=60) as client:
+        async def one_request():
+            kind = random.choices(kinds, kind_weights)[0]
+            seed = random.choices(seeds, seed_weights)[0]
+            if kind == 'single':
+                source = random.choice(sources)
+                name, request = f"/suggestions/{source}", client.get(f"/api/suggestions/{source}",
+                                                                     params={'q': seed, **extra})
+            elif kind == 'all':
+                name, request = "/suggestions/all", client.get("/api/suggestions/all", params={'q': seed, **extra})
+            else:
+                name = "/suggestions/bulk"
+                request = client.get("/api/suggestions/bulk",
+                                     params={'q': seed + ' ', 'source': random.choice(sources), **extra})
+            started = time.perf_counter()
+            try:
+                response = await request
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies[name].append(time.perf_counter() - started)
+            else:
+                errors[name] += 1
+
+        async def worker(stop_at: float):
+            while time.monotonic() < stop_at:
+                await one_request()
+
+        started = time.monotonic()
+        await asyncio.gather(*(worker(started + duration) for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+    return latencies, errors, elapsed
+
+def report(latencies: Dict[str, List[float]], errors: Dict[str, int], elapsed: float) -> List[dict]:
+    rows = []
+    for name in sorted(set(latencies) | set(errors)):
+        values = sorted(latencies[name])
+        rows.append({
+            'endpoint': name,
+            'ok': len(values),
+            'errors': errors[name],
+            'rps': round(len(values) / elapsed, 1),
+            'p50_ms': round(percentile(values, 50) * 1000, 1),
+            'p95_ms': round(percentile(values, 95) * 1000, 1),
+            'p99_ms': round(percentile(values, 99) * 1000, 1),
+            'max_ms': round(values[-1] * 1000, 1) if values else 0.0,
+        })
+
+    header = f"{'endpoint':<22}{'ok':>8}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+    print(header)
+    print('-' * len(header))
+    for row in rows:
+        print(f"{row['endpoint']:<22}{row['ok']:>8}{row['errors']:>8}{row['rps']:>9}"
+              f"{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}{row['max_ms']:>9}")
+    total = sum(row['ok'] for row in rows)
+    print(f"\n{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)")
+    return rows
+
+
+async def main(args):
+    processes = []
+    backend_url = args.backend_url
+    try:
+        if backend_url is None:
+            profile_args = [arg for upstream in UPSTREAMS
+                            for arg in (f'--{upstream}', getattr(args, upstream))]
+            processes.append(start_process(
+                [sys.executable, '-m', 'loadtest.stubs', '--port', str(args.stub_port), *profile_args],
+                env={}, cwd=ROOT_DIR,
+            ))
+            processes.append(start_process(
+                [sys.executable, '-m', 'uvicorn', 'server:app', '--port', str(args.backend_port),
+                 '--workers', str(args.workers), '--log-level', 'warning'],
+                env={**stub_urls(args.stub_port), **dict(item.split('=', 1) for item in args.env)},
+                cwd=BACKEND_DIR,
+            ))
+            backend_url = f"http://127.0.0.1:{args.backend_port}"
+            await wait_ready(f"http://127.0.0.1:{args.stub_port}/stats")
+        await wait_ready(f"{backend_url}/api/")
+
+        latencies, errors, elapsed = await drive(
+            backend_url, args.duration, args.concurrency, parse_mix(args.mix),
+            make_seeds(args.seeds), args.zipf, args.no_cache,
+        )
+        rows = report(latencies, errors, elapsed)
+
+        if args.backend_url is None:
+            async with httpx.AsyncClient() as client:
+                stub_stats = (await client.get(f"http://127.0.0.1:{args.stub_port}/stats")).json()
+            print("\nupstream stub calls:", json.dumps(stub_stats))
+        if args.json:
+            Path(args.json).write_text(json.dumps({'config': vars(args), 'results': rows}, indent=2))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duration', type=float, default=30, help="seconds of traffic")
+    parser.add_argument('--concurrency', type=int, default=32, help="concurrent client connections")
+    parser.add_argument('--mix', default='single=60,all=30,bulk=10', help="traffic weights")
+    parser.add_argument('--seeds', type=int, default=200, help="distinct seed queries")
+    parser.add_argument('--zipf', type=float, default=1.1, help="seed popularity skew")
+    parser.add_argument('--no-cache', action='store_true', help="bypass the suggestion cache")
+    parser.add_argument('--workers', type=int, default=1, help="uvicorn workers for the backend")
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help="extra backend environment, repeatable")
+    parser.add_argument('--backend-port', type=int, default=8100)
+    parser.add_argument('--stub-port', type=int, default=9100)
+    parser.add_argument('--backend-url', help="use a running backend instead of starting one")
+    parser.add_argument('--json', help="also write results to this file")
+    add_profile_arguments(parser)
+    asyncio.run(main(parser.parse_args()))
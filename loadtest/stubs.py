@@ -0,0 +1,150 @@
+"""Local stand-ins for the Google, YouTube and Amazon suggest endpoints.
+
+Serves the same paths and response formats as the real upstreams, with
+configurable latency, error rate and periodic 429 bursts per upstream:
+
+    python -m loadtest.stubs --port 9100 --google latency=lognormal:40:0.6,errors=0.01
+
+Point the backend at it with GOOGLE_SUGGEST_URL, YOUTUBE_SUGGEST_URL,
+AMAZON_SUGGEST_URL and the matching *_HEDGE_URL settings (see stub_urls()).
+"""
+import time
+import random
+import asyncio
+import argparse
+from dataclasses import dataclass, field
+from typing import Dict
+
+import orjson
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+UPSTREAMS = ('google', 'youtube', 'amazon')
+
+WORDS = (
+    "tutorial", "for beginners", "course", "download", "review", "price", "near me",
+    "vs", "online", "free", "best", "2024", "book", "app", "jobs", "examples",
+)
+
+
+@dataclass
+class UpstreamProfile:
+    """How one stub upstream behaves.
+
+    latency is "fixed:MS", "uniform:LOW_MS:HIGH_MS" or "lognormal:MEDIAN_MS:SIGMA".
+    Every burst_every seconds the upstream answers 429 for burst_length seconds.
+    """
+    latency: str = "lognormal:40:0.5"
+    errors: float = 0.0
+    burst_every: float = 0.0
+    burst_length: float = 0.0
+    counters: Dict[str, int] = field(default_factory=lambda: {'requests': 0, 'errors': 0, 'throttled': 0})
+
+    def delay(self) -> float:
+        kind, *args = self.latency.split(':')
+        values = [float(arg) for arg in args]
+        if kind == 'fixed':
+            ms = values[0]
+        elif kind == 'uniform':
+            ms = random.uniform(values[0], values[1])
+        elif kind == 'lognormal':
+            ms = random.lognormvariate(0, values[1]) * values[0]
+        else:
+            raise ValueError(f"Unknown latency distribution: {self.latency}")
+        return ms / 1000
+
+    def in_burst(self, started: float) -> bool:
+        if self.burst_every <= 0 or self.burst_length <= 0:
+            return False
+        return (time.monotonic() - started) % self.burst_every < self.burst_length
+
+
+def parse_profile(spec: str) -> UpstreamProfile:
+    """Profile from "latency=lognormal:40:0.5,errors=0.02,burst_every=30,burst_length=3" """
+    profile = UpstreamProfile()
+    for part in filter(None, spec.split(',')):
+        name, value = part.split('=', 1)
+        if name == 'latency':
+            profile.latency = value
+        elif name in ('errors', 'burst_every', 'burst_length'):
+            setattr(profile, name, float(value))
+        else:
+            raise ValueError(f"Unknown profile setting: {name}")
+    profile.delay()  # Validate the distribution up front
+    return profile
+
+def suggestions_for(q: str):
+    # Deterministic per query so cached and uncached answers match
+    rng = random.Random(q)
+    return [f"{q} {word}".strip() for word in rng.sample(WORDS, 10)]
+
+
+def create_app(profiles: Dict[str, UpstreamProfile]) -> Starlette:
+    started = time.monotonic()
+
+    async def respond(upstream: str, body) -> Response:
+        profile = profiles[upstream]
+        profile.counters['requests'] += 1
+        await asyncio.sleep(profile.delay())
+        if profile.in_burst(started):
+            profile.counters['throttled'] += 1
+            return Response(status_code=429)
+        if random.random() < profile.errors:
+            profile.counters['errors'] += 1
+            return Response(status_code=500)
+        return Response(orjson.dumps(body), media_type='text/javascript; charset=UTF-8')
+
+    async def google_suggest(request: Request):
+        q = request.query_params.get('q', '')
+        upstream = 'youtube' if request.query_params.get('ds') == 'yt' else 'google'
+        return await respond(upstream, [q, suggestions_for(q), [], [], {}])
+
+    async def amazon_suggest(request: Request):
+        q = request.query_params.get('prefix', '')
+        return await respond('amazon', {
+            'alias': 'aps',
+            'prefix': q,
+            'suggestions': [{'type': 'KEYWORD', 'value': value} for value in suggestions_for(q)],
+        })
+
+    async def stats(request: Request):
+        return Response(orjson.dumps({name: profile.counters for name, profile in profiles.items()}),
+                        media_type='application/json')
+
+    return Starlette(routes=[
+        Route('/complete/search', google_suggest),
+        Route('/api/2017/suggestions', amazon_suggest),
+        Route('/stats', stats),
+    ])
+
+def stub_urls(port: int, host: str = '127.0.0.1') -> Dict[str, str]:
+    """Backend environment pointing every source at the stubs"""
+    base = f"http://{host}:{port}"
+    return {
+        'GOOGLE_SUGGEST_URL': f"{base}/complete/search",
+        'YOUTUBE_SUGGEST_URL': f"{base}/complete/search",
+        'AMAZON_SUGGEST_URL': f"{base}/api/2017/suggestions",
+        'GOOGLE_HEDGE_URL': f"{base}/complete/search",
+        'YOUTUBE_HEDGE_URL': f"{base}/complete/search",
+        'AMAZON_HEDGE_URL': f"{base}/api/2017/suggestions",
+    }
+
+def add_profile_arguments(parser: argparse.ArgumentParser):
+    for upstream in UPSTREAMS:
+        parser.add_argument(f'--{upstream}', default='', metavar='PROFILE',
+                            help=f"{upstream} stub profile, e.g. latency=lognormal:40:0.5,errors=0.01")
+
+def profiles_from_args(args) -> Dict[str, UpstreamProfile]:
+    return {upstream: parse_profile(getattr(args, upstream)) for upstream in UPSTREAMS}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(profiles_from_args(args)), host=args.host, port=args.port, log_level='warning')
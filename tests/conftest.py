@@ -0,0 +1,72 @@
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# The backend runs as a flat set of modules from its own directory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+
+class Clock:
+    """Stands in for time.monotonic; advance it by adding to now"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class StoredCollection:
+    """MongoDB collection answering find_one by _id from docs"""
+
+    def __init__(self):
+        self.docs = {}
+
+    async def find_one(self, query, projection=None):
+        return self.docs.get(query['_id'])
+
+    async def replace_one(self, query, doc, upsert=False):
+        self.docs[query['_id']] = doc
+
+
+class RecordingCollection:
+    """MongoDB collection recording the writes made to it"""
+
+    def __init__(self):
+        self.batches = []
+        self.replaced = []
+
+    async def bulk_write(self, operations, ordered=True):
+        assert not ordered
+        self.batches.append(operations)
+
+    async def replace_one(self, query, doc, upsert=False):
+        self.replaced.append(doc)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Frozen time.monotonic; don't combine with asyncio sleeps, which use it too"""
+    clock = Clock()
+    monkeypatch.setattr(time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def stored_collection():
+    return StoredCollection()
+
+
+@pytest.fixture
+def recording_collection():
+    return RecordingCollection()
+
+
+@pytest.fixture
+def server(monkeypatch):
+    # Settings come from backend/.env; keep the limiter state in this process
+    monkeypatch.setenv('SHARED_STATE_PATH', '')
+    import server
+    return server
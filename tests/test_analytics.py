@@ -0,0 +1,64 @@
+import asyncio
+
+from analytics import AnalyticsRunner, analyze
+
+TEXTS = ["How to learn Python", "python tutorial", "python  Tutorial", "python tutorial pdf",
+         "what is python", "learn python free", "python jobs"]
+SOURCES = [['google'], ['google', 'amazon'], ['youtube'], ['google'], ['google', 'youtube'], ['youtube'], ['amazon']]
+COUNTS = [1, 2, 1, 1, 3, 1, 1]
+
+
+def test_analyze_suggestions():
+    result = analyze(TEXTS, SOURCES, COUNTS, seed="python", top=3)
+
+    # "python tutorial" and "python  Tutorial" are one phrase
+    assert result['phrases'] == 6
+    assert result['modifiers'][0] == {'modifier': 'tutorial', 'phrases': 2, 'count': 4}
+    assert result['ngrams']['2'][0] == {'ngram': 'python tutorial', 'phrases': 2, 'count': 4}
+    overlap = result['source_overlap']
+    assert overlap['sources'] == ['amazon', 'google', 'youtube']
+    assert overlap['phrases'][1] == [1, 4, 2]
+    assert result['question_words']['counts'] == {'how': 1, 'what': 1}
+    assert result['lengths']['words']['histogram'] == {'2': 2, '3': 3, '4': 1}
+    assert [cluster['token'] for cluster in result['clusters']['top']] == ['tutorial', 'learn']
+
+def test_analyze_empty_dataset():
+    result = analyze([], [], [], seed="python")
+    assert result['phrases'] == 0
+    assert result['ngrams'] == {'1': [], '2': [], '3': []}
+    assert result['clusters']['top'] == []
+
+
+def test_results_are_cached_per_version():
+    loads = []
+
+    async def load():
+        loads.append(1)
+        return TEXTS, SOURCES, COUNTS
+
+    async def run():
+        runner = AnalyticsRunner(pool_threshold=1000)
+        first = await runner.run('seed|python', 'v1', load, seed="python")
+        again = await runner.run('seed|python', 'v1', load, seed="python")
+        changed = await runner.run('seed|python', 'v2', load, seed="python")
+        return first, again, changed, runner
+
+    (first, first_cached), (again, again_cached), (_, changed_cached), runner = asyncio.run(run())
+    assert not first_cached and again_cached and not changed_cached
+    assert again is first
+    assert len(loads) == 2
+    assert runner.counters['thread_runs'] == 2
+
+def test_large_datasets_run_in_worker_processes():
+    async def load():
+        return TEXTS, SOURCES, COUNTS
+
+    async def run():
+        runner = AnalyticsRunner(workers=1, pool_threshold=1)
+        try:
+            return await runner.run('job|1', 'done', load, seed="python")
+        finally:
+            runner.shutdown()
+
+    result, _ = asyncio.run(run())
+    assert result['phrases'] == 6
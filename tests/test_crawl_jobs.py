@@ -0,0 +1,268 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from pymongo import ReplaceOne
+
+from crawl_jobs import CrawlJobManager
+from throttling import CircuitOpen
+
+
+class UpdateResult:
+    def __init__(self, matched: int):
+        self.matched_count = self.modified_count = matched
+
+
+def matches(doc: dict, query: dict) -> bool:
+    for field, condition in query.items():
+        if field == '$or':
+            if not any(matches(doc, option) for option in condition):
+                return False
+            continue
+        value = doc.get(field)
+        if isinstance(condition, dict):
+            if '$in' in condition and value not in condition['$in']:
+                return False
+            if '$lt' in condition and (value is None or not value < condition['$lt']):
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length):
+        return self.docs
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield doc
+
+    def __aiter__(self):
+        return self._iterate()
+
+
+class MemoryCollection:
+    def __init__(self, docs=()):
+        self.docs = {doc['_id']: dict(doc) for doc in docs}
+        # Updates setting one of these statuses raise, as if MongoDB were unreachable
+        self.failing_statuses = set()
+
+    async def create_index(self, keys, **options):
+        pass
+
+    def find(self, query, projection=None):
+        return Cursor([dict(doc) for doc in self.docs.values() if matches(doc, query)])
+
+    async def find_one(self, query):
+        return next((dict(doc) for doc in self.docs.values() if matches(doc, query)), None)
+
+    async def insert_one(self, doc):
+        assert doc['_id'] not in self.docs
+        self.docs[doc['_id']] = dict(doc)
+
+    async def update_one(self, query, update, upsert=False):
+        if update.get('$set', {}).get('status') in self.failing_statuses:
+            raise ConnectionError("connection refused")
+        doc = next((doc for doc in self.docs.values() if matches(doc, query)), None)
+        if doc is None:
+            if not upsert:
+                return UpdateResult(0)
+            doc = self.docs[query['_id']] = {'_id': query['_id'], **update.get('$setOnInsert', {})}
+        doc.update(update.get('$set', {}))
+        for field, amount in update.get('$inc', {}).items():
+            doc[field] = doc.get(field, 0) + amount
+        return UpdateResult(1)
+
+    async def bulk_write(self, operations, ordered=True):
+        for operation in operations:
+            if isinstance(operation, ReplaceOne):
+                self.docs[operation._filter['_id']] = dict(operation._doc)
+            else:
+                await self.update_one(operation._filter, operation._doc, upsert=operation._upsert)
+
+
+def fetcher(calls, gate=None):
+    async def fetch(source, q):
+        calls.append(q)
+        if gate is not None:
+            await gate.wait()
+        return [q + "z"]
+    return fetch
+
+
+def manager(jobs, phrases, fetch, owner='worker-1') -> CrawlJobManager:
+    return CrawlJobManager(jobs, MemoryCollection(), phrases, fetch, owner=owner, lease=60, retry_delay=0)
+
+
+async def submit(crawl: CrawlJobManager, max_queries: int = 100) -> dict:
+    return await crawl.submit("py", ['google'], alphabet="ab", separator=" ", max_depth=1,
+                              max_queries=max_queries, concurrency=2)
+
+
+def orphaned_job(**fields) -> dict:
+    return {
+        '_id': 'job-1', 'seed': "py", 'sources': ['google'], 'alphabet': "ab", 'separator': " ",
+        'max_depth': 1, 'max_queries': 100, 'concurrency': 2, 'status': 'running', 'error': None,
+        'owner': 'worker-0', 'lease_until': datetime.utcnow() - timedelta(seconds=1),
+        'queries_done': 3, 'queries_failed': 0, 'seeds_done': 1, 'frontier_size': 1, 'visited_count': 2,
+        **fields,
+    }
+
+
+def phrase(text: str, depth: int, seq: int, done: bool) -> dict:
+    return CrawlJobManager._phrase_doc('job-1', text, depth, seq, done)
+
+
+def test_crawl_keeps_only_counters_in_the_job_document():
+    jobs, phrases = MemoryCollection(), MemoryCollection()
+    calls = []
+
+    async def run():
+        crawl = manager(jobs, phrases, fetcher(calls))
+        job = await submit(crawl)
+        await crawl.tasks[job['_id']]
+        return jobs.docs[job['_id']]
+
+    job = asyncio.run(run())
+    assert job['status'] == 'completed' and job['owner'] is None
+    assert (job['queries_done'], job['seeds_done'], job['visited_count'], job['frontier_size']) == (12, 4, 4, 0)
+    assert 'frontier' not in job and 'visited' not in job
+    assert sorted(doc['phrase'] for doc in phrases.docs.values()) == ["py", "py az", "py bz", "pyz"]
+    assert all(doc['done'] for doc in phrases.docs.values())
+    assert len(calls) == 12
+
+
+def test_crawl_stops_at_max_queries():
+    jobs, phrases = MemoryCollection(), MemoryCollection()
+    calls = []
+
+    async def run():
+        crawl = manager(jobs, phrases, fetcher(calls))
+        job = await submit(crawl, max_queries=7)
+        await crawl.tasks[job['_id']]
+        return jobs.docs[job['_id']]
+
+    job = asyncio.run(run())
+    # Three queries per seed: the seed and one depth-1 phrase fit, a third seed wouldn't
+    assert len(calls) == 6
+    assert job['status'] == 'completed'
+    assert (job['queries_done'], job['seeds_done'], job['frontier_size']) == (6, 2, 2)
+
+
+def test_unavailable_upstream_is_waited_for_past_max_retries():
+    jobs, phrases = MemoryCollection(), MemoryCollection()
+    rejections = []
+
+    async def fetch(source, q):
+        # Circuit open for longer than max_retries attempts
+        if len(rejections) < 10:
+            rejections.append(q)
+            raise CircuitOpen("circuit open")
+        return [q + "z"]
+
+    async def run():
+        crawl = manager(jobs, phrases, fetch)
+        job = await submit(crawl, max_queries=3)
+        await crawl.tasks[job['_id']]
+        return jobs.docs[job['_id']]
+
+    job = asyncio.run(run())
+    assert (job['queries_done'], job['queries_failed'], job['seeds_done']) == (3, 0, 1)
+
+
+def test_seed_with_failed_queries_is_fetched_again():
+    jobs, phrases = MemoryCollection(), MemoryCollection()
+    calls = []
+
+    async def fetch(source, q):
+        calls.append(q)
+        if q == "py b":
+            raise RuntimeError("malformed response")
+        return [q + "z"]
+
+    async def run():
+        crawl = manager(jobs, phrases, fetch)
+        job = await submit(crawl, max_queries=12)
+        await crawl.tasks[job['_id']]
+        return jobs.docs[job['_id']]
+
+    job = asyncio.run(run())
+    # "py b" failed every retry, so "py" went to the back of the frontier, behind "pyz" and "py az"
+    assert calls.count("py") == 2
+    seed = next(doc for doc in phrases.docs.values() if doc['phrase'] == "py")
+    assert not seed['done']
+    assert job['queries_failed'] == 2 and job['status'] == 'completed'
+
+
+def test_lapsed_lease_is_taken_over_and_resumed_from_queued_phrases():
+    jobs = MemoryCollection([orphaned_job(lease_until=datetime.utcnow() + timedelta(seconds=60))])
+    phrases = MemoryCollection([phrase("py", 0, 0, done=True), phrase("pyz", 1, 1, done=False)])
+    calls = []
+
+    async def run():
+        crawl = manager(jobs, phrases, fetcher(calls))
+        await crawl.resume_all()
+        # Still leased by worker-0
+        assert not crawl.tasks
+        jobs.docs['job-1']['lease_until'] = datetime.utcnow() - timedelta(seconds=1)
+        await crawl.resume_all()
+        await crawl.tasks['job-1']
+
+    asyncio.run(run())
+    job = jobs.docs['job-1']
+    assert calls == ["pyz", "pyz a", "pyz b"]
+    assert job['status'] == 'completed' and job['owner'] is None
+    assert (job['queries_done'], job['seeds_done'], job['frontier_size']) == (6, 2, 0)
+
+
+def test_owner_stops_once_another_worker_takes_the_job():
+    jobs, phrases = MemoryCollection(), MemoryCollection()
+    calls = []
+
+    async def run():
+        gate = asyncio.Event()
+        crawl = manager(jobs, phrases, fetcher(calls, gate))
+        job = await submit(crawl)
+        task = crawl.tasks[job['_id']]
+        await asyncio.sleep(0)
+        jobs.docs[job['_id']]['owner'] = 'worker-2'
+        gate.set()
+        await task
+        return jobs.docs[job['_id']]
+
+    job = asyncio.run(run())
+    assert job['owner'] == 'worker-2' and job['status'] == 'running'
+    assert job['seeds_done'] == 0
+    assert len(calls) == 3
+
+
+def test_cancel_stops_the_job():
+    jobs, phrases = MemoryCollection(), MemoryCollection()
+
+    async def run():
+        crawl = manager(jobs, phrases, fetcher([], asyncio.Event()))
+        job = await submit(crawl)
+        await asyncio.sleep(0)
+        cancelled = await crawl.cancel(job['_id'])
+        return crawl, cancelled
+
+    crawl, job = asyncio.run(run())
+    assert job['status'] == 'cancelled' and job['owner'] is None
+    assert not crawl.tasks
+
+
+def test_unrecorded_completion_leaves_the_job_to_be_resumed():
+    jobs, phrases = MemoryCollection(), MemoryCollection()
+    jobs.failing_statuses.add('completed')
+
+    async def run():
+        crawl = manager(jobs, phrases, fetcher([]))
+        job = await submit(crawl)
+        await crawl.tasks[job['_id']]
+        return jobs.docs[job['_id']]
+
+    job = asyncio.run(run())
+    assert job['status'] == 'running' and job['owner'] == 'worker-1'
@@ -0,0 +1,192 @@
+import asyncio
+import json
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+SUGGESTIONS = {
+    'google': ["Python tutorial", "python list"],
+    'amazon': ["python tutorial", "python book"],
+    'youtube': ["python course"],
+}
+
+
+@pytest.fixture
+def api(server, monkeypatch):
+    """Client for the API without its startup hooks, answering every lookup from SUGGESTIONS"""
+    async def get_suggestions(source, q, bypass_cache=False, crawl=False, abandonable=False):
+        return SUGGESTIONS[source]
+
+    monkeypatch.setattr(server, 'get_suggestions', get_suggestions)
+    return TestClient(server.app)
+
+
+def test_all_lists_either_each_source_or_the_merged_view(api):
+    raw = api.get('/api/suggestions/all', params={'q': "python"}).json()
+    assert [result['suggestions'] for result in raw['results']] == list(SUGGESTIONS.values())
+    assert raw['merged'] == []
+
+    merged = api.get('/api/suggestions/all', params={'q': "python", 'view': 'merged'}).json()
+    assert merged['results'] == []
+    assert [phrase['text'] for phrase in merged['merged']] == [
+        "Python tutorial", "python list", "python book", "python course",
+    ]
+    assert [status['status'] for status in merged['sources']] == ['ok'] * 3
+
+    assert api.get('/api/suggestions/all', params={'q': "python", 'view': 'both'}).status_code == 400
+
+
+def test_batch_lists_either_each_source_or_the_merged_view(api):
+    request = {'queries': ["python"], 'sources': ['google', 'amazon']}
+    raw = api.post('/api/suggestions/batch', json=request).json()
+    assert len(raw['results'][0]['results']) == 2
+    assert raw['results'][0]['merged'] == [] and raw['merged'] == []
+
+    merged = api.post('/api/suggestions/batch', json={**request, 'view': 'merged'}).json()
+    assert merged['results'][0]['results'] == []
+    assert [phrase['text'] for phrase in merged['merged']] == ["Python tutorial", "python list", "python book"]
+    assert merged['results'][0]['merged'][0] == {'text': "Python tutorial", 'sources': ['google', 'amazon'],
+                                                 'count': 2}
+
+
+def test_batch_groups_distinct_queries_in_request_order(api, server, monkeypatch):
+    calls = []
+
+    async def get_suggestions(source, q, bypass_cache=False, crawl=False, abandonable=False):
+        calls.append((source, q))
+        # Finish out of request order
+        await asyncio.sleep(0.02 if source == 'youtube' else 0)
+        return [f"{q} {source}"]
+
+    monkeypatch.setattr(server, 'get_suggestions', get_suggestions)
+    request = {'queries': ["java", " ", "python", "java", " python "], 'sources': ['youtube', 'google', 'youtube']}
+    response = api.post('/api/suggestions/batch', json=request).json()
+    assert sorted(calls) == [('google', "java"), ('google', "python"), ('youtube', "java"), ('youtube', "python")]
+    assert [group['query'] for group in response['results']] == ["java", "python"]
+    for group in response['results']:
+        assert [status['source'] for status in group['sources']] == ['youtube', 'google']
+        assert [result['suggestions'] for result in group['results']] == [
+            [f"{group['query']} youtube"], [f"{group['query']} google"],
+        ]
+    assert (response['total'], response['ok'], response['failed']) == (4, 4, 0)
+
+    blank = api.post('/api/suggestions/batch', json={'queries': ["", "  "]})
+    assert blank.status_code == 400
+
+
+def test_all_reports_sources_past_their_budget_or_the_deadline_as_timeouts(api, server, monkeypatch):
+    delays = {'google': 0, 'amazon': 0.5, 'youtube': 0.5}
+
+    async def get_suggestions(source, q, bypass_cache=False, crawl=False, abandonable=False):
+        await asyncio.sleep(delays[source])
+        return SUGGESTIONS[source]
+
+    monkeypatch.setattr(server, 'get_suggestions', get_suggestions)
+    # amazon runs out of its own budget, youtube out of the request deadline
+    monkeypatch.setitem(server.SOURCE_BUDGETS, 'amazon', 0.05)
+    monkeypatch.setitem(server.SOURCE_BUDGETS, 'youtube', 2)
+    response = api.get('/api/suggestions/all', params={'q': "python", 'deadline': 0.1}).json()
+    statuses = {status['source']: status for status in response['sources']}
+    assert {source: status['status'] for source, status in statuses.items()} == {
+        'google': 'ok', 'amazon': 'timeout', 'youtube': 'timeout',
+    }
+    assert statuses['amazon']['elapsed_ms'] < 100 <= statuses['youtube']['elapsed_ms'] < 400
+    assert [result['source'] for result in response['results']] == ['google']
+
+
+def test_bulk_expands_each_distinct_character_once_then_summarizes(api, server, monkeypatch):
+    queries = []
+
+    async def get_suggestions(source, q, bypass_cache=False, crawl=False, abandonable=False):
+        queries.append(q)
+        if q.endswith("c"):
+            raise RuntimeError("malformed response")
+        return [q + " tutorial", "Python"]
+
+    monkeypatch.setattr(server, 'get_suggestions', get_suggestions)
+    response = api.get('/api/suggestions/bulk', params={'q': "py ", 'alphabet': "abac", 'merge': True})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(queries) == ["py a", "py b", "py c"]
+
+    *results, summary = lines
+    assert sorted(line['query'] for line in results) == ["py a", "py b", "py c"]
+    # With merge, "Python" is only sent on the first line that had it
+    assert sum(line['suggestions'].count("Python") for line in results) == 1
+    assert {key: summary[key] for key in ('done', 'total', 'ok', 'failed')} == {
+        'done': True, 'total': 3, 'ok': 2, 'failed': 1,
+    }
+    assert [phrase['text'] for phrase in summary['merged']][0] == "Python"
+
+
+class StatusCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length):
+        return self.docs
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield doc
+
+    def __aiter__(self):
+        return self._iterate()
+
+
+class StatusCollection:
+    """status_checks answering the keyset page queries"""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    @staticmethod
+    def _after(doc, query):
+        if not query:
+            return True
+        newer, same_time = query['$or']
+        return (doc['timestamp'] < newer['timestamp']['$lt']
+                or doc['timestamp'] == same_time['timestamp'] and doc['id'] < same_time['id']['$lt'])
+
+    def find(self, query, projection, sort, limit=0, batch_size=None):
+        assert sort == [('timestamp', -1), ('id', -1)]
+        docs = sorted((doc for doc in self.docs if self._after(doc, query)),
+                      key=lambda doc: (doc['timestamp'], doc['id']), reverse=True)
+        return StatusCursor(docs[:limit] if limit else docs)
+
+
+@pytest.fixture
+def status_checks(server, monkeypatch):
+    # Three checks share a timestamp, so only the id orders them
+    checks = [
+        {'id': f"check-{index}", 'client_name': "monitor",
+         'timestamp': datetime(2024, 1, 1, 12, 0, min(index, 2))}
+        for index in range(5)
+    ]
+    monkeypatch.setattr(server, 'db', SimpleNamespace(status_checks=StatusCollection(checks)))
+    return checks
+
+
+def test_status_pages_through_identical_timestamps(api, status_checks):
+    ids, cursor = [], None
+    while True:
+        params = {'limit': 2, **({'cursor': cursor} if cursor else {})}
+        response = api.get('/api/status', params=params)
+        ids.extend(check['id'] for check in response.json())
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            break
+    assert ids == ["check-4", "check-3", "check-2", "check-1", "check-0"]
+
+
+def test_status_stream_resumes_after_the_cursor(api, status_checks):
+    cursor = api.get('/api/status', params={'limit': 2}).headers['X-Next-Cursor']
+    response = api.get('/api/status', params={'stream': True, 'cursor': cursor})
+    assert [json.loads(line)['id'] for line in response.text.splitlines()] == ["check-2", "check-1", "check-0"]
+
+
+@pytest.mark.parametrize('cursor', ["not base64!", "bm8tc2VwYXJhdG9y", "eWVzdGVyZGF5fGNoZWNrLTE="])
+def test_status_rejects_an_invalid_cursor(api, status_checks, cursor):
+    response = api.get('/api/status', params={'cursor': cursor})
+    assert response.status_code == 400 and response.json()['detail'] == "Invalid cursor"
@@ -0,0 +1,50 @@
+import io
+import csv
+import gzip
+import json
+import asyncio
+from datetime import datetime
+
+import pyarrow.parquet as pq
+
+from exporters import EXPORT_CHUNK_ROWS, csv_export, gzip_stream, ndjson_export, parquet_export
+
+SEEN = datetime(2024, 5, 1, 12, 30)
+
+
+def documents(count: int):
+    async def generate():
+        for n in range(count):
+            yield {'text': f"phrase {n}", 'count': n, 'sources': ['google', 'amazon'], 'seeds': ['phrase'],
+                   'first_seen': SEEN, 'last_seen': SEEN}
+    return generate()
+
+def collect(chunks) -> bytes:
+    async def run():
+        return [chunk async for chunk in chunks]
+    return b''.join(asyncio.run(run()))
+
+
+def test_csv_export():
+    rows = list(csv.reader(io.StringIO(collect(csv_export(documents(3))).decode())))
+    assert rows[0] == ['text', 'count', 'sources', 'seeds', 'first_seen', 'last_seen']
+    assert rows[2] == ['phrase 1', '1', 'google|amazon', 'phrase', '2024-05-01T12:30:00', '2024-05-01T12:30:00']
+    assert len(rows) == 4
+
+def test_gzipped_ndjson_export():
+    lines = gzip.decompress(collect(gzip_stream(ndjson_export(documents(3))))).decode().splitlines()
+    assert [json.loads(line)['text'] for line in lines] == ["phrase 0", "phrase 1", "phrase 2"]
+
+def test_parquet_export_streams_row_groups():
+    count = EXPORT_CHUNK_ROWS * 2 + 1
+    parquet = pq.ParquetFile(io.BytesIO(collect(parquet_export(documents(count)))))
+    assert parquet.metadata.num_row_groups == 3
+    table = parquet.read()
+    assert table.num_rows == count
+    assert table.column('sources')[0].as_py() == ['google', 'amazon']
+    assert table.column('last_seen')[-1].as_py() == SEEN
+
+def test_empty_exports():
+    assert collect(csv_export(documents(0))).decode().strip() == 'text,count,sources,seeds,first_seen,last_seen'
+    assert collect(ndjson_export(documents(0))) == b''
+    assert pq.ParquetFile(io.BytesIO(collect(parquet_export(documents(0))))).metadata.num_rows == 0
@@ -0,0 +1,72 @@
+import asyncio
+from types import SimpleNamespace
+
+from prefix_index import PrefixIndex
+from write_buffer import BufferedWriter
+
+
+def test_harvest_keeps_the_first_spelling_and_every_seed(server, monkeypatch, recording_collection):
+    phrases = BufferedWriter('harvest', recording_collection)
+    seeds = BufferedWriter('harvest_seeds', recording_collection)
+    monkeypatch.setattr(server, 'prefix_index', PrefixIndex())
+    monkeypatch.setattr(server, 'harvest_writer', phrases)
+    monkeypatch.setattr(server, 'harvest_seeds_writer', seeds)
+    monkeypatch.setattr(server, 'MAX_TRACKED_SEEDS', 2)
+
+    for seed in ["py", "pyt", "pyth"]:
+        server.harvest('google', seed, ["Python", "python", " "])
+
+    async def run():
+        await phrases._flush()
+        await seeds._flush()
+
+    asyncio.run(run())
+    upserts, pairs = recording_collection.batches
+    assert [op._doc['$setOnInsert']['text'] for op in upserts if op._upsert] == ["Python"]
+    # The phrase document stops taking seeds at MAX_TRACKED_SEEDS, harvest_seeds doesn't
+    assert {op._filter['_id'] for op in pairs} == {"py|python", "pyt|python", "pyth|python"}
+    assert server.prefix_index.search("pyt")[0].text == "Python"
+
+
+class HarvestedCollection:
+    """harvested_suggestions whose scan runs a harvest midway, or fails"""
+
+    def __init__(self, docs, during_scan=None):
+        self.docs = docs
+        self.during_scan = during_scan
+
+    async def _scan(self):
+        for doc in self.docs:
+            yield doc
+            if self.during_scan is not None:
+                self.during_scan()
+                self.during_scan = None
+
+    def find(self, query, projection=None, batch_size=None):
+        return self._scan()
+
+
+def test_reload_picks_up_other_workers_and_keeps_harvests_made_meanwhile(server, monkeypatch, recording_collection):
+    monkeypatch.setattr(server, 'harvest_writer', BufferedWriter('harvest', recording_collection))
+    monkeypatch.setattr(server, 'harvest_seeds_writer', BufferedWriter('harvest_seeds', recording_collection))
+    monkeypatch.setattr(server, 'prefix_index', PrefixIndex())
+    monkeypatch.setattr(server, 'prefix_index_loaded', True)
+    server.harvest('google', "py", ["python"])
+
+    # "pytest" was harvested by another worker
+    docs = [{'text': "python", 'count': 1, 'sources': ['google'], 'seeds': ["py"]},
+            {'text': "pytest", 'count': 2, 'sources': ['google'], 'seeds': ["py"]}]
+    collection = HarvestedCollection(docs, lambda: server.harvest('google', "py", ["pypi"]))
+    monkeypatch.setattr(server, 'db', SimpleNamespace(harvested_suggestions=collection))
+    asyncio.run(server.load_prefix_index())
+    # The index is rebuilt from MongoDB, not added to what this worker had
+    assert {stats.text: stats.count for stats in server.prefix_index.search("py")} == {
+        "pytest": 2, "python": 1, "pypi": 1,
+    }
+    assert server.harvested_while_loading is None
+
+    # A failed reload keeps the last complete index
+    loaded = server.prefix_index
+    monkeypatch.setattr(server, 'db', SimpleNamespace(harvested_suggestions=None))
+    asyncio.run(server.load_prefix_index())
+    assert server.prefix_index is loaded
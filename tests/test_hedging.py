@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from hedging import Hedger
+
+
+def attempt(delay: float, result=None, error: Exception = None, log: list = None):
+    async def call():
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            if log is not None:
+                log.append('cancelled')
+            raise
+        if error is not None:
+            raise error
+        return result
+    return call
+
+def hedger(**kwargs) -> Hedger:
+    # Enough budget for one hedge straight away
+    options = {'min_delay': 0.01, 'max_delay': 0.01, 'budget_ratio': 1, **kwargs}
+    return Hedger(**options)
+
+
+def test_fast_primary_is_not_hedged():
+    h = hedger()
+    assert asyncio.run(h.run(attempt(0, 'primary'), attempt(0, 'backup'))) == 'primary'
+    assert h.counters['hedged'] == 0
+
+def test_backup_wins_and_primary_is_cancelled():
+    h = hedger()
+    cancelled = []
+    result = asyncio.run(h.run(attempt(1, 'primary', log=cancelled), attempt(0, 'backup')))
+    assert result == 'backup'
+    assert cancelled == ['cancelled']
+    assert h.counters['hedge_won'] == 1
+
+def test_failed_backup_falls_back_to_primary():
+    h = hedger()
+    assert asyncio.run(h.run(attempt(0.05, 'primary'), attempt(0, error=ValueError()))) == 'primary'
+
+def test_both_failing_raises_primary_error():
+    h = hedger()
+    with pytest.raises(KeyError):
+        asyncio.run(h.run(attempt(0.05, error=KeyError()), attempt(0, error=ValueError())))
+
+def test_budget_caps_extra_requests():
+    h = hedger(budget_ratio=0.25)
+
+    async def run():
+        for _ in range(8):
+            await h.run(attempt(0.02, 'primary'), attempt(0, 'backup'))
+
+    asyncio.run(run())
+    assert h.counters['hedged'] == 2
+    assert h.counters['skipped_budget'] == 6
+
+def test_rate_veto_skips_hedge():
+    h = hedger()
+    assert asyncio.run(h.run(attempt(0.02, 'primary'), attempt(0, 'backup'), lambda: False)) == 'primary'
+    assert h.counters['skipped_rate'] == 1
+
+def test_delay_follows_latency_percentile():
+    h = Hedger(percentile=90, min_delay=0.01, max_delay=5, min_samples=10)
+    assert h.delay() == 5
+    for n in range(1, 101):
+        h.record(n / 100)
+    assert h.delay() == pytest.approx(0.91)
@@ -0,0 +1,39 @@
+import tracemalloc
+from pathlib import Path
+
+import pytest
+
+from parsers import parse_amazon_response, parse_google_response
+
+pytest.importorskip('pytest_benchmark')
+
+PAYLOADS = Path(__file__).parent / 'payloads'
+
+CASES = [
+    ('google_firefox.json', parse_google_response),
+    ('youtube_firefox.json', parse_google_response),
+    ('google_xssi.txt', parse_google_response),
+    ('google_jsonp.txt', parse_google_response),
+    ('amazon.json', parse_amazon_response),
+]
+
+
+def peak_allocation(parser, body: bytes) -> int:
+    """Peak bytes allocated by one parse, after a warm-up call"""
+    parser(body)
+    tracemalloc.start()
+    try:
+        parser(body)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.parametrize('name,parser', CASES, ids=[name for name, _ in CASES])
+def test_parse(benchmark, name, parser):
+    body = (PAYLOADS / name).read_bytes()
+    benchmark.group = 'parse'
+    benchmark.extra_info['payload_bytes'] = len(body)
+    benchmark.extra_info['peak_alloc_bytes'] = peak_allocation(parser, body)
+    suggestions = benchmark(parser, body)
+    assert len(suggestions) == 10
@@ -0,0 +1,53 @@
+from pathlib import Path
+
+import pytest
+
+from parsers import parse_amazon_response, parse_google_response
+
+PAYLOADS = Path(__file__).parent / 'payloads'
+
+FIRST_THREE = ["python tutorial", "python download", "python interview questions"]
+
+
+def load(name: str) -> bytes:
+    return (PAYLOADS / name).read_bytes()
+
+
+@pytest.mark.parametrize('name', ['google_firefox.json', 'google_xssi.txt', 'google_jsonp.txt'])
+def test_google_formats(name):
+    suggestions = parse_google_response(load(name))
+    assert len(suggestions) == 10
+    assert suggestions[:3] == FIRST_THREE
+
+def test_google_accepts_text():
+    assert parse_google_response(load('google_jsonp.txt').decode())[:3] == FIRST_THREE
+
+def test_google_decodes_a_declared_charset():
+    body = load('google_firefox_latin1.json')
+    suggestions = parse_google_response(body, 'ISO-8859-1')
+    assert suggestions[:2] == ["café near me", "café au lait"]
+    assert len(suggestions) == 5
+    with pytest.raises(ValueError):
+        parse_google_response(body)
+    with pytest.raises(ValueError):
+        parse_google_response(body, 'no-such-charset')
+
+def test_youtube_firefox():
+    suggestions = parse_google_response(load('youtube_firefox.json'))
+    assert suggestions[0] == "python tutorial for beginners"
+    assert len(suggestions) == 10
+
+def test_amazon():
+    suggestions = parse_amazon_response(load('amazon.json'))
+    assert suggestions[:2] == ["python programming", "python crash course"]
+    assert len(suggestions) == 10
+
+@pytest.mark.parametrize('body', [b'', b'<html>Too many requests</html>', b'["python", [', b")]}'\n{"])
+def test_google_malformed(body):
+    with pytest.raises(ValueError):
+        parse_google_response(body)
+
+@pytest.mark.parametrize('body', [b'', b'[]', b'{"suggestions": [1]}'])
+def test_amazon_malformed(body):
+    with pytest.raises(ValueError):
+        parse_amazon_response(body)
@@ -0,0 +1,126 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from prefetch import PopularityTracker, Prefetcher, RefreshClaims
+from suggestion_cache import SuggestionCache
+
+
+def stored(age: float) -> dict:
+    return {'suggestions': ['python'], 'created_at': datetime.utcnow() - timedelta(seconds=age)}
+
+
+def test_cache_serves_stale_entries_within_grace(stored_collection):
+    stored_collection.docs.update(fresh=stored(10), grace=stored(150), gone=stored(300))
+    cache = SuggestionCache(stored_collection, ttl=100, grace=100)
+
+    async def run():
+        return [await cache.get(key) for key in ('fresh', 'grace', 'gone', 'missing')]
+
+    fresh, grace, gone, missing = asyncio.run(run())
+    assert fresh.suggestions == ['python'] and not fresh.stale
+    assert grace.stale
+    assert gone is None and missing is None
+    assert cache.counters['grace_hits'] == 1
+
+
+def test_popularity_decays_with_age():
+    tracker = PopularityTracker(half_life=60)
+    tracker.record('google', "Python", count=4, age=60)
+    tracker.record('google', "rust", count=3)
+    tracker.record('amazon', "python ")
+
+    assert tracker.score('google', "python") == pytest.approx(2)
+    assert [pair for pair, _ in tracker.top(2)] == [('google', "rust"), ('google', "python")]
+
+def test_popularity_drops_least_popular_keys():
+    tracker = PopularityTracker(max_keys=10)
+    for n in range(11):
+        tracker.record('google', f"q{n}", count=n + 1)
+    assert len(tracker) == 8
+    assert tracker.score('google', "q0") == 0
+
+
+def prefetcher(tracker, ages, refresh, **kwargs):
+    async def age(source, q):
+        return ages.get((source, q))
+    options = {'ttl': 100, 'margin': 20, 'top': 10, 'expand_top': 1, 'min_score': 2, **kwargs}
+    return Prefetcher(tracker, age, refresh, lambda q: [q + c for c in "ab"], **options)
+
+
+def test_prefetch_refreshes_hot_entries_near_expiry():
+    tracker = PopularityTracker()
+    tracker.record('google', "python", count=5)
+    tracker.record('google', "rust", count=3)
+    tracker.record('google', "cold", count=1)
+    ages = {('google', "python"): 90, ('google', "pythona"): 10, ('google', "rust"): 50}
+    refreshed = []
+
+    async def refresh(source, q):
+        refreshed.append(q)
+
+    assert asyncio.run(prefetcher(tracker, ages, refresh).run_once()) == 2
+    # Hot and nearly expired, or never fetched; "rust" and "pythona" are fresh
+    assert sorted(refreshed) == ["python", "pythonb"]
+
+def test_prefetch_skips_a_failing_source():
+    tracker = PopularityTracker()
+    for q in ("a", "b", "c"):
+        tracker.record('google', q, count=5)
+        tracker.record('amazon', q, count=5)
+    refreshed = []
+
+    async def refresh(source, q):
+        if source == 'google':
+            raise RuntimeError("throttled")
+        refreshed.append(q)
+
+    p = prefetcher(tracker, {}, refresh, expand_top=0, concurrency=1)
+    asyncio.run(p.run_once())
+    assert sorted(refreshed) == ["a", "b", "c"]
+    assert p.counters['failed'] == 1
+
+
+class ClaimCollection:
+    def __init__(self):
+        self.docs = {}
+
+    async def update_one(self, query, update, upsert=False):
+        doc = self.docs.get(query['_id'])
+        if doc is not None and doc['until'] > query['until']['$lte']:
+            raise DuplicateKeyError("duplicate key")
+        self.docs[query['_id']] = dict(update['$set'])
+
+
+def test_workers_sharing_claims_refresh_each_pair_once():
+    claims = RefreshClaims(ClaimCollection(), hold=60)
+    tracker = PopularityTracker()
+    tracker.record('google', "python", count=5)
+    refreshed = []
+
+    async def refresh(source, q):
+        refreshed.append(q)
+
+    async def claim(source, q):
+        return await claims.claim(f"{source}|{q}")
+
+    workers = [prefetcher(tracker, {}, refresh, claim=claim) for _ in range(3)]
+
+    async def run():
+        await asyncio.gather(*(worker.run_once() for worker in workers))
+
+    asyncio.run(run())
+    assert sorted(refreshed) == ["python", "pythona", "pythonb"]
+    assert sum(worker.counters['claimed_elsewhere'] for worker in workers) == 6
+
+def test_lapsed_claim_is_taken_over():
+    collection = ClaimCollection()
+    collection.docs['google|python'] = {'until': datetime.utcnow() - timedelta(seconds=1)}
+    claims = RefreshClaims(collection, hold=60)
+
+    async def run():
+        return [await claims.claim('google|python') for _ in range(2)]
+
+    assert asyncio.run(run()) == [True, False]
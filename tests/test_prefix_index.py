@@ -0,0 +1,66 @@
+from prefix_index import MAX_TRACKED_SEEDS, MAX_TRIE_DEPTH, PrefixIndex
+
+
+def texts(results):
+    return [stats.text for stats in results]
+
+
+def test_repeated_phrase_is_promoted_past_the_top_k():
+    index = PrefixIndex(top_k=2)
+    for text in ("python", "pytest", "pypy"):
+        index.add(text, 'google', "py")
+    assert texts(index.search("py")) == ["python", "pytest"]
+
+    index.add("pypy", 'amazon', "py")
+    index.add("pypy", 'google', "py", count=5)
+    assert texts(index.search("py")) == ["pypy", "python"]
+    assert texts(index.search("pyp")) == ["pypy"]
+    assert index.search("java") == []
+
+
+def test_rebuild_matches_incremental_index():
+    phrases = [("python", 3), ("Python Tutorial", 1), ("pytest", 2), ("rust", 4), ("ruby", 1)]
+    incremental = PrefixIndex(top_k=3)
+    bulk = PrefixIndex(top_k=3)
+    for text, count in phrases:
+        incremental.add_stats(text, ['google'], ["seed"], count)
+        bulk.add_stats(text, ['google'], ["seed"], count, promote=False)
+    bulk.rebuild()
+
+    for prefix in ("", "p", "py", "python", "r"):
+        assert texts(bulk.search(prefix)) == texts(incremental.search(prefix))
+    assert bulk.sorted_phrases == incremental.sorted_phrases
+
+
+def test_merge_adds_up_stats():
+    index = PrefixIndex()
+    index.add("python", 'google', "py")
+    other = PrefixIndex()
+    other.add("Python", 'amazon', "pyth", count=2)
+    other.add("rust", 'google', "ru")
+    index.merge(other)
+
+    stats = index.phrases["python"]
+    assert (stats.count, stats.sources, stats.seeds) == (3, {'google', 'amazon'}, {"py", "pyth"})
+    assert texts(index.search("ru")) == ["rust"]
+
+
+def test_long_prefixes_are_answered_from_the_sorted_list():
+    index = PrefixIndex()
+    index.add("python tutorial", 'google', "python")
+    index.add("python tutor", 'google', "python", count=3)
+    index.add("python typing", 'google', "python", count=9)
+    index.add("python", 'google', "python", count=20)
+
+    prefix = "python tu"
+    assert len(prefix) > MAX_TRIE_DEPTH
+    assert texts(index.search(prefix)) == ["python tutor", "python tutorial"]
+    assert texts(index.search("Python  Tutori")) == ["python tutorial"]
+    assert texts(index.search(prefix, limit=1)) == ["python tutor"]
+
+
+def test_tracked_seeds_are_capped():
+    index = PrefixIndex()
+    for n in range(MAX_TRACKED_SEEDS + 10):
+        index.add("python", 'google', f"seed {n}")
+    assert len(index.phrases["python"].seeds) == MAX_TRACKED_SEEDS
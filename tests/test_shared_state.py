@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from shared_state import SharedStateFile
+from throttling import AdaptiveRateLimiter, CircuitBreaker, RateLimited
+
+pytestmark = pytest.mark.skipif(not SharedStateFile.supported(), reason="needs POSIX record locks")
+
+
+def open_state(path):
+    # Each worker process maps the same file
+    return SharedStateFile(str(path), ['limiter', 'breaker'])
+
+
+def test_rate_limiters_share_one_bucket(tmp_path):
+    path = tmp_path / 'state'
+    limiters = [
+        AdaptiveRateLimiter(rate=0.01, burst=2, min_rate=0.01, max_rate=1, slow_threshold=2, max_wait=0,
+                            shared=open_state(path).slot('limiter'))
+        for _ in range(2)
+    ]
+
+    asyncio.run(limiters[0].acquire())
+    asyncio.run(limiters[1].acquire())
+    with pytest.raises(RateLimited):
+        asyncio.run(limiters[0].acquire())
+
+    limiters[1].on_throttled()
+    assert limiters[0].stats()['rate'] == 0.01
+
+def test_circuit_breakers_share_state(tmp_path):
+    path = tmp_path / 'state'
+    first, second = (CircuitBreaker(failure_threshold=2, reset_timeout=60, shared=open_state(path).slot('breaker'))
+                     for _ in range(2))
+
+    first.record_failure()
+    second.record_failure()
+    assert not first.allow()
+    assert second.stats()['state'] == 'open'
+
+    second.record_success()
+    assert first.allow()
+
+def test_layout_change_resets_file(tmp_path):
+    path = tmp_path / 'state'
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60, shared=open_state(path).slot('breaker'))
+    breaker.record_failure()
+
+    resized = SharedStateFile(str(path), ['limiter', 'breaker', 'other'])
+    assert CircuitBreaker(failure_threshold=1, reset_timeout=60, shared=resized.slot('breaker')).allow()
+
+def test_state_is_reset_when_limits_change(tmp_path):
+    path = tmp_path / 'state'
+
+    def restarted(**limits):
+        options = {'rate': 10, 'burst': 5, 'min_rate': 1, 'max_rate': 20, 'slow_threshold': 2, 'max_wait': 0,
+                   **limits}
+        return AdaptiveRateLimiter(**options, shared=open_state(path).slot('limiter'))
+
+    restarted().on_throttled()
+    # Same limits: the backed-off rate survives a restart
+    assert restarted().stats()['rate'] == 5
+    assert restarted(max_rate=40).stats()['rate'] == 10
+    assert restarted(rate=8, max_rate=40).stats()['rate'] == 8
@@ -0,0 +1,55 @@
+import asyncio
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    group = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return ["python"]
+
+    async def run():
+        results = await asyncio.gather(*(group.do('google|python', fetch) for _ in range(5)))
+        # Finished calls are forgotten, so the next caller starts a new one
+        again = await group.do('google|python', fetch)
+        return results, again
+
+    results, again = asyncio.run(run())
+    assert results == [["python"]] * 5 and again == ["python"]
+    assert len(calls) == 2
+    assert group.counters['calls'] == 2 and group.counters['coalesced'] == 4
+    assert group.stats()['in_flight'] == 0
+
+
+def test_every_caller_gets_the_shared_exception():
+    group = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def run():
+        return await asyncio.gather(*(group.do('google|python', fail) for _ in range(3)), return_exceptions=True)
+
+    errors = asyncio.run(run())
+    assert all(isinstance(error, RuntimeError) for error in errors)
+    assert errors[0] is errors[1] is errors[2]
+    assert group.counters['calls'] == 1 and group.counters['coalesced'] == 2
+
+
+def test_different_keys_are_not_coalesced():
+    group = SingleFlight()
+
+    async def echo(value):
+        await asyncio.sleep(0.01)
+        return value
+
+    async def run():
+        return await asyncio.gather(group.do('a', lambda: echo("a")), group.do('b', lambda: echo("b")))
+
+    assert asyncio.run(run()) == ["a", "b"]
+    assert group.counters == {'calls': 2, 'coalesced': 0, 'abandoned': 0}
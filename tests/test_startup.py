@@ -0,0 +1,40 @@
+import os
+import sys
+import json
+import subprocess
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'backend'
+
+# Seconds to import server; every uvicorn worker pays it on start and restart
+IMPORT_BUDGET = 2.0
+
+# Only needed by specific endpoints and imported there
+HEAVY_MODULES = ('pandas', 'numpy', 'pyarrow', 'boto3')
+
+PROBE = """
+import sys, json, time
+started = time.perf_counter()
+import server
+print(json.dumps({
+    'seconds': time.perf_counter() - started,
+    'heavy': [name for name in sys.argv[1:] if name in sys.modules],
+}))
+"""
+
+
+def test_server_import_is_fast_and_skips_heavy_packages():
+    env = {
+        **os.environ,
+        'MONGO_URL': 'mongodb://127.0.0.1:1',
+        'DB_NAME': 'startup_test',
+        'SHARED_STATE_PATH': '',
+    }
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE, *HEAVY_MODULES],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+
+    assert result['heavy'] == []
+    assert result['seconds'] < IMPORT_BUDGET
@@ -0,0 +1,87 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from suggestion_cache import SuggestionCache
+from write_buffer import BufferedWriter
+
+
+def test_set_queues_the_mongo_write(recording_collection):
+    async def run():
+        collection = recording_collection
+        writer = BufferedWriter('cache', collection, flush_interval=60)
+        cache = SuggestionCache(collection, writer=writer)
+        writer.start()
+        await cache.set('google||python', 'google', "python", ["python tutorial"])
+        await cache.set('google||python', 'google', "python", ["python 3"])
+        queued = writer.pending
+        await writer.close()
+        return cache, collection, queued
+
+    cache, collection, queued = asyncio.run(run())
+    assert queued == 1
+    assert cache.get_local('google||python') == ["python 3"]
+    assert not collection.replaced
+    [[write]] = collection.batches
+    assert write._filter == {'_id': 'google||python'} and write._upsert
+    assert write._doc['$set']['suggestions'] == ["python 3"]
+
+
+def test_least_recently_used_entry_is_evicted(clock, stored_collection):
+    cache = SuggestionCache(stored_collection, max_entries=2)
+    cache.set_local('a', ["a"])
+    cache.set_local('b', ["b"])
+    assert cache.get_local('a') == ["a"]
+    cache.set_local('c', ["c"])
+
+    assert cache.get_local('b') is None
+    assert cache.get_local('a') == ["a"] and cache.get_local('c') == ["c"]
+    assert cache.counters['evictions'] == 1
+
+
+def test_entries_expire_after_the_ttl(clock, stored_collection):
+    cache = SuggestionCache(stored_collection, ttl=100)
+    cache.set_local('a', ["a"])
+    clock.now += 100
+    assert asyncio.run(cache.get('a')).suggestions == ["a"]
+
+    clock.now += 1
+    assert asyncio.run(cache.get('a')) is None
+    assert cache.counters['expirations'] == 1
+    # Still there for when the upstream can't be asked
+    assert asyncio.run(cache.get_stale('a')) == ["a"]
+
+
+def test_promoted_entry_keeps_its_mongo_age(clock, stored_collection):
+    created_at = datetime.utcnow() - timedelta(seconds=80)
+    stored_collection.docs['a'] = {'suggestions': ["a"], 'created_at': created_at}
+    cache = SuggestionCache(stored_collection, ttl=100)
+
+    assert asyncio.run(cache.get('a')).suggestions == ["a"]
+    assert cache.counters['mongo_hits'] == 1
+    clock.now += 15
+    assert cache.get_local('a') == ["a"]
+    # Expires locally when it would have in MongoDB, not a full TTL after promotion
+    clock.now += 10
+    assert cache.get_local('a') is None
+
+
+def test_no_cache_skips_the_lookup_but_stores_the_result(server, monkeypatch, stored_collection):
+    calls = []
+
+    async def call_upstream(source, q):
+        calls.append(q)
+        return [f"{q} {len(calls)}"]
+
+    monkeypatch.setattr(server, 'call_upstream', call_upstream)
+    monkeypatch.setattr(server, 'suggestion_cache', SuggestionCache(stored_collection))
+
+    async def run():
+        return [
+            await server.get_suggestions('google', "python"),
+            await server.get_suggestions('google', "python"),
+            await server.get_suggestions('google', "python", bypass_cache=True),
+            await server.get_suggestions('google', "python"),
+        ]
+
+    assert asyncio.run(run()) == [["python 1"], ["python 1"], ["python 2"], ["python 2"]]
+    assert len(calls) == 2
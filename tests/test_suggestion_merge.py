@@ -0,0 +1,28 @@
+from suggestion_merge import SuggestionMerger
+
+
+def test_normalized_phrases_merge_across_sources():
+    merger = SuggestionMerger()
+    assert merger.add('google', ["Python Tutorial", "python download"]) == ["Python Tutorial", "python download"]
+    assert merger.add('youtube', ["python  tutorial", "ｐｙｔｈｏｎ tutorial", "python for kids"]) == ["python for kids"]
+
+    ranked = merger.ranked()
+    assert ranked[0] == {'text': "Python Tutorial", 'sources': ['google', 'youtube'], 'count': 2}
+    assert [phrase['text'] for phrase in ranked[1:]] == ["python download", "python for kids"]
+
+
+def test_ranked_by_sources_then_count():
+    merger = SuggestionMerger()
+    merger.add('google', ["a", "b"])
+    merger.add('google', ["b", "c"])
+    merger.add('amazon', ["c"])
+
+    assert [phrase['text'] for phrase in merger.ranked()] == ["c", "b", "a"]
+    assert [phrase['text'] for phrase in merger.ranked(limit=1)] == ["c"]
+    assert len(merger) == 3
+
+
+def test_blank_suggestions_are_skipped():
+    merger = SuggestionMerger()
+    assert merger.add('google', ["", "   ", "x"]) == ["x"]
+    assert len(merger) == 1
@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+
+from throttling import AdaptiveRateLimiter, CircuitBreaker, CircuitOpen
+
+
+def limiter(**kwargs) -> AdaptiveRateLimiter:
+    options = {'rate': 10, 'burst': 5, 'min_rate': 1, 'max_rate': 12, 'slow_threshold': 1, 'max_wait': 1,
+               'increase_step': 1, **kwargs}
+    return AdaptiveRateLimiter(**options)
+
+
+def test_rate_rises_additively_and_backs_off_multiplicatively(clock):
+    bucket = limiter()
+    bucket.on_success(0.1)
+    assert bucket.rate == 11
+    bucket.on_success(0.1)
+    bucket.on_success(0.1)
+    assert bucket.rate == 12
+
+    bucket.on_success(2)
+    assert bucket.rate == pytest.approx(10.8)
+    bucket.on_slow()
+    assert bucket.rate == pytest.approx(9.72)
+    assert bucket.counters['slow'] == 2
+
+    bucket.on_throttled()
+    assert bucket.rate == pytest.approx(4.86)
+    assert bucket.tokens == 1
+    for _ in range(5):
+        bucket.on_throttled()
+    assert bucket.rate == 1
+
+
+def test_released_token_is_given_back(clock):
+    bucket = limiter(burst=1)
+
+    async def run():
+        await bucket.acquire()
+        assert not bucket.try_acquire()
+        bucket.release()
+        return bucket.try_acquire()
+
+    assert asyncio.run(run())
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == 'closed' and not breaker.check()
+
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpen):
+        breaker.check()
+    assert breaker.counters == {'opened': 1, 'rejected': 1}
+
+
+def test_half_open_trial_closes_or_reopens_the_circuit(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+
+    # One trial at a time
+    assert breaker.check()
+    assert breaker.state == 'half_open'
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open' and breaker.counters['opened'] == 2
+
+    clock.now += 30
+    assert breaker.check()
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.allow() and breaker.allow()
+
+
+def test_released_trial_lets_the_next_caller_try(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.check()
+    breaker.release_trial()
+    assert breaker.check()
+    assert not breaker.allow()
+
+    # A trial that never reports back is given up after reset_timeout
+    clock.now += 30
+    assert breaker.allow()
+
+
+def test_circuit_opened_before_a_reboot_lets_a_trial_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    # The shared state outlived a reboot, which restarted the monotonic clock
+    clock.now = 5.0
+    breaker.precheck()
+    assert breaker.check()
+    assert not breaker.allow()
+
+
+def test_precheck_rejects_while_open_without_claiming_the_trial(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    with pytest.raises(CircuitOpen):
+        breaker.precheck()
+
+    clock.now += 30
+    breaker.precheck()
+    breaker.precheck()
+    assert breaker.check()
+    with pytest.raises(CircuitOpen):
+        breaker.precheck()
+
+
+def test_open_circuit_fails_fast_with_an_empty_bucket(server, monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    bucket = limiter(rate=1, burst=1, min_rate=1, max_wait=5)
+    assert bucket.try_acquire()
+    monkeypatch.setitem(server.circuit_breakers, 'google', breaker)
+    monkeypatch.setitem(server.rate_limiters, 'google', bucket)
+
+    async def run():
+        started = asyncio.get_running_loop().time()
+        with pytest.raises(CircuitOpen):
+            await server.call_upstream('google', "python")
+        return asyncio.get_running_loop().time() - started
+
+    assert asyncio.run(run()) < 0.1
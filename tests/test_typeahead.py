@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+from throttling import AdaptiveRateLimiter
+from typeahead import TypeaheadSession
+
+
+def session(sent, fetched, delay=0.02, debounce=0.01):
+    async def send(message):
+        sent.append(message)
+
+    async def fetch(source, q):
+        fetched.append((source, q))
+        await asyncio.sleep(delay)
+        return {'source': source, 'suggestions': [f"{q} {source}"], 'status': 'ok'}
+
+    return TypeaheadSession(send, fetch, debounce=debounce, counters={})
+
+
+def test_only_the_latest_prefix_is_fetched():
+    sent, fetched = [], []
+
+    async def run():
+        s = session(sent, fetched)
+        for prefix in ("p", "py", "pyt"):
+            s.update(prefix, ['google'], request_id=len(prefix))
+        await asyncio.sleep(0.1)
+        await s.close()
+        return s
+
+    s = asyncio.run(run())
+    assert fetched == [('google', "pyt")]
+    assert [(message['id'], message['q']) for message in sent] == [(3, "pyt")]
+    assert s.counters['debounced'] == 2
+
+def test_typing_past_cancels_in_flight_fetches():
+    sent, fetched = [], []
+
+    async def run():
+        s = session(sent, fetched, delay=0.1)
+        s.update("py", ['google'])
+        await asyncio.sleep(0.05)
+        s.update("pyt", ['google'])
+        await asyncio.sleep(0.2)
+        await s.close()
+        return s
+
+    s = asyncio.run(run())
+    assert fetched == [('google', "py"), ('google', "pyt")]
+    assert [message['q'] for message in sent] == ["pyt"]
+    assert s.counters['cancelled'] == 1
+
+def test_several_sources_send_a_merged_ranking():
+    sent, fetched = [], []
+
+    async def run():
+        s = session(sent, fetched)
+        s.update("py", ['google', 'amazon'])
+        await asyncio.sleep(0.1)
+        await s.close()
+
+    asyncio.run(run())
+    assert sorted(message['source'] for message in sent) == ['amazon', 'google']
+    assert len(sent[-1]['merged']) == 2
+
+
+def test_abandoned_call_is_cancelled_unless_someone_still_waits():
+    group = SingleFlight()
+    started = []
+
+    async def slow():
+        started.append(1)
+        await asyncio.sleep(0.1)
+        return "done"
+
+    async def run():
+        waiter = asyncio.ensure_future(group.do('a', slow, cancel_abandoned=True))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.sleep(0.01)
+
+        # A caller that needs the result keeps the call going for everyone
+        first = asyncio.ensure_future(group.do('b', slow, cancel_abandoned=True))
+        second = asyncio.ensure_future(group.do('b', slow))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == "done"
+    assert group.counters['abandoned'] == 1
+
+def test_cancelled_wait_returns_its_token():
+    limiter = AdaptiveRateLimiter(rate=10, burst=1, min_rate=1, max_rate=10, slow_threshold=1, max_wait=1)
+
+    async def run():
+        await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return limiter.available()
+
+    # Without the refund the bucket would still be a token in debt
+    assert asyncio.run(run()) > -0.5
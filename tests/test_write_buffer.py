@@ -0,0 +1,88 @@
+import asyncio
+
+from write_buffer import BufferedWriter, merge_updates
+
+
+def test_merge_updates():
+    first = {'$setOnInsert': {'text': "a"}, '$set': {'last_seen': 1}, '$inc': {'count': 1},
+             '$addToSet': {'sources': 'google'}}
+    second = {'$setOnInsert': {'text': "A"}, '$set': {'last_seen': 2}, '$inc': {'count': 1},
+              '$addToSet': {'sources': {'$each': ['google', 'amazon']}}}
+
+    assert merge_updates(first, second) == {
+        '$setOnInsert': {'text': "a"},
+        '$set': {'last_seen': 2},
+        '$inc': {'count': 2},
+        '$addToSet': {'sources': {'$each': ['google', 'amazon']}},
+    }
+    assert first['$inc'] == {'count': 1}
+
+
+def test_pending_upserts_merge_into_one_write(recording_collection):
+    async def run():
+        collection = recording_collection
+        writer = BufferedWriter('test', collection, max_batch=100, flush_interval=60)
+        writer.start()
+        for _ in range(3):
+            writer.upsert('python', {'$inc': {'count': 1}})
+        writer.insert({'event': 1})
+        await writer.close()
+        return collection, writer
+
+    collection, writer = asyncio.run(run())
+    assert len(collection.batches) == 1
+    upsert, insert = collection.batches[0]
+    assert upsert._doc == {'$inc': {'count': 3}}
+    assert insert._doc == {'event': 1}
+    assert writer.counters['merged'] == 2
+    assert writer.counters['written'] == 2
+
+
+def test_conditional_updates_merge_per_condition(recording_collection):
+    async def run():
+        collection = recording_collection
+        writer = BufferedWriter('test', collection, max_batch=100, flush_interval=60)
+        writer.start()
+        capped = {'seeds.1': {'$exists': False}}
+        writer.upsert('python', {'$setOnInsert': {'seeds': ["a"]}})
+        writer.update('python', {'$addToSet': {'seeds': "a"}}, condition=capped)
+        writer.update('python', {'$addToSet': {'seeds': "b"}}, condition=dict(capped))
+        await writer.close()
+        return collection.batches[0]
+
+    upsert, update = asyncio.run(run())
+    assert upsert._upsert and not update._upsert
+    assert update._filter == {'_id': 'python', 'seeds.1': {'$exists': False}}
+    assert update._doc == {'$addToSet': {'seeds': {'$each': ["a", "b"]}}}
+
+
+def test_full_batch_flushes_without_waiting_for_interval(recording_collection):
+    async def run():
+        collection = recording_collection
+        writer = BufferedWriter('test', collection, max_batch=2, flush_interval=60)
+        writer.start()
+        writer.insert({'n': 1})
+        writer.insert({'n': 2})
+        await asyncio.sleep(0.01)
+        flushed = len(collection.batches)
+        await writer.close()
+        return flushed
+
+    assert asyncio.run(run()) == 1
+
+
+def test_writes_drop_when_full_and_producers_wait_for_space(recording_collection):
+    async def run():
+        collection = recording_collection
+        writer = BufferedWriter('test', collection, max_batch=10, flush_interval=0.01, max_pending=2)
+        assert writer.insert({'n': 1}) and writer.insert({'n': 2})
+        assert not writer.insert({'n': 3})
+        writer.start()
+        await asyncio.wait_for(writer.wait_for_space(), timeout=1)
+        await writer.close()
+        assert not writer.insert({'n': 4})
+        return writer
+
+    writer = asyncio.run(run())
+    assert writer.counters['dropped'] == 2
+    assert writer.counters['written'] == 2